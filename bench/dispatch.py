@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Micro-Benchmark: Kosten einer Dispatch-Runde des Interpreters je Opcode.
+
+Fuer jeden Opcode wird ein Instruktionsstrom aus --count Kopien dieser
+einen Instruktion (und einem EOF) gebaut und mit Interpreter._execute
+ausgefuehrt. Stack, Frames und Rueckgabeadressen werden vorher so
+gefuellt, dass jede Kopie genau einmal laeuft: Spruenge zeigen auf die
+naechste Instruktion, RET findet seine Adresse schon vor. Gemessen wird
+also nur der Opcode selbst und sein Dispatch, ohne Hilfsinstruktionen.
+
+    python bench/dispatch.py -o dispatch.json
+    python bench/dispatch.py --baseline dispatch.json
+
+Mit --baseline wird die Differenz zu einer frueheren Messung angezeigt.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code.interpreter import Interpreter
+from code.opcodes import opmap, opname, hasjump, EOF
+
+SLOTS = 4
+
+def _setup(name, count):
+    """
+    Liefert (code, stack, frames, addresses) fuer ``count`` Kopien von
+    ``name`` oder None, falls sich der Opcode nicht wiederholen laesst.
+    """
+    op = opmap[name]
+    stack = []
+    frames = [[], [0] * SLOTS] # der modul-frame fuer LOAD_GLOBAL
+    addresses = []
+    args = {"LOAD_CONST" : 1, "LOAD_FAST" : 0, "STORE_FAST" : 0,
+            "DUP_STORE_FAST" : 0, "LOAD_GLOBAL" : 0, "PUSH_FRAME" : SLOTS,
+            "LOAD_LOAD" : (0, 1), "INC_LOCAL" : (0, 1)}
+    pops = {"STORE_FAST" : 1, "ADD" : 2, "SUB" : 2, "MUL" : 2, "DIV" : 2,
+            "LT" : 2, "GT" : 2, "EQ" : 2, "CJUMP" : 1, "PRINT" : 1,
+            "DUP_STORE_FAST" : 0}
+    if name == "EOF" or name.startswith("MEMO_"):
+        return None # beendet den lauf bzw. braucht memo-tabellen
+    if op in hasjump:
+        code = [(op, i + 1) for i in range(count)]
+    else:
+        code = [(op, args.get(name))] * count
+    code.append((EOF, None))
+    if name.startswith("JUMP_IF"):
+        stack = [1] * (2 * count + 1)
+    elif name == "POP_FRAME":
+        frames.extend([0] * SLOTS for _ in range(count))
+    elif name == "RET":
+        addresses = range(count, 0, -1)
+    elif name in pops or name.endswith("_INT"):
+        stack = [1] * (pops.get(name, 2) * count + 1)
+    return code, stack, frames, addresses
+
+def measure(name, count, repeat):
+    """
+    Liefert die Kosten einer Ausfuehrung von ``name`` in Nanosekunden
+    (Minimum aus ``repeat`` Laeufen).
+    """
+    interpreter = Interpreter([], decoded=True)
+    best = None
+    for _ in range(repeat):
+        setup = _setup(name, count)
+        if setup is None:
+            return None
+        code, stack, frames, addresses = setup
+        frame = [0] * SLOTS
+        start = time.time()
+        interpreter._execute(code, addresses, 0, stack, frame, frames)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return 1e9 * best / count
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Per-opcode dispatch "
+                                                 "micro-benchmark.")
+    parser.add_argument("names", nargs="*", metavar="OPCODE")
+    parser.add_argument("-c", "--count", type=int, default=200000)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare with the results in FILE")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    names = args.names or [opname[op] for op in sorted(opname)]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w") # PRINT
+    try:
+        for name in names:
+            if not name in opmap:
+                sys.exit("Unknown opcode: %s" % name)
+            ns = measure(name, args.count, args.repeat)
+            if ns is not None:
+                results[name] = ns
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print "%-16s %10s %10s %8s" % ("opcode", "ns/op", "baseline", "change")
+    for name in names:
+        if not name in results:
+            continue
+        row = "%-16s %10.1f" % (name, results[name])
+        old = baseline.get(name)
+        if old:
+            row += " %10.1f %+7.0f%%" % (old, (results[name] / old - 1) * 100)
+        print row
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
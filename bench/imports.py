@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark: Skripte, die dieselben Hilfsfunktionen benutzen, einmal
+hineinkopiert und einmal per import aus einer Bibliothek.
+
+Die Bibliothek besteht aus den Funktionen eines generierten Programms
+(siehe bench/parse.py), jedes Skript ruft einige davon auf. Gemessen
+wird die Uebersetzung eines Skripts
+
+    copied      die Funktionen stehen im Skript, Compiler.compile()
+    cold        import, die Bibliothek wird dabei uebersetzt
+    imported    import, die Bibliothek kommt aus der .payo-Datei; so
+                uebersetzt jedes weitere Skript, das sie importiert
+
+Vorher wird geprueft, dass beide Fassungen dieselben Ergebnisse liefern.
+
+    python bench/imports.py
+    python bench/imports.py --lines 2000 --parser dparser
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code import symbol
+from code.compiler import Compiler
+from code.interpreter import Interpreter
+from code.linker import Loader, object_path
+from cStringIO import StringIO
+from parse import generate
+
+SCRIPT = "\n".join(["x = 0",
+                    "x = x + f0(3, 4)",
+                    "x = x + f%(last)d(5, 6)",
+                    "print x"]) + "\n"
+
+def library(lines):
+    """
+    Die Funktionen aus generate(lines), ohne den Code dazwischen.
+    """
+    out = []
+    keep = False
+    for line in generate(lines).splitlines(True):
+        if line.startswith("def "):
+            keep = True
+        if keep:
+            out.append(line)
+        if line.strip() == "end" and not line.startswith(" "):
+            keep = False
+    return "".join(out)
+
+def compile_script(source, path=None):
+    module = symbol.parse(source)
+    if path is not None:
+        module.loader = Loader([path])
+    return Compiler(module).compile()
+
+def output(code):
+    stdout = sys.stdout
+    sys.stdout = out = StringIO()
+    try:
+        Interpreter(code).run()
+    finally:
+        sys.stdout = stdout
+    return out.getvalue()
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Compare copied helper "
+                                                 "functions with an "
+                                                 "imported library.")
+    parser.add_argument("--parser", choices=symbol.PARSERS, default="fast")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    symbol.use_parser(args.parser)
+    symbol.warm_up()
+    functions = library(args.lines)
+    script = SCRIPT % dict(last=functions.count("\ndef "))
+    tmp = tempfile.mkdtemp()
+    try:
+        lib = os.path.join(tmp, "helpers.pay")
+        with open(lib, "w") as f:
+            f.write(functions)
+        copied = functions + script
+        imported = "import helpers\n" + script
+        if output(compile_script(copied)) != \
+           output(compile_script(imported, tmp)):
+            sys.exit("the imported library computed different results")
+
+        copied_time = best_of(args.repeat, compile_script, copied)
+        cold = []
+        for _ in range(args.repeat):
+            os.remove(object_path(lib))
+            cold.append(best_of(1, compile_script, imported, tmp))
+        imported_time = best_of(args.repeat, compile_script, imported, tmp)
+        size = os.path.getsize(object_path(lib))
+    finally:
+        shutil.rmtree(tmp)
+
+    print "parser             %s" % (args.parser)
+    print "library            %d lines, %d functions" % (
+        functions.count("\n"), functions.count("def "))
+    print "object file        %d bytes" % (size)
+    print "copied             %.3fs" % (copied_time)
+    print "cold               %.3fs" % (min(cold))
+    print "imported           %.3fs (%.1fx)" % (
+        imported_time, copied_time / imported_time)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark: Uebersetzen eines grossen generierten Programms (siehe
+bench/parse.py), nachdem sich eine Funktion geaendert hat.
+
+Gemessen werden
+    full         Compiler.compile(), also Parsen, Aufloesen und
+                 Uebersetzen des ganzen Programms
+    cold         IncrementalCompiler mit leerem Cache
+    incremental  IncrementalCompiler mit dem Cache der vorigen Fassung,
+                 einschliesslich Laden und Schreiben der .payb-Datei
+
+Jeder Lauf aendert eine andere Funktion, es gibt also immer genau einen
+Fehltreffer. Vorher wird geprueft, dass alle drei Wege dasselbe
+CodeObject liefern.
+
+    python bench/incremental.py
+    python bench/incremental.py --lines 2000 --parser dparser
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code import symbol
+from code.compiler import Compiler
+from code.incremental import BlockCache, IncrementalCompiler
+from parse import generate
+
+def edit(source, n):
+    """
+    ``source`` mit geaendertem Rumpf der n-ten Funktion.
+    """
+    head, sep, tail = source.partition("def f%d(" % (n))
+    return head + sep + tail.replace("- 7", "- %d" % (n + 8), 1)
+
+def same(a, b):
+    return (a.instructions() == b.instructions() and
+            a.functions == b.functions and a.globals == b.globals)
+
+def full(source):
+    return Compiler(symbol.parse(source)).compile()
+
+def incremental(source, path):
+    compiler = IncrementalCompiler(BlockCache.load(path))
+    code = compiler.compile(source)
+    compiler.cache.save(path)
+    return code, compiler
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Measure recompiling a "
+                                                 "large script after an "
+                                                 "edit.")
+    parser.add_argument("--parser", choices=symbol.PARSERS, default="fast")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    symbol.use_parser(args.parser)
+    symbol.warm_up()
+    source = generate(args.lines)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "bench.payb")
+    try:
+        start = time.time()
+        code, _ = incremental(source, path)
+        cold = time.time() - start
+        if not same(code, full(source)):
+            sys.exit("the incremental compiler built different code")
+
+        full_times = []
+        times = []
+        for n in range(args.repeat):
+            source = edit(source, n)
+            start = time.time()
+            expected = full(source)
+            full_times.append(time.time() - start)
+            start = time.time()
+            code, compiler = incremental(source, path)
+            times.append(time.time() - start)
+            if not same(code, expected) or compiler.compiled != 1:
+                sys.exit("edit %d: wrong code or functions reused" % (n))
+        size = os.path.getsize(path)
+    finally:
+        shutil.rmtree(tmp)
+
+    print "parser             %s" % (args.parser)
+    print "source             %d lines, %d segments" % (
+        source.count("\n"), compiler.reused + compiler.compiled)
+    print "cache              %d bytes" % (size)
+    print "full               %.3fs" % (min(full_times))
+    print "cold               %.3fs" % (cold)
+    print "incremental        %.3fs (%.1fx)" % (
+        min(times), min(full_times) / min(times))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark: Speicherbedarf des AST eines grossen generierten Programms
+(siehe bench/parse.py).
+
+Gemessen wird der Zuwachs des residenten Speichers (/proc/self/statm)
+durch parse() und resolve(), solange das Modul noch referenziert ist,
+also einschliesslich allem, was die Knoten am Leben halten. Dazu kommt
+die Summe von sys.getsizeof ueber alle Knoten und ihre Attribute.
+
+    python bench/memory.py --lines 20000
+    python bench/memory.py --parser dparser --lines 1000
+"""
+
+import argparse
+import gc
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code import symbol
+from code.nodes import Statement
+from parse import generate
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def resident():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+def attributes(obj):
+    """
+    Die Attributwerte eines Knotens, mit oder ohne __slots__.
+    """
+    if hasattr(obj, "__dict__"):
+        return obj.__dict__.values()
+    values = []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                values.append(getattr(obj, name))
+    return values
+
+def deep_size(nodes):
+    """
+    Liefert (Anzahl Knoten, Bytes) fuer die Knoten ``nodes`` samt ihrer
+    Attribute; Objekte, die sich mehrere Knoten teilen, zaehlen einmal.
+    """
+    seen = set()
+    todo = list(nodes)
+    count = size = 0
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, Statement):
+            count += 1
+            if hasattr(obj, "__dict__"):
+                size += sys.getsizeof(obj.__dict__)
+            todo.extend(attributes(obj))
+        elif isinstance(obj, (list, tuple)):
+            todo.extend(obj)
+    return count, size
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Measure the memory used "
+                                                 "by the AST.")
+    parser.add_argument("--parser", choices=symbol.PARSERS, default="fast")
+    parser.add_argument("--lines", type=int, default=20000)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    symbol.use_parser(args.parser)
+    symbol.warm_up()
+    source = generate(args.lines)
+    gc.collect()
+    before = resident()
+    module = symbol.parse(source)
+    for node in module.ast:
+        node.resolve(module)
+    gc.collect()
+    used = resident() - before
+    count, size = deep_size(module.ast)
+
+    print "parser             %s" % (args.parser)
+    print "source             %d lines, %d bytes" % (source.count("\n"),
+                                                     len(source))
+    print "nodes              %d" % (count)
+    print "getsizeof          %d bytes (%.1f per node)" % (
+        size, float(size) / count)
+    print "resident           %d bytes (%.1fx source)" % (
+        used, float(used) / len(source))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark: ein Skript, das --lines Zahlen ausgibt, mit verschiedenen
+Flush-Policies der OutputSink (siehe code/output.py).
+
+Gemessen wird Interpreter.run mit der Ausgabe in
+
+    file    eine ungepufferte Datei, wie stdout mit python -u oder
+            PYTHONUNBUFFERED; jedes write() ist ein Systemaufruf
+    memory  eine MemorySink
+
+jeweils mit "line" (ein write() je Zeile, wie vorher print) und "full"
+(--buffer Bytes je write()). Vorher wird geprueft, dass alle Varianten
+dieselbe Ausgabe erzeugen.
+
+    python bench/output.py
+    python bench/output.py --lines 100000 --buffer 4096
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code import symbol
+from code.compiler import Compiler
+from code.interpreter import Interpreter
+from code.output import MemorySink, OutputSink, DEFAULT_BUFFER_SIZE
+
+SCRIPT = """
+i = 0
+while i < %d:
+    print i
+    i = i + 1
+end
+"""
+
+def run(code, output):
+    start = time.time()
+    Interpreter(code, output=output).run()
+    return time.time() - start
+
+def to_file(code, path, policy, buffer_size):
+    with open(path, "wb", 0) as f:
+        elapsed = run(code, OutputSink(f, buffer_size, policy))
+    with open(path, "rb") as f:
+        return elapsed, f.read()
+
+def to_memory(code, policy, buffer_size):
+    sink = MemorySink(buffer_size, policy)
+    return run(code, sink), sink.getvalue()
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Measure buffered print "
+                                                 "output.")
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--buffer", type=int, default=DEFAULT_BUFFER_SIZE)
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    code = Compiler(symbol.parse(SCRIPT % (args.lines))).compile()
+    expected = "".join("%d\n" % (i) for i in xrange(args.lines))
+    tmp = tempfile.mkdtemp()
+    results = {}
+    try:
+        path = os.path.join(tmp, "out.txt")
+        for policy in ("line", "full"):
+            for target in ("file", "memory"):
+                times = []
+                for _ in range(args.repeat):
+                    if target == "file":
+                        elapsed, text = to_file(code, path, policy,
+                                                args.buffer)
+                    else:
+                        elapsed, text = to_memory(code, policy, args.buffer)
+                    if text != expected:
+                        sys.exit("%s/%s: wrong output" % (target, policy))
+                    times.append(elapsed)
+                results[target, policy] = min(times)
+    finally:
+        shutil.rmtree(tmp)
+
+    print "lines              %d" % (args.lines)
+    print "buffer             %d bytes" % (args.buffer)
+    for target in ("file", "memory"):
+        line = results[target, "line"]
+        full = results[target, "full"]
+        print "%-8s line      %.3fs" % (target, line)
+        print "%-8s full      %.3fs (%.1fx)" % (target, full, line / full)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
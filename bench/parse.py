@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark: dparser und der handgeschriebene Parser (code/fastparser.py)
+nebeneinander.
+
+Gemessen werden
+
+    startup     ein frischer Python-Prozess, der den Parser anlegt und ein
+                einzeiliges Programm parst; fuer dparser einmal mit den
+                vorhandenen Tabellen und einmal mit leerem
+                Tabellen-Verzeichnis (cold)
+    throughput  parse() auf generierten Programmen mit --lines Zeilen
+                (Minimum aus --repeat Laeufen)
+
+Da Anweisungen nicht getrennt werden muessen, verfolgt dparser viele
+moegliche Zerlegungen gleichzeitig, seine Laufzeit waechst deshalb
+deutlich schneller als die Laenge des Programms. Die Defaults fuer
+--lines sind entsprechend klein gehalten.
+
+Vor der Messung wird geprueft, dass beide Parser fuer jedes Programm
+denselben AST liefern, einschliesslich der Positionen.
+
+    python bench/parse.py
+    python bench/parse.py --lines 100 1000 -n 5
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from code import symbol
+from code.fastparser import FastParser
+from code.nodes import Statement
+
+STARTUP = ("from code import symbol\n"
+           "symbol.use_parser(%r)\n"
+           "symbol.parse('x = 1\\n')\n")
+
+def generate(lines):
+    """
+    Ein Programm mit etwa ``lines`` Zeilen aus Funktionen mit Schleifen,
+    Verzweigungen, Aufrufen und Kommentaren.
+    """
+    out = ["// generiert von bench/parse.py", "total = 0"]
+    i = 0
+    while len(out) < lines:
+        out.extend(["def f%d(a, b):" % i,
+                    "    c = a * 2 + b / 3 - (a - b)",
+                    "    while c > 0:",
+                    "        c = c - 1 /* zaehler */",
+                    "        if c == a:",
+                    "            b = b + c * a - 7",
+                    "        end",
+                    "    end",
+                    "    return c + b",
+                    "end",
+                    "total = total + f%d(%d, total - %d)" % (i, i, i),
+                    "print total == %d" % (i)])
+        i += 1
+    return "\n".join(out) + "\n"
+
+def dump(node):
+    """
+    Vergleichbare Form eines AST: Knotentyp und Attribute samt Position.
+    """
+    if isinstance(node, list):
+        return [dump(n) for n in node]
+    if not isinstance(node, Statement):
+        return node
+    fields = []
+    for name in type(node).__slots__:
+        if name in ("table", "pure", "local", "function"):
+            continue # erst nach resolve() gesetzt
+        fields.append((name, dump(getattr(node, name))))
+    return (type(node).__name__, fields)
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def startup(name, repeat, env=None):
+    """
+    Laufzeit eines frischen Prozesses, der mit ``name`` parst.
+    """
+    command = [sys.executable, "-c", STARTUP % (name)]
+    def run():
+        subprocess.check_call(command, cwd=ROOT, env=env)
+    return best_of(repeat, run)
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Compare dparser with the "
+                                                 "hand-written parser.")
+    parser.add_argument("--lines", type=int, nargs="+",
+                        default=[250, 500, 1000],
+                        help="sizes of the generated programs")
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    dparser = symbol.make_parser()
+    fast = FastParser(symbol.KEYWORDS)
+
+    cold_dir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, PAYNE_PARSER_DIR=cold_dir)
+        cold = startup("dparser", 1, env)
+    finally:
+        shutil.rmtree(cold_dir)
+    print "%-24s %10s" % ("startup", "seconds")
+    print "%-24s %10.3f" % ("dparser (cold tables)", cold)
+    print "%-24s %10.3f" % ("dparser", startup("dparser", args.repeat))
+    print "%-24s %10.3f" % ("fast", startup("fast", args.repeat))
+    print ""
+
+    print "%-8s %10s %10s %10s %12s %8s" % ("lines", "bytes", "dparser",
+                                            "fast", "fast lines/s",
+                                            "speedup")
+    for lines in args.lines:
+        source = generate(lines)
+        count = source.count("\n")
+        if dump(symbol.parse(source, dparser).ast) != \
+           dump(symbol.parse(source, fast).ast):
+            sys.exit("%d lines: the parsers built different ASTs" % (count))
+        slow = best_of(args.repeat, symbol.parse, source, dparser)
+        quick = best_of(args.repeat, symbol.parse, source, fast)
+        print "%-8d %10d %9.3fs %9.3fs %12.0f %7.1fx" % (
+            count, len(source), slow, quick, count / quick, slow / quick)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark-Suite fuer Payne.
+
+Jede Workload wird getrennt nach Phasen gemessen:
+
+    parse      code.symbol.parse
+    resolve    Compiler.resolve
+    compile    Compiler.generate (Codeerzeugung inkl. Optimierungen)
+    assemble   Compiler.assemble (Buffer -> CodeObject)
+    decode     CodeObject -> Instruktionsstrom des Interpreters
+    execute    Interpreter.run
+
+Die Workloads sind die .pay-Dateien in bench/workloads sowie einige
+generierte Programme (siehe GENERATED), deren Groesse sich mit --scale
+veraendern laesst. Pro Phase zaehlt das Minimum aus --repeat Laeufen.
+
+Beispiele:
+
+    python bench/run.py -o results.json
+    python bench/run.py --save-baseline
+    python bench/run.py --threshold 0.05 fib nested_while
+
+Mit --baseline (Default: bench/baseline.json) werden die Ergebnisse
+verglichen; ist eine Phase um mehr als --threshold langsamer geworden
+oder fehlt die Datei, endet das Skript mit Exit-Code 1. Die
+mitgelieferte bench/baseline.json ist auf einer einzelnen Maschine
+aufgenommen; auf anderer Hardware zuerst --save-baseline aufrufen.
+
+Mit --backend register laufen die Phasen auf RegisterCompiler und
+RegisterVM (decode ist dort nur das Anlegen der Maschine).
+--compare-backends fuehrt jede Workload auf beiden Maschinen aus,
+vergleicht die Ausgaben und zeigt Anzahl der erzeugten und ausgefuehrten
+Instruktionen sowie die Laufzeit der Phase execute nebeneinander.
+"""
+
+from cStringIO import StringIO
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from code.symbol import parse
+from code.compiler import Compiler
+from code.interpreter import Interpreter
+from code.regcompiler import RegisterCompiler
+from code.regvm import RegisterVM
+
+PHASES = ("parse", "resolve", "compile", "assemble", "decode", "execute")
+BACKENDS = {"stack" : (Compiler, Interpreter),
+            "register" : (RegisterCompiler, RegisterVM)}
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+def many_functions(count=100):
+    """
+    Viele kleine Funktionen, die sich gegenseitig aufrufen.
+    """
+    lines = ["def f0(a):", "    return a + 1", "end"]
+    for i in range(1, count):
+        lines.extend(["def f%d(a):" % i,
+                      "    b = f%d(a) * 2" % (i - 1),
+                      "    return b - a",
+                      "end"])
+    lines.append("print f%d(1)" % (count - 1))
+    return "\n".join(lines) + "\n"
+
+def straight_line(count=150):
+    """
+    Eine lange Folge von Zuweisungen ohne Sprünge.
+    """
+    lines = ["x0 = 1"]
+    for i in range(1, count):
+        lines.append("x%d = x%d + %d * 2" % (i, i - 1, i))
+    lines.append("print x%d" % (count - 1))
+    return "\n".join(lines) + "\n"
+
+def deep_recursion(depth=20000):
+    """
+    Rekursion, die nicht endrekursiv ist und den Call-Stack wachsen laesst.
+    """
+    return ("def down(n):\n"
+            "    if n == 0:\n"
+            "        return 0\n"
+            "    end\n"
+            "    return 1 + down(n - 1)\n"
+            "end\n"
+            "print down(%d)\n" % depth)
+
+GENERATED = {"many_functions" : many_functions,
+             "straight_line" : straight_line,
+             "deep_recursion" : deep_recursion}
+
+def workloads(scale=1.0):
+    result = {}
+    for fname in glob.glob(os.path.join(BENCH_DIR, "workloads", "*.pay")):
+        name = os.path.splitext(os.path.basename(fname))[0]
+        with open(fname, "rb") as f:
+            result[name] = f.read()
+    for name, generate in GENERATED.items():
+        default = generate.func_defaults[0]
+        result[name] = generate(max(1, int(default * scale)))
+    return result
+
+class _Timer(object):
+
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, phase, func, *args):
+        start = time.time()
+        result = func(*args)
+        self.times[phase] = time.time() - start
+        return result
+
+class _CountingCode(object):
+
+    """
+    Huelle um einen Instruktionsstrom, die die Zugriffe ``code[pc]``,
+    also die ausgefuehrten Instruktionen, zaehlt.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.count = 0
+
+    def __len__(self):
+        return len(self.code)
+
+    def __getitem__(self, pc):
+        self.count += 1
+        return self.code[pc]
+
+def run_once(source, backend="stack", **options):
+    """
+    Uebersetzt und fuehrt ``source`` einmal aus und liefert die Laufzeit
+    jeder Phase in Sekunden.
+    """
+    compiler_class, machine_class = BACKENDS[backend]
+    timer = _Timer()
+    module = timer("parse", parse, source)
+    compiler = compiler_class(module, **options)
+    timer("resolve", compiler.resolve)
+    timer("compile", compiler.generate)
+    code = timer("assemble", compiler.assemble)
+    machine = timer("decode", machine_class, code)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        timer("execute", machine.run)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return timer.times
+
+def measure(source, repeat, **options):
+    best = {}
+    for _ in range(repeat):
+        for phase, elapsed in run_once(source, **options).items():
+            best[phase] = min(elapsed, best.get(phase, elapsed))
+    return best
+
+def count_instructions(source, backend="stack", **options):
+    """
+    Liefert (Ausgabe, erzeugte Instruktionen, ausgefuehrte Instruktionen)
+    fuer ``source`` auf ``backend``.
+    """
+    compiler_class, machine_class = BACKENDS[backend]
+    code = compiler_class(parse(source), **options).compile()
+    machine = machine_class(code)
+    if backend == "stack":
+        machine.code = counter = _CountingCode(machine.code)
+    else:
+        machine.instructions = counter = _CountingCode(machine.instructions)
+    out = StringIO()
+    stdout = sys.stdout
+    sys.stdout = out
+    try:
+        machine.run()
+    finally:
+        sys.stdout = stdout
+    return out.getvalue(), len(code), counter.count
+
+def compare_backends(sources, names, repeat, **options):
+    """
+    Fuehrt die Workloads auf beiden Maschinen aus und gibt eine Tabelle
+    aus. Liefert die Namen der Workloads mit unterschiedlicher Ausgabe.
+    """
+    print "%-16s %17s %21s %17s" % ("", "instructions", "executed",
+                                     "execute (s)")
+    print "%-16s %8s %8s %10s %10s %8s %8s %5s" % ("workload", "stack",
+          "register", "stack", "register", "stack", "register", "x")
+    mismatches = []
+    for name in names:
+        out, static, executed = count_instructions(sources[name], "stack",
+                                                   **options)
+        reg_out, reg_static, reg_executed = count_instructions(
+                                    sources[name], "register", **options)
+        if out != reg_out:
+            mismatches.append(name)
+        stack_time = measure(sources[name], repeat, backend="stack",
+                             **options)["execute"]
+        reg_time = measure(sources[name], repeat, backend="register",
+                           **options)["execute"]
+        print "%-16s %8d %8d %10d %10d %8.4f %8.4f %5.2f" % (name, static,
+              reg_static, executed, reg_executed, stack_time, reg_time,
+              stack_time / max(reg_time, 1e-9))
+    return mismatches
+
+def compare(results, baseline, threshold, min_time):
+    """
+    Liefert eine Liste von (workload, phase, alt, neu) fuer alle Phasen,
+    die um mehr als ``threshold`` langsamer geworden sind. Phasen unter
+    ``min_time`` Sekunden sind zu verrauscht und werden ignoriert.
+    """
+    regressions = []
+    for name, times in sorted(results.items()):
+        for phase in PHASES:
+            old = baseline.get(name, {}).get(phase)
+            new = times.get(phase)
+            if old is None or new is None or max(old, new) < min_time:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append((name, phase, old, new))
+    return regressions
+
+def _print_table(results, baseline):
+    print "%-16s" % "workload" + "".join("%12s" % p for p in PHASES)
+    for name, times in sorted(results.items()):
+        row = "%-16s" % name
+        for phase in PHASES:
+            cell = "%.4f" % times[phase]
+            old = baseline.get(name, {}).get(phase)
+            if old:
+                cell += "%+.0f%%" % ((times[phase] / old - 1) * 100)
+            row += "%12s" % cell
+        print row
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Payne benchmark suite.")
+    parser.add_argument("names", nargs="*", metavar="WORKLOAD",
+                        help="only run these workloads")
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        metavar="FILE", help="default: %(default)s")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown per phase (default: "
+                             "%(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="ignore phases faster than this (seconds)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="size factor for the generated workloads")
+    parser.add_argument("-O", dest="opt_level", type=int, default=None)
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        default="stack")
+    parser.add_argument("--compare-backends", action="store_true",
+                        help="run every workload on both virtual machines "
+                             "and compare output, instruction counts and "
+                             "execution time")
+    return parser.parse_args(argv)
+
+def main(argv):
+    args = _parse_args(argv)
+    options = {}
+    if args.opt_level is not None:
+        options["opt_level"] = args.opt_level
+
+    sources = workloads(args.scale)
+    names = args.names or sorted(sources)
+    for name in names:
+        if not name in sources:
+            sys.exit("Unknown workload: %s" % name)
+    if args.compare_backends:
+        mismatches = compare_backends(sources, names, args.repeat, **options)
+        for name in mismatches:
+            print "MISMATCH %s: the backends print different output" % name
+        return 1 if mismatches else 0
+
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        sys.exit("No baseline at %s, record one with --save-baseline"
+                 % args.baseline)
+
+    results = {}
+    for name in names:
+        results[name] = measure(sources[name], args.repeat,
+                                backend=args.backend, **options)
+
+    baseline = {}
+    if not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    _print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    for name, phase, old, new in regressions:
+        print "REGRESSION %s/%s: %.4fs -> %.4fs" % (name, phase, old, new)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
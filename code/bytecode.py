@@ -0,0 +1,181 @@
+# coding: utf-8
+
+"""
+Binäres Bytecode-Format (.payc) für CodeObjects.
+
+Aufbau:
+    MAGIC       4 Bytes, "PAYC"
+    VERSION     unsigned short
+    DIGEST      20 Bytes, SHA-1 der Quelldatei
+    ITEMSIZE    unsigned char, Groesse eines Operanden in Bytes
+    BYTEORDER   1 Byte, "<" oder ">"
+    COUNT       unsigned int, Anzahl der Instruktionen
+    NCONSTS     unsigned int, Groesse der Konstantentabelle
+    OPS         COUNT Bytes, das Array CodeObject.ops
+    ARGS        COUNT * ITEMSIZE Bytes, das Array CodeObject.args
+    NCONSTS mal ein getaggter Wert, die Konstantentabelle
+    drei getaggte Tupel, die Funktionen ((name, einstieg, frame-groesse,
+    anzahl argumente), ...), die globalen Variablen ((name, slot), ...)
+    und die memoisierten Funktionen ((name, memo-id), ...)
+
+Werte werden mit einem Tag-Byte abgelegt:
+    'b' bool, 'i' 64-Bit-Integer, 'l' beliebig grosser Integer (dezimal),
+    's' String, 't' Tupel
+Strings, grosse Integer und Tupel tragen ein unsigned int als Laenge.
+Die Arrays liegen in der Byte-Reihenfolge des Rechners vor; passt sie
+nicht, gilt der Cache als veraltet. Die Zeilentabelle wird nicht
+gespeichert.
+
+Beim Laden wird die Datei per mmap eingeblendet. Passen Magic, Version
+oder Digest nicht, ist der Cache veraltet und wird ignoriert.
+"""
+
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from codeobject import CodeObject
+
+MAGIC = "PAYC"
+VERSION = 7
+EXTENSION = ".payc"
+
+_HEADER = struct.Struct("<4sH20sBcII")
+_BOOL = struct.Struct("<B")
+_INT = struct.Struct("<q")
+_LEN = struct.Struct("<I")
+
+_INT_MIN = -2 ** 63
+_INT_MAX = 2 ** 63 - 1
+
+_BYTEORDER = "<" if sys.byteorder == "little" else ">"
+
+def source_digest(data, *options):
+    """
+    Die Compiler-Optionen (z.B. die Optimierungsstufe) gehen mit in den
+    Digest ein, da sie den erzeugten Code veraendern.
+    """
+    digest = hashlib.sha1(data)
+    for option in options:
+        digest.update("\0%r" % (option,))
+    return digest.digest()
+
+def cache_path(fname):
+    return os.path.splitext(fname)[0] + EXTENSION
+
+def dump(code, digest, filename):
+    """
+    Schreibt das CodeObject ``code`` nach ``filename``. Die Datei wird erst
+    unter einem temporaeren Namen geschrieben und dann umbenannt, damit
+    parallele Laeufe nie eine halbe Datei zu sehen bekommen.
+    """
+    chunks = [_HEADER.pack(MAGIC, VERSION, digest, code.args.itemsize,
+                           _BYTEORDER, len(code), len(code.consts)),
+              code.ops.tostring(), code.args.tostring()]
+    functions = tuple((name,) + entry for name, entry in
+                      sorted(code.functions.items()))
+    for value in code.consts + [functions, tuple(code.globals.items()),
+                                tuple(code.memoized.items())]:
+        chunks.append(_tag(value))
+        _pack_value(chunks, value)
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write("".join(chunks))
+    os.rename(tmp, filename)
+
+def load(filename, digest):
+    """
+    Liefert das CodeObject aus ``filename`` oder None, falls die Datei
+    fehlt, beschaedigt ist oder nicht zur Quelle passt.
+    """
+    try:
+        with open(filename, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        (magic, version, file_digest, itemsize, byteorder, count,
+         nconsts) = _HEADER.unpack_from(buf, 0)
+        if (magic != MAGIC or version != VERSION or file_digest != digest
+            or byteorder != _BYTEORDER):
+            return None
+        ops = array("B")
+        args = array("l")
+        if itemsize != args.itemsize:
+            return None
+        offset = _HEADER.size
+        ops.fromstring(_read(buf, offset, count))
+        offset += count
+        args.fromstring(_read(buf, offset, count * itemsize))
+        offset += count * itemsize
+        values = []
+        for _ in xrange(nconsts + 3):
+            value, offset = _unpack_value(buf, offset + 1, buf[offset])
+            values.append(value)
+        functions = dict((entry[0], entry[1:]) for entry in values[-3])
+        return CodeObject(ops, args, values[:-3], functions,
+                          dict(values[-2]), memoized=dict(values[-1]))
+    except (struct.error, ValueError, IndexError):
+        return None
+    finally:
+        buf.close()
+
+def _read(buf, offset, length):
+    data = buf[offset:offset + length]
+    if len(data) != length:
+        raise ValueError("Truncated bytecode file")
+    return data
+
+def _tag(arg):
+    if isinstance(arg, bool):
+        return "b"
+    elif isinstance(arg, (int, long)):
+        if _INT_MIN <= arg <= _INT_MAX:
+            return "i"
+        return "l"
+    elif isinstance(arg, str):
+        return "s"
+    elif isinstance(arg, tuple):
+        return "t"
+    raise ValueError("Can't serialize value %r" % (arg,))
+
+def _pack_value(chunks, arg):
+    tag = _tag(arg)
+    if tag == "b":
+        chunks.append(_BOOL.pack(arg))
+    elif tag == "i":
+        chunks.append(_INT.pack(arg))
+    elif tag in "ls":
+        data = str(arg)
+        chunks.append(_LEN.pack(len(data)))
+        chunks.append(data)
+    elif tag == "t":
+        chunks.append(_LEN.pack(len(arg)))
+        for item in arg:
+            chunks.append(_tag(item))
+            _pack_value(chunks, item)
+
+def _unpack_value(buf, offset, tag):
+    if tag == "b":
+        return bool(_BOOL.unpack_from(buf, offset)[0]), offset + _BOOL.size
+    elif tag == "i":
+        return _INT.unpack_from(buf, offset)[0], offset + _INT.size
+    elif tag in "ls":
+        length = _LEN.unpack_from(buf, offset)[0]
+        offset += _LEN.size
+        data = _read(buf, offset, length)
+        if tag == "l":
+            data = long(data)
+        return data, offset + length
+    elif tag == "t":
+        length = _LEN.unpack_from(buf, offset)[0]
+        offset += _LEN.size
+        items = []
+        for _ in xrange(length):
+            item, offset = _unpack_value(buf, offset + 1, buf[offset])
+            items.append(item)
+        return tuple(items), offset
+    raise ValueError("Unknown value tag %r" % (tag,))
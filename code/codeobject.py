@@ -0,0 +1,119 @@
+# coding: utf-8
+
+"""
+Das Ergebnis der Uebersetzung, ohne Umweg ueber Text.
+
+Ein CodeObject speichert die Instruktionen kompakt in zwei typisierten
+Arrays:
+    ops         array('B'), ein Opcode je Instruktion
+    args        array('l'), der Operand: Slot, Frame-Groesse oder
+                Sprungziel (Instruktions-Index), bei LOAD_CONST und bei
+                Instruktionen mit mehreren Operanden ein Index in die
+                Konstantentabelle, ohne Operand NO_ARG
+    consts      die Konstantentabelle (ints, bools, Tupel)
+
+Dazu kommt die Symboltabelle: die Funktionen mit Einstieg, Frame-Groesse
+und Anzahl der Argumente, die Slots der globalen Variablen und die Ids
+der Memo-Tabellen memoisierter Funktionen (siehe memo.py). Die
+textuelle Form (out.xx) erzeugt disassemble(); decoder.decode liest sie
+wieder ein.
+"""
+
+from array import array
+
+from opcodes import argcount, hasjump, opname, LOAD_CONST
+from utils import newline
+
+NO_ARG = -1
+
+class CodeObject(object):
+
+    def __init__(self, ops, args, consts, functions=None, globals=None,
+                 lines=None, memoized=None):
+        self.ops = ops
+        self.args = args
+        self.consts = consts
+        # name -> (instruktions-index, frame-groesse, anzahl argumente)
+        self.functions = functions or {}
+        self.globals = globals or {} # name -> slot im modul-frame
+        self.memoized = memoized or {} # name -> memo-id
+        # zeilentabelle: ab line_starts[i] stammt der code aus zeile
+        # line_numbers[i]
+        self.line_starts = array("l", sorted(lines or ()))
+        self.line_numbers = array("l", (lines[i] for i in self.line_starts))
+
+    @classmethod
+    def from_instructions(cls, code, functions=None, globals=None,
+                          lines=None, memoized=None):
+        """
+        Erstellt ein CodeObject aus einer Liste von (opcode, operand).
+        """
+        ops = array("B")
+        args = array("l")
+        consts = []
+        index = {} # (typ, wert) -> index, True und 1 sind verschieden
+        for op, arg in code:
+            ops.append(op)
+            if arg is None:
+                args.append(NO_ARG)
+            elif op == LOAD_CONST or isinstance(arg, tuple):
+                key = (type(arg), arg)
+                if not key in index:
+                    index[key] = len(consts)
+                    consts.append(arg)
+                args.append(index[key])
+            else:
+                args.append(arg)
+        return cls(ops, args, consts, functions, globals, lines, memoized)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def get_lines(self):
+        return dict(zip(self.line_starts, self.line_numbers))
+
+    lines = property(get_lines) # instruktions-index -> quellzeile
+
+    def instructions(self):
+        """
+        Liefert die Instruktionen als Liste von (opcode, operand), auf der
+        der Interpreter arbeitet.
+        """
+        consts = self.consts
+        code = []
+        for op, arg in zip(self.ops, self.args):
+            if arg == NO_ARG:
+                arg = None
+            elif op == LOAD_CONST or argcount[op] > 1:
+                arg = consts[arg]
+            code.append((op, arg))
+        return code
+
+    def disassemble(self):
+        """
+        Die textuelle Form: je Zeile ein Opcode oder ein Operand,
+        Sprungziele sind Zeilen-Offsets.
+        """
+        offsets = []
+        offset = 0
+        for op in self.ops:
+            offsets.append(offset)
+            offset += 1 + argcount[op]
+        offsets.append(offset)
+
+        lines = []
+        for op, arg in self.instructions():
+            lines.append(newline(opname[op]))
+            if arg is None:
+                continue
+            elif op in hasjump:
+                lines.append(newline(offsets[arg]))
+            elif isinstance(arg, tuple):
+                lines.extend(newline(a) for a in arg)
+            else:
+                lines.append(newline(arg))
+        return "".join(lines)
+
+    def write(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.disassemble())
@@ -5,13 +5,27 @@ Dieses Modul enthält die Logik zur Übersetzung des AST in Assembler.
 """
 
 import cStringIO
-from nodes import Integer, BinaryOp, VarDecl
-from opcodes import math_symbols, comparison_symbols
+import errors
+from nodes import (Integer, Boolean, BinaryOp, VarDecl, Identifier,
+                   FunctionCall, FunctionDecl)
+from opcodes import (math_symbols, comparison_symbols, compare_jumps,
+                     int_operations)
+from mytypes import IntType
+from codeobject import CodeObject
+from optimizer import ConstantFolder
+import linker
+import peephole
 from visitor import Visitor
 from writer import Writer
 from utils import newline
 
-FILENAME = "out.xx"
+FILENAME = "out.xx" # fuer die textuelle Form, siehe CodeObject.write
+
+# 0: keine Optimierung
+# 1: Konstantenfaltung und Entfernen toter Zweige auf dem AST
+# 2: zusaetzlich Peephole-Optimierung des erzeugten Codes und
+#    Endrekursion als Sprung
+DEFAULT_OPT_LEVEL = 2
 
 class Marker(object):
     """
@@ -29,19 +43,47 @@ class Label(object):
     def __init__(self, label):
         self.label = label
 
+class SourceLine(object):
+
+    """
+    Markiert im Buffer, aus welcher Quellzeile die folgenden Instruktionen
+    stammen. Belegt wie ein Label keinen Platz im erzeugten Code.
+    """
+    def __init__(self, line):
+        self.line = line
+
 class Compiler(Visitor):
 
     """
     Die Hauptklasse zur Übersetzung.
     """
-    def __init__(self, module):
+    def __init__(self, module, opt_level=DEFAULT_OPT_LEVEL,
+                 superinstructions=True, memoize=False, tiered=False):
         self.module = module
+        self.opt_level = opt_level
+        # LOAD_LOAD, INC_LOCAL, JUMP_IF_*; zum Debuggen abschaltbar
+        self.superinstructions = superinstructions
+        # reine Funktionen bekommen eine Memo-Tabelle, siehe memo.py
+        self.memoize = memoize
+        self.memoized = {} # name -> memo-id
+        # ENTER am Anfang jeder Funktion, siehe jit.py
+        self.tiered = tiered
+        self.removed_instructions = 0 # durch die peephole-optimierung
         self.buf = Writer() # modul-ebene
 
         self.function_buf = Writer() # funktionen kommen seperat
         self.label_count = 0
+        # variablen aus weggefalteten zweigen der aktuellen anweisung
+        self.dropped = []
 
         self.jump_table = {} # offsets der funktionen
+        self.frame_sizes = {} # anzahl der lokalen slots je funktion
+        self.libraries = [] # direkt importierte linker.Library-Objekte
+        self.imported = {} # label -> qualifizierter name, siehe linker
+
+        self.globals = {} # ident -> slot im modul-frame
+        self.locals = None # ident -> slot, nur innerhalb einer funktion
+        self.function = None # die gerade uebersetzte FunctionDecl
 
     def _gen_label(self):
         """
@@ -51,18 +93,152 @@ class Compiler(Visitor):
         self.label_count += 1
         return "".join(("L", str(self.label_count)))
 
-    def compile(self):
+    def compile(self, filename=None):
         """
         Diese Funktion ist die einzige, die direkt von außerhalb aufgerufen wird.
-        Sie steuert den Prozess der Übersetzung.
+        Sie steuert den Prozess der Übersetzung und liefert ein CodeObject.
+        Mit ``filename`` wird zusaetzlich die textuelle Form geschrieben.
+        """
+        self.resolve()
+        self.generate()
+        code = self.assemble()
+        if filename is not None:
+            code.write(filename)
+        return code
+
+    def resolve(self):
+        """
+        Namensaufloesung und Typpruefung des ganzen Moduls.
         """
         for node in self.module.ast:
             node.resolve(self.module)
-            self.visit(node)
+
+    def generate(self):
+        """
+        Erzeugt den Code des bereits aufgeloesten Moduls in self.buf, 
+        Labels und Marker sind danach noch nicht aufgeloest.
+        """
+        self._visit_statements(self.module.ast)
+        module_buf = self.buf
+        self.buf = Writer()
+        # die globalen variablen sind die slots des modul-frames
+        self.buf.append("PUSH_FRAME")
+        self.buf.append(len(self.globals))
+        self.buf.append(module_buf)
         self.buf.append("EOF") # ende des globalen scopes
         self.buf.append(self.function_buf) # func-decls kommen ans ende des moduls 
-        self.buf.write(FILENAME) # Just for fun file writing
-        return str(self.buf)
+        if self.opt_level >= 2:
+            entries = self.jump_table.values()
+            self.buf.buf, self.removed_instructions = peephole.optimize(
+                                                        self.buf.buf, entries)
+
+    def assemble(self):
+        """
+        Erstellt aus dem fertig erzeugten Buffer das CodeObject samt
+        Symboltabelle. Der Code importierter Bibliotheken wird dabei
+        angehaengt und gebunden (siehe linker).
+        """
+        external = {}
+        instructions = self.buf.assemble(0, None, external)
+        calls = []
+        for pos, label in external.items():
+            if not label in self.imported:
+                raise errors.LabelException("Undefined label %s" % (label))
+            calls.append((pos, self.imported[label]))
+        functions = {}
+        for name, label in self.jump_table.items():
+            if label in self.imported:
+                continue
+            nargs = len(self.module.functions[name].args)
+            functions[name] = (self.buf.offsets[label],
+                               self.frame_sizes[name], nargs)
+        memoized = dict(self.memoized)
+        lines = dict(self.buf.lines)
+        calls.extend(linker.append(instructions,
+                                   linker.closure(self.libraries), functions,
+                                   memoized, lines))
+        linker.resolve(instructions, calls, functions)
+        return CodeObject.from_instructions(instructions, functions,
+                                            dict(self.globals), lines,
+                                            memoized)
+
+    def generate_chunk(self, nodes, eof=True):
+        """
+        Fuer die Streaming-Uebersetzung: erzeugt den Code der bereits
+        aufgeloesten Anweisungen ``nodes`` und liefert zwei Buffer, die
+        darin deklarierten Funktionen und den Modul-Code (mit EOF, ausser
+        bei ``eof=False``). Globale Slots, Labels und Funktionen bleiben
+        von einem Aufruf zum naechsten erhalten; den Modul-Frame legt der
+        Aufrufer an.
+        """
+        self.buf = Writer()
+        self.function_buf = Writer()
+        self._visit_statements(nodes)
+        module_buf = self.buf
+        if eof:
+            module_buf.append("EOF")
+        function_buf = self.function_buf
+        if self.opt_level >= 2:
+            entries = self.jump_table.values()
+            for buf in (module_buf, function_buf):
+                buf.buf, removed = peephole.optimize(buf.buf, entries)
+                self.removed_instructions += removed
+        return function_buf, module_buf
+
+    def _visit_statements(self, nodes):
+        folder = ConstantFolder()
+        for node in nodes:
+            if self.opt_level >= 1:
+                subnodes = folder.fold_body([node])
+                self.dropped, folder.dropped = folder.dropped, []
+                if not isinstance(node, FunctionDecl):
+                    self._reserve_dropped()
+                for subnode in subnodes:
+                    self.visit(subnode)
+                self.dropped = []
+            else:
+                self.visit(node)
+
+    def _reserve_dropped(self):
+        """
+        Legt die Slots der Variablen an, deren Zuweisungen der
+        ConstantFolder entfernt hat; gelesen werden sie trotzdem.
+        """
+        for name in self.dropped:
+            self._store_slot(name)
+
+    def visit(self, node):
+        loc = getattr(node, "loc", None)
+        if loc is not None:
+            self.buf.append(SourceLine(loc.line))
+        return Visitor.visit(self, node)
+
+    def _slot(self, table, ident):
+        """
+        Liefert den Slot von ``ident`` in ``table``; unbekannte Namen
+        bekommen den naechsten freien Slot.
+        """
+        if not ident in table:
+            table[ident] = len(table)
+        return table[ident]
+
+    def _store_slot(self, ident):
+        if self.locals is None:
+            return self._slot(self.globals, str(ident))
+        return self._slot(self.locals, str(ident))
+
+    def _fast_slot(self, node):
+        """
+        Liefert den Slot, falls ``node`` eine per LOAD_FAST geladene
+        Variable ist, ansonsten None.
+        """
+        if not isinstance(node, Identifier):
+            return None
+        if self.locals is None:
+            return self.globals[node.name]
+        if node.local:
+            return self.locals[node.name]
+        return None
     
     def visit_FunctionDecl(self, node):
         """
@@ -75,21 +251,55 @@ class Compiler(Visitor):
         func_label = self._gen_label()
         self.buf.append(Label(func_label))
         self.jump_table[str(node.ident)] = func_label 
+        # Argumente und lokale Variablen stehen nach resolve() in node.table
+        self.frame_sizes[str(node.ident)] = len(node.table)
+        if self.tiered:
+            self.buf.append("ENTER")
+        if self.memoize and node.pure:
+            # der zusaetzliche letzte Slot haelt das Argument-Tupel
+            memo_id = len(self.memoized)
+            self.memoized[str(node.ident)] = memo_id
+            self.frame_sizes[str(node.ident)] += 1
+            self.buf.append("MEMO_LOOKUP")
+            self.buf.append(memo_id)
+            self.buf.append(len(node.args))
+            self.buf.append(len(node.table))
+        self.locals = {}
+        self.function = node
         for arg in node.args:
-            self.buf.append("STORE")
-            self.buf.append(str(arg))
+            self.buf.append("STORE_FAST")
+            self.buf.append(self._slot(self.locals, str(arg)))
+        self._reserve_dropped()
         for subnode in node.body:
             self.visit(subnode)
 
+        self.function = None
+        self.locals = None
         self.buf = backup
 
+    def visit_ImportStatement(self, node):
+        """
+        Meldet die Funktionen der importierten Bibliothek an; ihr Code
+        kommt erst in assemble() dazu.
+        """
+        library = node.library
+        if library in self.libraries:
+            return
+        self.libraries.append(library)
+        for name, _, frame_size, _, _ in library.functions:
+            label = self._gen_label()
+            self.jump_table[name] = label
+            self.frame_sizes[name] = frame_size
+            self.imported[label] = library.qualify(name)
+
     def visit_FunctionCall(self, node):
         """
         Übersetzt einen Funktionsaufruf.
         """
         for arg in reversed(node.args):
             self.visit(arg) 
-        self.buf.append("PUSH_SCOPE") # Scope der Funktion
+        self.buf.append("PUSH_FRAME") # Frame der Funktion
+        self.buf.append(self.frame_sizes[str(node.ident)])
 
         jump_back_label = self._gen_label()
 
@@ -98,33 +308,113 @@ class Compiler(Visitor):
 
 
         self.buf.append("JUMP") # Aufruf, func-offset
-        self.buf.append(Label(jump_back_label)) # ruecksprung-label
         self.buf.append(Marker(self.jump_table[str(node.ident)]))
+        self.buf.append(Label(jump_back_label)) # ruecksprung-label
 
 
     def visit_ReturnStatement(self, node):
         """
         Übersetzt eine Return-Anweisung.
+
+        "return f(...)" innerhalb von f ist ein Endaufruf: die Argumente
+        landen auf dem Stack und es wird direkt zum Anfang von f 
+        gesprungen, wo sie wie bei einem normalen Aufruf in die Slots
+        geschrieben werden. Frame und Ruecksprungadresse werden 
+        wiederverwendet, der Speicherbedarf bleibt konstant.
         """
+        if self.opt_level >= 2 and self._is_self_call(node.expr):
+            for arg in reversed(node.expr.args):
+                self.visit(arg)
+            self.buf.append("JUMP")
+            self.buf.append(Marker(self.jump_table[str(self.function.ident)]))
+            return
         self.visit(node.expr)
-        self.buf.append("POP_SCOPE")
+        name = self.function and str(self.function.ident)
+        if name in self.memoized:
+            self.buf.append("MEMO_STORE")
+            self.buf.append(self.memoized[name])
+            self.buf.append(self.frame_sizes[name] - 1)
+        self.buf.append("POP_FRAME")
         self.buf.append("RET")
         
     def visit_BinaryOp(self, node):
         """
         Übersetzt einen binären Ausdruck, wie beispielsweise "2 + 2".
         """
-        self.visit(node.right)
-        self.visit(node.left)
+        self._visit_operands(node)
         if node.op in math_symbols:
             operator = math_symbols[node.op]
         elif node.op in comparison_symbols:
             operator = comparison_symbols[node.op]
+        if (self.opt_level >= 1 and node.left.type_ == IntType and
+            node.right.type_ == IntType):
+            # beide operanden sind laut resolve() ints
+            operator = int_operations[operator]
         self.buf.append(operator)
 
+    def _is_self_call(self, node):
+        return (self.function is not None and isinstance(node, FunctionCall)
+                and str(node.ident) == str(self.function.ident))
+
+    def _visit_operands(self, node):
+        """
+        Erst der rechte, dann der linke Operand. Sind beide lokale 
+        Variablen, genuegt ein LOAD_LOAD.
+        """
+        right = self._fast_slot(node.right)
+        left = self._fast_slot(node.left)
+        if self.superinstructions and right is not None and left is not None:
+            self.buf.append("LOAD_LOAD")
+            self.buf.append(right)
+            self.buf.append(left)
+        else:
+            self.visit(node.right)
+            self.visit(node.left)
+
+    def _is_comparison(self, node):
+        return isinstance(node, BinaryOp) and node.op in comparison_symbols
+
+    def _jump_if(self, expr, label, jump_if_true=False):
+        """
+        Springt zu ``label``, falls ``expr`` zu ``jump_if_true`` 
+        ausgewertet wird. Vergleiche werden mit Superinstruktionen direkt
+        mit dem Sprung zu einem JUMP_IF_(NOT_)* verschmolzen. Ohne diese
+        gibt es nur CJUMP, also den Sprung bei False.
+        """
+        if self.superinstructions and self._is_comparison(expr):
+            self._visit_operands(expr)
+            if_true, if_false = compare_jumps[comparison_symbols[expr.op]]
+            self.buf.append(if_true if jump_if_true else if_false)
+        else:
+            assert not jump_if_true
+            self.visit(expr)
+            self.buf.append("CJUMP")
+        self.buf.append(Marker(label))
+
+    def _increment(self, node, slot):
+        """
+        Liefert k, falls ``node`` die Form "x = x + k", "x = k + x" oder
+        "x = x - k" mit einem Integer-Literal k hat und x in ``slot`` liegt.
+        """
+        expr = node.right
+        if not isinstance(expr, BinaryOp) or not expr.op in ("+", "-"):
+            return None
+        if (self._fast_slot(expr.left) == slot and 
+            isinstance(expr.right, Integer)):
+            if expr.op == "-":
+                return -expr.right.val
+            return expr.right.val
+        if (expr.op == "+" and self._fast_slot(expr.right) == slot and
+            isinstance(expr.left, Integer)):
+            return expr.left.val
+        return None
+
     def _load_const(self, node):
         self.buf.append("LOAD_CONST")
-        self.buf.append(str(node.val))
+        if isinstance(node, Boolean):
+            self.buf.append(node.val == "True") # der Parser liefert Strings
+        else:
+            self.buf.append(node.val)
 
     def visit_Integer(self, node):
         self._load_const(node)
@@ -136,9 +426,17 @@ class Compiler(Visitor):
         """
         Übersetzt eine Zuweisung.
         """
+        slot = self._store_slot(node.left)
+        if self.superinstructions:
+            increment = self._increment(node, slot)
+            if increment is not None:
+                self.buf.append("INC_LOCAL")
+                self.buf.append(slot)
+                self.buf.append(increment)
+                return
         self.visit(node.right)
-        self.buf.append("STORE")
-        self.buf.append(node.left)
+        self.buf.append("STORE_FAST")
+        self.buf.append(slot)
 
     def visit_PrintStatement(self, node):
         self.visit(node.expr)
@@ -156,10 +454,8 @@ class Compiler(Visitor):
         einfach inkrementiert. Ansonsten wird zu "print 28"
         gesprungen.
         """ 
-        self.visit(node.expr)
-        self.buf.append("CJUMP")
         label = self._gen_label()
-        self.buf.append(Marker(label))
+        self._jump_if(node.expr, label)
         for subnode in node.body:
             self.visit(subnode)
         self.buf.append(Label(label))
@@ -171,13 +467,33 @@ class Compiler(Visitor):
         while i < 10:
             print i
         end
+
+        Ist die Bedingung ein Vergleich und sind Superinstruktionen aktiv,
+        steht der Test am Ende der Schleife. Pro Durchlauf faellt dann der
+        Ruecksprung weg:
+
+            JUMP test
+        body:
+            ...
+        test:
+            JUMP_IF_LT body
         """
+        if self.superinstructions and self._is_comparison(node.expr):
+            body_label = self._gen_label()
+            test_label = self._gen_label()
+            self.buf.append("JUMP")
+            self.buf.append(Marker(test_label))
+            self.buf.append(Label(body_label))
+            for subnode in node.body:
+                self.visit(subnode)
+            self.buf.append(Label(test_label))
+            self._jump_if(node.expr, body_label, jump_if_true=True)
+            return
+
         head_label = self._gen_label()
         self.buf.append(Label(head_label))
-        self.visit(node.expr)
-        self.buf.append("CJUMP")
         body_label = self._gen_label() # eigentlich addresse *nach* dem body
-        self.buf.append(Marker(body_label))
+        self._jump_if(node.expr, body_label)
 
         for subnode in node.body:
             self.visit(subnode)
@@ -186,6 +502,18 @@ class Compiler(Visitor):
         self.buf.append(Label(body_label))
 
     def visit_Identifier(self, node):
-        self.buf.append("LOAD")
-        self.buf.append(node.name)
+        """
+        Auf Modulebene ist der Modul-Frame der aktuelle Frame, globale
+        Variablen werden dort also ebenfalls per LOAD_FAST gelesen. 
+        Innerhalb einer Funktion geht es ueber LOAD_GLOBAL.
+        """
+        if self.locals is None:
+            self.buf.append("LOAD_FAST")
+            self.buf.append(self.globals[node.name])
+        elif node.local:
+            self.buf.append("LOAD_FAST")
+            self.buf.append(self.locals[node.name])
+        else:
+            self.buf.append("LOAD_GLOBAL")
+            self.buf.append(self.globals[node.name])
 
@@ -0,0 +1,89 @@
+#coding: utf-8
+
+"""
+Übersetzt die textuelle Form des Codes (out.xx, siehe
+CodeObject.disassemble) einmalig in einen kompakten Instruktionsstrom,
+auf dem der Interpreter arbeitet.
+
+Jede Instruktion ist ein Tupel (opcode, operand):
+    - opcode ist ein Integer aus opcodes.opmap
+    - Konstanten sind bereits int bzw. bool
+    - Slots und Frame-Groessen sind int
+    - Instruktionen mit mehreren Operanden (siehe opcodes.argcount) tragen
+      ein Tupel von ints
+    - Sprungziele sind Indizes in den Instruktionsstrom, nicht mehr
+      Zeilen-Offsets
+"""
+
+import errors
+from opcodes import opmap, argcount, hasjump, LOAD_CONST, EOF
+
+def decode(lines):
+    raw, index = _scan(lines)
+    code = []
+    for op, args in raw:
+        if op in hasjump:
+            arg = _jump_target(index, args[0])
+        else:
+            arg = operand(op, args)
+        code.append((op, arg))
+    if not code or code[-1][0] != EOF:
+        code.append((EOF, None))
+    return code
+
+def operand(op, args):
+    """
+    Wandelt die textuellen Operanden einer Instruktion, die kein Sprung
+    ist, in ihre dekodierte Form um.
+    """
+    if not args:
+        return None
+    elif op == LOAD_CONST:
+        return _constant(args[0])
+    elif len(args) == 1:
+        return _integer(args[0])
+    return tuple(_integer(a) for a in args)
+
+def _scan(lines):
+    raw = []
+    index = {} # zeilen-offset -> instruktions-index
+    i = 0
+    while i < len(lines):
+        name = lines[i].strip()
+        index[i] = len(raw)
+        if not name in opmap:
+            msg = "Index: %s - Invalid Opcode: %s" % (str(i), name)
+            raise errors.InvalidOpcodeException(msg)
+        op = opmap[name]
+        args = []
+        for _ in range(argcount[op]):
+            i += 1
+            if i == len(lines):
+                msg = "Index: %s - Missing operand for %s" % (str(i), name)
+                raise errors.InvalidOpcodeException(msg)
+            args.append(lines[i].strip())
+        raw.append((op, args))
+        i += 1
+    index[len(lines)] = len(raw)
+    return raw, index
+
+def _jump_target(index, arg):
+    try:
+        return index[int(arg)]
+    except (ValueError, KeyError):
+        msg = "Invalid jump target: %s" % (str(arg))
+        raise errors.InvalidOperandException(msg)
+
+def _constant(arg):
+    if arg == "True":
+        return True
+    elif arg == "False":
+        return False
+    return _integer(arg)
+
+def _integer(arg):
+    try:
+        return int(arg)
+    except ValueError:
+        msg = "Invalid constant: %s" % (str(arg))
+        raise errors.InvalidOperandException(msg)
@@ -29,3 +29,12 @@ class FunctionCallException(Exception):
 
 class InvalidTypesException(Exception):
     pass
+
+class LabelException(Exception):
+    pass
+
+class ParseException(Exception):
+    pass
+
+class ImportException(Exception):
+    pass
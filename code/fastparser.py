@@ -0,0 +1,285 @@
+# coding: utf-8
+
+"""
+Handgeschriebener Parser als Alternative zu dparser (--parser=fast).
+
+Ein regulaerer Ausdruck zerlegt das Programm in Tokens, ein rekursiver
+Abstieg mit einer Funktion je Praezedenzstufe baut daraus dieselben
+Knoten wie die d_-Funktionen in symbol.py. Die Grammatik dort ist die
+Referenz, auch in ihren Eigenheiten:
+
+    - Vergleiche binden so stark wie * und /, also staerker als + und -
+      ("a + b < c" ist "a + (b < c)"); alle Operatoren sind
+      linksassoziativ
+    - Zuweisungen sind rechtsassoziative Ausdruecke ("x = y = 1 + 2")
+    - Zeilenumbrueche sind Leerraum, ausser direkt nach dem ":" eines
+      Blocks; "x = 1 y = 2" sind zwei Anweisungen, "f\\n(1)" ein Aufruf
+    - print und return sind nur am Anfang einer Anweisung
+      Schluesselwoerter, end nur innerhalb eines Blocks; def, if und
+      while als Name sind ein Fehler (KeywordException)
+    - import ist nur vor einem Namen am Anfang einer Anweisung der
+      obersten Ebene ein Schluesselwort
+
+Die Knoten bekommen wie bei dparser ihre Position als nodes.Location.
+"""
+
+import re
+
+import errors
+import nodes as nod
+
+NUMBER, NAME, COLON, EOF = "number", "name", ":\n", "eof"
+
+_TOKEN = re.compile(r"""
+      ([ \t\n\r\f\v]+|//[^\n]*|/\*.*?\*/) # 1: leerraum und kommentare
+    | ([0-9]+)                            # 2
+    | ([a-zA-Z_][a-zA-Z0-9_]*)            # 3
+    | (:\n|==|[-+*/<>=(),])               # 4
+    | (.)                                 # 5: unbekanntes zeichen
+""", re.S | re.X)
+
+_ADDOPS = frozenset(("+", "-"))
+_MULOPS = frozenset(("*", "/", "<", ">", "=="))
+_EXPRESSION_START = frozenset((NUMBER, NAME, "("))
+
+def tokenize(program):
+    """
+    Liefert die Tokens von ``program`` als Liste von (Art, Text, Zeile,
+    Spalte), abgeschlossen durch ein EOF-Token. Die Art ist NUMBER, NAME
+    oder bei Operatoren und Klammern der Text selbst.
+    """
+    tokens = []
+    append = tokens.append
+    line = 1
+    line_start = 0 # position des ersten zeichens der zeile
+    for match in _TOKEN.finditer(program):
+        group = match.lastindex
+        text = match.group(group)
+        if group == 1:
+            newlines = text.count("\n")
+            if newlines:
+                line += newlines
+                line_start = match.start() + text.rfind("\n") + 1
+        elif group == 3:
+            append((NAME, text, line, match.start() - line_start))
+        elif group == 4:
+            append((text, text, line, match.start() - line_start))
+            if text == COLON:
+                line += 1
+                line_start = match.end()
+        elif group == 2:
+            append((NUMBER, text, line, match.start() - line_start))
+        else:
+            raise errors.ParseException("line %d: unexpected character %r"
+                                        % (line, text))
+    append((EOF, None, line, len(program) - line_start))
+    return tokens
+
+class FastParser(object):
+
+    """
+    Gegenstueck zu dparser.Parser; ein Objekt kann beliebig viele
+    Programme parsen.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+
+    def parse(self, program):
+        """
+        Liefert die Anweisungen von ``program`` als Liste von Knoten.
+        """
+        return _Parser(program, self.keywords).program()
+
+class _Parser(object):
+
+    def __init__(self, program, keywords):
+        self.buf = program
+        self.keywords = keywords
+        self.tokens = tokenize(program)
+        self.index = 0
+
+    def _location(self, index):
+        kind, text, line, col = self.tokens[index]
+        return nod.Location(line, col)
+
+    def _error(self):
+        kind, text, line, col = self.tokens[self.index]
+        if kind == EOF:
+            found = "end of input"
+        else:
+            found = repr(text)
+        raise errors.ParseException("line %d: unexpected %s" % (line, found))
+
+    def _expect(self, kind):
+        if self.tokens[self.index][0] != kind:
+            self._error()
+        self.index += 1
+
+    def _is_word(self, word):
+        """
+        True, falls das aktuelle Token das Schluesselwort ``word`` ist und
+        nicht der Name in einer Zuweisung.
+        """
+        tokens = self.tokens
+        kind, text = tokens[self.index][:2]
+        return (kind == NAME and text == word and
+                tokens[self.index + 1][0] != "=")
+
+    def _is_import(self):
+        """
+        True, falls hier eine import-Anweisung beginnt ("import" gefolgt
+        von einem Namen).
+        """
+        tokens = self.tokens
+        kind, text = tokens[self.index][:2]
+        return (kind == NAME and text == "import" and
+                tokens[self.index + 1][0] == NAME)
+
+    def program(self):
+        body = []
+        tokens = self.tokens
+        while tokens[self.index][0] != EOF:
+            if self._is_word("def"):
+                body.append(self.function_decl())
+            elif self._is_import():
+                start = self.index
+                self.index += 1
+                body.append(nod.ImportStatement(self.ident(),
+                                                self._location(start)))
+            else:
+                body.append(self.simple_statement())
+        return body
+
+    def function_decl(self):
+        start = self.index
+        self.index += 1
+        ident = self.ident()
+        self._expect("(")
+        params = []
+        if self.tokens[self.index][0] != ")":
+            params.append(self.ident())
+            while self.tokens[self.index][0] == ",":
+                self.index += 1
+                params.append(self.ident())
+        self._expect(")")
+        self._expect(COLON)
+        return nod.FunctionDecl(ident, params, self.block(),
+                                self._location(start))
+
+    def block(self):
+        """
+        Die Anweisungen bis zum naechsten "end".
+        """
+        body = []
+        tokens = self.tokens
+        while True:
+            kind, text = tokens[self.index][:2]
+            if kind == NAME and text == "end":
+                self.index += 1
+                return body
+            elif kind == EOF:
+                self._error()
+            body.append(self.simple_statement())
+
+    def simple_statement(self):
+        tokens = self.tokens
+        start = self.index
+        kind, text = tokens[start][:2]
+        if kind == NAME:
+            following = tokens[start + 1][0]
+            if text == "if" and following != "=":
+                return self._block_statement(nod.IfStatement)
+            elif text == "while" and following != "=":
+                return self._block_statement(nod.WhileStatement)
+            elif text == "print" and following in _EXPRESSION_START:
+                self.index += 1
+                return nod.PrintStatement(self.expression(),
+                                          self._location(start))
+            elif text == "return" and following in _EXPRESSION_START:
+                self.index += 1
+                return nod.ReturnStatement(self.expression(),
+                                           self._location(start))
+        return self.expression()
+
+    def _block_statement(self, cls):
+        start = self.index
+        self.index += 1
+        expr = self.expression()
+        self._expect(COLON)
+        return cls(expr, self.block(), self._location(start))
+
+    def expression(self):
+        """
+        Zuweisung oder Summe von Termen.
+        """
+        tokens = self.tokens
+        start = self.index
+        if tokens[start][0] == NAME and tokens[start + 1][0] == "=":
+            ident = self.ident()
+            self.index += 1
+            return nod.VarDecl(ident, self.expression(), self._location(start))
+        left = self.term()
+        while tokens[self.index][0] in _ADDOPS:
+            op = tokens[self.index][1]
+            self.index += 1
+            left = nod.BinaryOp(left, op, self.term(), self._location(start))
+        return left
+
+    def term(self):
+        """
+        Produkte, Quotienten und Vergleiche von Atomen.
+        """
+        tokens = self.tokens
+        start = self.index
+        left = self.atom()
+        while tokens[self.index][0] in _MULOPS:
+            op = tokens[self.index][1]
+            self.index += 1
+            left = nod.BinaryOp(left, op, self.atom(), self._location(start))
+        return left
+
+    def atom(self):
+        tokens = self.tokens
+        start = self.index
+        kind, text = tokens[start][:2]
+        if kind == NUMBER:
+            self.index += 1
+            return nod.Integer(int(text), self._location(start))
+        elif kind == NAME:
+            if ((text == "True" or text == "False") and
+                tokens[start + 1][0] != "("):
+                self.index += 1
+                return nod.Boolean(text, self._location(start))
+            ident = self.ident()
+            if tokens[self.index][0] == "(":
+                return nod.FunctionCall(ident, self.arguments(),
+                                        self._location(start))
+            return ident
+        elif kind == "(":
+            self.index += 1
+            node = self.expression()
+            self._expect(")")
+            return node
+        self._error()
+
+    def arguments(self):
+        self.index += 1 # "("
+        args = []
+        if self.tokens[self.index][0] != ")":
+            args.append(self.expression())
+            while self.tokens[self.index][0] == ",":
+                self.index += 1
+                args.append(self.expression())
+        self._expect(")")
+        return args
+
+    def ident(self):
+        kind, text = self.tokens[self.index][:2]
+        if kind != NAME:
+            self._error()
+        if text in self.keywords:
+            msg = "Invalid use of reserved keyword: %s" % (self.buf)
+            raise errors.KeywordException(msg)
+        self.index += 1
+        return nod.Identifier(text, None)
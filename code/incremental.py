@@ -0,0 +1,507 @@
+# coding: utf-8
+
+"""
+Inkrementelle Uebersetzung auf Ebene der Funktionen.
+
+Die Quelle wird wie bei der Streaming-Ausfuehrung an den Grenzen der
+Anweisungen der obersten Ebene zerlegt (stream.chunks): jede Funktion
+ist ein Segment, die Anweisungen zwischen zwei Funktionen bilden
+zusammen ein Modul-Segment. Die Segmente werden der Reihe nach
+geparst, aufgeloest und uebersetzt, jedes in einen eigenen,
+verschiebbaren Block:
+
+    code        Instruktionen (opcode, operand) ab Index 0
+    jumps       Positionen der Sprungziele innerhalb des Blocks
+    external    (position, name) fuer Aufrufe anderer Funktionen
+    lines       (index, zeile) relativ zum Anfang des Segments
+    exports     (name, index) fuer die Einstiege der Funktionen im Block
+
+link() legt die Bloecke wie Compiler.generate() hintereinander
+(PUSH_FRAME, Modul-Code, EOF, Funktionen), dahinter die importierten
+Bibliotheken (siehe linker), verschiebt die Sprungziele und setzt die
+Einstiege der aufgerufenen Funktionen ein. Was die
+Peephole-Optimierung auf dem ganzen Buffer ueber die Grenzen der
+Bloecke hinweg getan haette (Jump-Threading, DUP_STORE_FAST), holt
+link() nach; der Code ist derselbe wie bei Compiler.compile().
+
+Die Bloecke landen im BlockCache, der Schluessel ist der SHA-1 ueber
+den Quelltext des Segments und die Compiler-Optionen. Ein Treffer wird
+nur benutzt, wenn alles, was beim Uebersetzen von ausserhalb des
+Segments kam, noch stimmt: Slot und Typ der benutzten globalen
+Variablen, Anzahl der Argumente, Frame-Groesse und Reinheit der
+aufgerufenen Funktionen, die Digests der importierten Module, bei
+Funktionen die Memo-Id und bei Modul-Segmenten die Anzahl der globalen
+Variablen davor. Dann entfallen
+Parsen, Aufloesen und Codeerzeugung; was das Segment deklariert, wird
+aus dem Eintrag nachgetragen (eine FunctionDecl ohne Rumpf bzw. Slot
+und Typ der zugewiesenen globalen Variablen).
+
+Schlaegt die Uebersetzung mit einem der FALLBACK_ERRORS fehl, etwa
+wegen eines Fehlers in der Quelle, einer Grenze, die stream.chunks
+falsch erkannt hat, oder eines Eintrags, der nicht mehr zur Quelle
+passt, wird das ganze Programm auf dem normalen Weg uebersetzt.
+Fehlermeldungen sind damit dieselben wie ohne Cache. Alle anderen
+Ausnahmen sind Fehler im Compiler und werden weitergereicht.
+"""
+
+import hashlib
+import marshal
+import os
+import re
+
+import bytecode
+from codeobject import CodeObject
+from compiler import Compiler
+import errors
+import linker
+from mytypes import IntType, BoolType, VoidType
+from nodes import Expression, FunctionDecl, Identifier, ImportStatement
+from opcodes import (EOF, JUMP, PUSH_ADDRESS, PUSH_FRAME, STORE_FAST,
+                     LOAD_FAST, DUP_STORE_FAST)
+from stream import chunks
+from symbol import Module, parse
+from visitor import Visitor
+
+MAGIC = "PAYB"
+VERSION = 2
+EXTENSION = ".payb"
+
+# fehler in der quelle sowie beim lesen importierter module und
+# unpassender cache-eintraege; bei ihnen uebersetzt compile() alles neu
+FALLBACK_ERRORS = (errors.ParseException, errors.KeywordException,
+                   errors.VarAccException, errors.ArgumentException,
+                   errors.InvalidTypesException,
+                   errors.FunctionDeclException,
+                   errors.FunctionCallException, errors.ImportException,
+                   IOError, EOFError, ValueError, TypeError)
+
+_DEF = re.compile(r"def\b")
+_TYPES = dict((repr(type_), type_) for type_ in (IntType, BoolType, VoidType))
+
+def cache_path(fname):
+    return os.path.splitext(fname)[0] + EXTENSION
+
+def segments(source):
+    """
+    Liefert (erste zeile, text, funktion?) fuer die Segmente von
+    ``source``.
+    """
+    line = 1
+    pending = [] # anweisungen seit der letzten funktion
+    start = line
+    for part in chunks(source.splitlines(True), 1):
+        if _DEF.match(part.lstrip()):
+            if pending:
+                yield start, "".join(pending), False
+                pending = []
+            yield line, part, True
+        else:
+            if not pending:
+                start = line
+            pending.append(part)
+        line += part.count("\n")
+    if pending:
+        yield start, "".join(pending), False
+
+class BlockCache(object):
+
+    """
+    Uebersetzte Segmente, Schluessel -> Eintrag (siehe
+    IncrementalCompiler._compile_segment). Auf
+    der Platte liegt der Cache als marshal-Datei neben dem Skript.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Liefert den Cache aus ``filename``; fehlt die Datei oder passt sie
+        nicht zu dieser Version, ist er leer.
+        """
+        try:
+            with open(filename, "rb") as f:
+                magic, version, entries = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return cls()
+        if (magic, version) != (MAGIC, (VERSION, bytecode.VERSION)):
+            return cls()
+        return cls(entries)
+
+    def save(self, filename):
+        """
+        Schreibt den Cache wie bytecode.dump ueber eine temporaere Datei.
+        """
+        tmp = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmp, "wb") as f:
+            marshal.dump((MAGIC, (VERSION, bytecode.VERSION), self.entries),
+                         f, 2)
+        os.rename(tmp, filename)
+
+class _References(Visitor):
+
+    """
+    Sammelt die globalen Variablen, die aufgeloeste Anweisungen lesen,
+    die auf Modulebene zugewiesenen und die aufgerufenen Funktionen.
+    """
+
+    def __init__(self):
+        self.globals = set()
+        self.assigned = set()
+        self.callees = set()
+        self.in_function = False
+
+    def visit_body(self, nodes):
+        for node in nodes:
+            self.visit(node)
+
+    def visit_FunctionDecl(self, node):
+        self.in_function = True
+        self.visit_body(node.body)
+        self.in_function = False
+
+    def visit_ImportStatement(self, node):
+        pass
+
+    def visit_PrintStatement(self, node):
+        self.visit(node.expr)
+
+    visit_ReturnStatement = visit_PrintStatement
+
+    def visit_IfStatement(self, node):
+        self.visit(node.expr)
+        self.visit_body(node.body)
+
+    visit_WhileStatement = visit_IfStatement
+
+    def visit_VarDecl(self, node):
+        if not self.in_function: # sonst eine lokale variable
+            self.assigned.add(str(node.left))
+        self.visit(node.right)
+
+    def visit_BinaryOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_FunctionCall(self, node):
+        self.callees.add(str(node.ident))
+        self.visit_body(node.args)
+
+    def visit_Identifier(self, node):
+        if not node.local:
+            self.globals.add(node.name)
+
+    def visit_Integer(self, node):
+        pass
+
+    visit_Boolean = visit_Integer
+
+class IncrementalCompiler(object):
+
+    def __init__(self, cache=None, parser=None, loader=None, **options):
+        """
+        ``loader`` (linker.Loader) laedt importierte Module, ``options``
+        werden an den Compiler weitergereicht.
+        """
+        self.cache = cache or BlockCache()
+        self.parser = parser
+        self.loader = loader
+        self.options = options
+        self.salt = repr(sorted(options.items()))
+        self.reused = 0 # segmente aus dem cache
+        self.compiled = 0 # neu uebersetzte segmente
+        self.removed_instructions = 0
+
+    def compile(self, source):
+        """
+        Liefert das CodeObject zu ``source``. Danach enthaelt self.cache
+        genau die Segmente dieser Quelle.
+        """
+        try:
+            return self._compile(source)
+        except FALLBACK_ERRORS:
+            module = parse(source, self.parser)
+            module.loader = self.loader
+            compiler = Compiler(module, **self.options)
+            code = compiler.compile()
+            self.removed_instructions = compiler.removed_instructions
+            return code
+
+    def _compile(self, source):
+        self.state = Module([], source) # fuer fehlermeldungen
+        self.state.loader = self.loader
+        self.compiler = Compiler(self.state, **self.options)
+        self.names = {} # label eines einstiegs -> name der funktion
+        self.reused = self.compiled = 0
+        entries = {}
+        module_blocks = [] # (erste zeile, block)
+        function_blocks = []
+        for line, text, is_function in segments(source):
+            if not text.strip():
+                continue
+            key = hashlib.sha1(self.salt + "\0" + text).digest()
+            entry = self.cache.entries.get(key)
+            if entry is not None and self._reuse(entry):
+                self.reused += 1
+            else:
+                entry = self._compile_segment(parse(text, self.parser).ast)
+                self.compiled += 1
+            entries[key] = entry
+            module_block, function_block = entry[:2]
+            if module_block is not None:
+                module_blocks.append((line, module_block))
+            if function_block is not None:
+                function_blocks.append((line, function_block))
+        self.cache = BlockCache(entries)
+        self.removed_instructions = self.compiler.removed_instructions
+        return self.link(module_blocks, function_blocks)
+
+    def _compile_segment(self, nodes):
+        """
+        Uebersetzt die Anweisungen eines Segments und liefert den Eintrag
+        im Cache:
+
+            (modul-block, funktions-block, voraussetzungen, deklariert)
+
+        Ein Block ist None, wenn er leer waere. Die Voraussetzungen sind
+
+            (anzahl globaler variablen, anzahl memo-ids,
+             ((name, slot, typ), ...), ((funktion, argumente,
+             frame-groesse, rein?, bibliotheksfunktion), ...),
+             ((modul, digest), ...))
+
+        mit den globalen Variablen und Funktionen, die das Segment
+        benutzt, jeweils im Zustand vor dem Segment, und den Modulen,
+        die es importiert; die beiden Anzahlen nur, wenn das Segment
+        neue Slots bzw. Memo-Ids belegt, sonst None. Die
+        Bibliotheksfunktion ist der qualifizierte Name einer
+        importierten Funktion, sonst None. Deklariert sind
+
+            (((name, slot, typ), ...), ((name, argumente, frame-groesse,
+             rein?, memo-id), ...))
+        """
+        state = self.state
+        compiler = self.compiler
+        nglobals = len(compiler.globals)
+        nmemoized = len(compiler.memoized)
+        refs = _References()
+        refs.visit_body(nodes)
+        before = dict((ident, self._global(ident)) for ident in refs.assigned)
+
+        for node in nodes:
+            node.resolve(state)
+        refs = _References()
+        refs.visit_body(nodes) # jetzt mit node.local
+        function_buf, module_buf = compiler.generate_chunk(nodes, eof=False)
+        self.names.update(compiler.imported)
+        functions = []
+        libraries = []
+        imported = set()
+        for node in nodes:
+            if isinstance(node, ImportStatement):
+                library = node.library
+                libraries.append((library.name, library.digest))
+                # prueft schon der digest
+                imported.update(name for name, _, _, _, _ in library.functions)
+            elif isinstance(node, FunctionDecl):
+                name = str(node.ident)
+                self.names[compiler.jump_table[name]] = name
+                functions.append((name, tuple(str(arg) for arg in node.args),
+                                  compiler.frame_sizes[name], node.pure,
+                                  compiler.memoized.get(name)))
+        declared = imported.union(name for name, _, _, _, _ in functions)
+
+        used = []
+        for ident in sorted(refs.globals | refs.assigned):
+            used.append((ident,) + before.get(ident, self._global(ident)))
+        callees = []
+        for callee in sorted(refs.callees - declared):
+            callees.append((callee, len(state.functions[callee].args),
+                            compiler.frame_sizes[callee],
+                            state.functions[callee].pure,
+                            self._imported(callee)))
+        if len(compiler.globals) == nglobals:
+            nglobals = None
+        if len(compiler.memoized) == nmemoized:
+            nmemoized = None
+        assigned = tuple((ident,) + self._global(ident)
+                         for ident in sorted(refs.assigned))
+        return (self._block(module_buf), self._block(function_buf),
+                (nglobals, nmemoized, tuple(used), tuple(callees),
+                 tuple(libraries)),
+                (assigned, tuple(functions)))
+
+    def _global(self, ident):
+        """
+        (slot, typ) der globalen Variablen ``ident``, je None, falls es
+        sie nicht gibt.
+        """
+        type_ = None
+        if ident in self.state.table:
+            type_ = repr(self.state.table[ident].type_)
+        return self.compiler.globals.get(ident), type_
+
+    def _imported(self, name):
+        """
+        Der qualifizierte Name, falls ``name`` eine importierte Funktion
+        ist, sonst None.
+        """
+        return self.compiler.imported.get(self.compiler.jump_table[name])
+
+    def _block(self, buf):
+        return linker.block(buf, self.names)
+
+    def _reuse(self, entry):
+        """
+        Uebernimmt das Segment aus ``entry``, falls es an dieser Stelle
+        genauso uebersetzt wuerde, und liefert, ob das der Fall ist.
+        """
+        state = self.state
+        compiler = self.compiler
+        (nglobals, nmemoized, used, callees, libraries), \
+            (assigned, functions) = entry[2:]
+        if nglobals is not None and nglobals != len(compiler.globals):
+            return False
+        if nmemoized is not None and nmemoized != len(compiler.memoized):
+            return False
+        for ident, slot, type_ in used:
+            if self._global(ident) != (slot, type_):
+                return False
+        for callee, nargs, frame_size, pure, imported in callees:
+            function = state.functions.get(callee)
+            if (function is None or len(function.args) != nargs or
+                compiler.frame_sizes[callee] != frame_size or
+                function.pure != pure or self._imported(callee) != imported):
+                return False
+        for name, digest in libraries:
+            if self.loader is None or self.loader.load(name).digest != digest:
+                return False
+        for name, _, _, _, _ in functions:
+            if name in state: # der normale weg meldet den fehler
+                return False
+
+        for name, _ in libraries:
+            node = ImportStatement(Identifier(name, None), None)
+            node.resolve(state)
+            compiler.visit(node)
+        self.names.update(compiler.imported)
+        for ident, slot, type_ in assigned:
+            node = Expression()
+            node.type_ = _TYPES[type_]
+            state.table[ident] = node
+            if slot is not None:
+                compiler.globals[ident] = slot
+        for name, args, frame_size, pure, memo_id in functions:
+            # fuer die aufloesung spaeterer aufrufe genuegt die signatur
+            decl = FunctionDecl(Identifier(name, None),
+                                [Identifier(arg, None) for arg in args], [],
+                                None)
+            decl.pure = pure
+            state.functions[name] = decl
+            label = compiler._gen_label()
+            compiler.jump_table[name] = label
+            compiler.frame_sizes[name] = frame_size
+            if memo_id is not None:
+                compiler.memoized[name] = memo_id
+            self.names[label] = name
+        return True
+
+    def link(self, module_blocks, function_blocks):
+        """
+        Fuegt die Bloecke zum CodeObject zusammen.
+        """
+        compiler = self.compiler
+        optimize = compiler.opt_level >= 2
+        code = [(PUSH_FRAME, len(compiler.globals))]
+        lines = {}
+        entries = {} # name -> index des einstiegs
+        calls = [] # (index, name)
+        branches = [] # spruenge ans ende ihres modul-blocks
+        labeled = True # beginnt hier ein sprungziel?
+        for line, block in module_blocks:
+            if not block[0]: # nur eine zeile, z.B. die des "def"
+                self._place(block, line, code, lines, entries, calls)
+                continue
+            merge = optimize and not labeled and self._merges(code, block)
+            base, jumps = self._place(block, line, code, lines, entries,
+                                      calls, merge)
+            end = len(code)
+            labeled = False
+            for pos in jumps:
+                if code[pos][1] == end:
+                    branches.append(pos)
+                    labeled = True
+        code.append((EOF, None))
+        for line, block in function_blocks:
+            self._place(block, line, code, lines, entries, calls)
+        functions = {}
+        for name, entry in entries.items():
+            functions[name] = (entry, compiler.frame_sizes[name],
+                               len(self.state.functions[name].args))
+        # die peephole-optimierung kennt den code der bibliotheken nicht
+        own = [pos for pos, name in calls if name in entries]
+        memoized = dict(compiler.memoized)
+        calls.extend(linker.append(code, linker.closure(compiler.libraries),
+                                   functions, memoized, lines))
+        linker.resolve(code, calls, functions)
+
+        if optimize:
+            # das jump-threading der peephole-optimierung ueber die
+            # grenzen der bloecke hinweg
+            for pos in branches + own:
+                op, target = code[pos]
+                if op != PUSH_ADDRESS:
+                    code[pos] = (op, _thread(code, target))
+        return CodeObject.from_instructions(code, functions,
+                                            dict(compiler.globals), lines,
+                                            memoized)
+
+    def _merges(self, code, block):
+        """
+        True, falls der Block mit LOAD_FAST x beginnt, ``code`` mit
+        STORE_FAST x endet und kein Sprung auf den Anfang des Blocks
+        zielt; die beiden werden dann zu DUP_STORE_FAST x.
+        """
+        instructions, jumps = block[:2]
+        op, arg = code[-1]
+        return (op == STORE_FAST and instructions[0] == (LOAD_FAST, arg) and
+                not any(instructions[pos][1] == 0 for pos in jumps))
+
+    def _place(self, block, line, code, lines, entries, calls, merge=False):
+        """
+        Haengt ``block`` an ``code`` an; liefert den Index, ab dem er
+        liegt, und die verschobenen Positionen seiner Spruenge.
+        """
+        instructions, jumps, external, block_lines, exports = block
+        base = len(code)
+        if merge:
+            base -= 1
+            code[base] = (DUP_STORE_FAST, code[base][1])
+            code.extend(instructions[1:])
+        else:
+            code.extend(instructions)
+        moved = []
+        for pos in jumps:
+            op, target = code[base + pos]
+            code[base + pos] = (op, base + target)
+            moved.append(base + pos)
+        for pos, name in external:
+            calls.append((base + pos, name))
+        for offset, number in block_lines:
+            if merge and offset == 0:
+                offset = 1 # die zeile gehoert zur folgenden instruktion
+            lines[base + offset] = line - 1 + number
+        for name, offset in exports:
+            entries[name] = base + offset
+        return base, moved
+
+def _thread(code, target):
+    """
+    Folgt JUMPs ab ``target`` bis zum eigentlichen Ziel.
+    """
+    seen = set()
+    while code[target][0] == JUMP and not target in seen:
+        seen.add(target)
+        target = code[target][1]
+    return target
@@ -1,101 +1,500 @@
 #coding: utf-8
-from opcodes import operations
-from utils import newline
-from scope import Scope
+from opcodes import binary_operations, opname
+from opcodes import (LOAD_CONST, LOAD_FAST, STORE_FAST, DUP_STORE_FAST,
+                     LOAD_GLOBAL, CJUMP, JUMP, PUSH_FRAME, POP_FRAME,
+                     PUSH_ADDRESS, RET, PRINT, EOF, LOAD_LOAD, INC_LOCAL,
+                     JUMP_IF_LT, JUMP_IF_GT, JUMP_IF_EQ, JUMP_IF_NOT_LT,
+                     JUMP_IF_NOT_GT, JUMP_IF_NOT_EQ, MEMO_LOOKUP, MEMO_STORE,
+                     ENTER, ADD_INT, SUB_INT, MUL_INT, DIV_INT, LT_INT,
+                     GT_INT, EQ_INT)
+from codeobject import CodeObject
+from decoder import decode
+from memo import Memo, DEFAULT_MEMO_SIZE
+from output import OutputSink
+import errors
 import sys
 
 class Interpreter(object):
 
-    def __init__(self, code):
+    def __init__(self, code, decoded=False, profile=None,
+                 memo_size=DEFAULT_MEMO_SIZE, jit=None, output=None):
+        """
+        ``code`` ist ein CodeObject, eine Liste von Zeilen in textueller
+        Form oder mit ``decoded`` bereits eine Liste von (opcode, operand).
+        Mit ``profile`` (ein profiler.Profile) wird jede ausgefuehrte
+        Instruktion gezaehlt und gemessen. ``memo_size`` begrenzt die
+        Memo-Tabellen memoisierter Funktionen. ``jit`` (ein jit.JIT)
+        uebernimmt bei ENTER heisse Funktionen. PRINT schreibt nach
+        ``output`` (eine output.OutputSink), ohne gepuffert nach
+        sys.stdout.
+        """
+        self.memo_names = {} # memo-id -> funktionsname
+        if isinstance(code, CodeObject):
+            self.memo_names = dict((memo_id, name) for name, memo_id in
+                                   code.memoized.items())
+            code = code.instructions()
+        elif not decoded:
+            code = decode(code)
         self.code = code
+        # index des EOF hinter dem modul-code und die liste, in der er
+        # gesucht wurde (siehe _eof_index)
+        self.eof = None
+        self.eof_code = None
+        self.profile = profile
+        self.globals = None # modul-frame des letzten run()
+        self.memo_size = memo_size
+        # memo-id -> Memo, bleiben ueber mehrere run() und call() erhalten
+        self.memos = {}
+        self.jit = jit
+        self.output = output or OutputSink()
+
+    def memo_stats(self):
+        """
+        Liefert je memoisierter Funktion (Name, ohne CodeObject die
+        Memo-Id) ein Tupel (Treffer, Fehlschlaege, Eintraege).
+        """
+        return dict((self.memo_names.get(memo_id, memo_id),
+                     (memo.hits, memo.misses, len(memo)))
+                    for memo_id, memo in self.memos.items())
 
     def run(self):
-        if len(self.code) == 0:
+        if not self.code:
             return
-
-        stack = []
-        table = Scope() 
         addresses = []
-        #print self.code
-        i = 0
-
-        while i < len(self.code):
-            current = self.code[i]
-            if current == 'LOAD_CONST':
-                i += 1
-                current = self.code[i]
-                stack.append(current)
-            elif current == 'STORE':
-                try:
-                    i += 1
-                    current = self.code[i]
-                    table[current] = stack.pop()
-                except IndexError:
-                    msg = "Index: %s - Current: %s" % (str(i), str(current))
-                    raise errors.EmptyStackException(msg)
-            elif current == 'LOAD':
-                i += 1 
-                current = self.code[i]
-                stack.append(table[current])
-            elif current == 'PRINT':
-                print stack.pop()
-            elif current == 'CJUMP':
-                """
-                JNE
-                <absoluter offset>
-                Springt zum offset, falls der aktuelle Wert auf dem Stack 
-                ´False´ ist. 
-                """
-                i += 1
-                offset = int(self.code[i])
-                condition = stack.pop()
-                if not condition:
-                    i = offset # sprung
-                    continue
-            elif current == 'JUMP':
-                """
-                JUMP
-                <absoluter offset>
-                Bedingungsloser Sprung zum offset.
-                """
-                i += 1
-                offset = int(self.code[i])
-                i = offset # sprung
-                continue
-            elif current in operations:
+        if self.profile is None:
+            try:
+                self.globals = self._execute(self.code, addresses)
+            finally:
+                self.output.flush()
+            return
+        code = self.profile.instrument(self.code, addresses)
+        try:
+            self.globals = self._execute(code, addresses)
+        finally:
+            code.stop()
+            self.output.flush()
+
+    def call(self, entry, frame_size, args):
+        """
+        Ruft die Funktion mit dem Einstieg ``entry`` (Instruktions-Index)
+        und einem Frame mit ``frame_size`` Slots auf und liefert ihren
+        Rueckgabewert. Die globalen Variablen stammen aus dem letzten
+        run(); ohne vorherigen run() sind sie nicht belegt.
+        """
+        code = self.code
+        module_frame = self.globals
+        if module_frame is None:
+            module_frame = [None] * code[0][1] # PUSH_FRAME <globals>
+        eof = self._eof_index()
+        stack = list(reversed(args))
+        # der Ruecksprung landet auf dem EOF hinter dem Modul-Code
+        try:
+            self._execute(code, [eof], entry, stack, [None] * frame_size,
+                          [[], module_frame])
+        finally:
+            self.output.flush()
+        return stack.pop()
+
+    def _eof_index(self):
+        """
+        Sucht den EOF nur beim ersten call() und erneut, falls self.code
+        inzwischen eine andere Liste ist.
+        """
+        code = self.code
+        if self.eof_code is not code:
+            self.eof = [op for op, arg in code].index(EOF)
+            self.eof_code = code
+        return self.eof
+
+    def run_chunk(self, pc, module_frame):
+        """
+        Fuehrt Modul-Code ab ``pc`` bis zum naechsten EOF aus, mit
+        ``module_frame`` als Modul-Frame. Fuer die Streaming-Ausfuehrung,
+        bei der der Instruktionsstrom stueckweise waechst (siehe stream).
+        """
+        try:
+            self._execute(self.code, [], pc, [], module_frame, [[]])
+        finally:
+            self.output.flush()
+
+    def _execute(self, code, addresses, pc=0, stack=None, frame=None,
+                 frames=None):
+        """
+        Lokale Variablen liegen in Slots des aktuellen Frames (einer Liste).
+        Der erste PUSH_FRAME des Programms legt den Modul-Frame an, der 
+        damit immer frames[1] ist, sobald eine Funktion laeuft.
+
+        LOAD_FAST, LOAD_CONST und STORE_FAST stehen direkt in der
+        Schleife, jeder andere Opcode hat einen Handler in einer Tabelle
+        (siehe _handlers). Der Dispatch kostet damit hoechstens drei
+        Vergleiche und einen Aufruf, unabhaengig von der Reihenfolge der
+        Opcodes.
+
+        Opcodes ausserhalb der Tabelle fallen erst beim Zugriff auf; der
+        Fehler wird dann zur InvalidOpcodeException, die Schleife selbst
+        prueft nichts.
+
+        Liefert beim EOF den aktuellen Frame, am Ende des Programms also
+        den Modul-Frame.
+        """
+        if stack is None:
+            stack = []
+        if frame is None:
+            frame = []
+        if frames is None:
+            frames = []
+        frames.append(frame) # der aktuelle frame ist frames[-1]
+        handlers = self._handlers(code, stack, frames, addresses)
+        push = stack.append
+        pop = stack.pop
+        op = EOF # ein gueltiger opcode, bis die erste instruktion geholt ist
+        try:
+            while True:
+                op, arg = code[pc]
+                pc += 1
+                # die haeufigsten Opcodes ohne Funktionsaufruf; Handler
+                # koennen den Frame wechseln, daher wird er danach neu
+                # geholt
+                if op == LOAD_FAST:
+                    value = frame[arg]
+                    if value is None:
+                        raise _unassigned()
+                    push(value)
+                elif op == LOAD_CONST:
+                    push(arg)
+                elif op == STORE_FAST and stack:
+                    frame[arg] = pop()
+                else:
+                    pc = handlers[op](arg, pc)
+                    frame = frames[-1]
+        except _Halt:
+            return frames.pop()
+        except (IndexError, TypeError):
+            if not (isinstance(op, int) and 0 <= op < len(handlers)):
+                raise _invalid_opcode(op, pc)
+            raise
+
+    def _handlers(self, code, stack, frames, addresses):
+        """
+        Liefert die Dispatch-Tabelle opcode -> handler(operand, pc) fuer
+        eine Ausfuehrung von ``code`` auf ``stack``, ``frames`` und
+        ``addresses``.
+        ``pc`` zeigt bereits hinter die Instruktion, der Handler liefert
+        den pc der naechsten.
+        """
+        push = stack.append
+        pop = stack.pop
+        memos = self.memos
+        jit = self.jit
+        output = self.output
+        pending = output.pending # siehe output.OutputSink
+        append = pending.append
+        batch = output.batch
+        compiled = jit.compiled if jit is not None else {}
+
+        def load_const(arg, pc):
+            push(arg)
+            return pc
+
+        def load_fast(arg, pc):
+            value = frames[-1][arg]
+            if value is None:
+                raise _unassigned()
+            push(value)
+            return pc
+
+        def store_fast(arg, pc):
+            try:
+                frames[-1][arg] = pop()
+            except IndexError:
+                msg = "Index: %s - Current: %s" % (str(pc - 1),
+                                                   opname[STORE_FAST])
+                raise errors.EmptyStackException(msg)
+            return pc
+
+        def dup_store_fast(arg, pc):
+            frames[-1][arg] = stack[-1]
+            return pc
+
+        def load_load(arg, pc):
+            frame = frames[-1]
+            first = frame[arg[0]]
+            second = frame[arg[1]]
+            if first is None or second is None:
+                raise _unassigned()
+            push(first)
+            push(second)
+            return pc
+
+        def inc_local(arg, pc):
+            frame = frames[-1]
+            if frame[arg[0]] is None:
+                raise _unassigned()
+            frame[arg[0]] += arg[1]
+            return pc
+
+        def load_global(arg, pc):
+            value = frames[1][arg]
+            if value is None:
+                raise _unassigned()
+            push(value)
+            return pc
+
+        def binary(op):
+            operation = binary_operations[op]
+            def handler(arg, pc):
                 try:
-                    val1 = int(stack.pop())
-                    val2 = int(stack.pop())
+                    val1 = int(pop())
+                    val2 = int(pop())
                 except ValueError:
-                    msg = """ Index: %s - Invalid operand for arithmetical 
-                              operation: %s %s""" % (str(val1), str(val2))
+                    msg = """Index: %s - Invalid operand for arithmetical
+                             operation: %s""" % (str(pc - 1), opname[op])
                     raise errors.InvalidOperandException(msg)
                 except IndexError:
-                    msg = "Index: %s - Current: %s" % (str(i), str(current))
+                    msg = "Index: %s - Current: %s" % (str(pc - 1),
+                                                       opname[op])
                     raise errors.EmptyStackException(msg)
-                res = operations[current](val1, val2)
-                stack.append(res)
-            elif current == "EOF":
-                return
-            elif current == "PUSH_SCOPE":
-                table.push({})
-            elif current == "POP_SCOPE":
-                table.pop()
-            elif current == "PUSH_ADDRESS":
-                i += 1
-                offset = int(self.code[i])
-                addresses.append(offset)
-            elif current == "RET":
-                assert addresses # Return without address doesn't make sense ;)
-                offset = addresses.pop()
-                i = offset
-            else:
-                try:
-                    int(current)
-                except ValueError:
-                    msg = """Index: %s - 
-                             Invalid Opcode: %s""" % (str(i), str(current))
-                    raise errors.InvalidOpcodeException(msg) 
-            i += 1
-            #print stack
-            #print table
+                push(operation(val1, val2))
+                return pc
+            return handler
+
+        def empty_stack(op, pc):
+            msg = "Index: %s - Current: %s" % (str(pc - 1), opname[op])
+            return errors.EmptyStackException(msg)
+
+        # die *_INT-Opcodes: der linke Operand liegt oben
+        def add_int(arg, pc):
+            try:
+                push(pop() + pop())
+            except IndexError:
+                raise empty_stack(ADD_INT, pc)
+            return pc
+
+        def sub_int(arg, pc):
+            try:
+                push(pop() - pop())
+            except IndexError:
+                raise empty_stack(SUB_INT, pc)
+            return pc
+
+        def mul_int(arg, pc):
+            try:
+                push(pop() * pop())
+            except IndexError:
+                raise empty_stack(MUL_INT, pc)
+            return pc
+
+        def div_int(arg, pc):
+            try:
+                push(pop() / pop())
+            except IndexError:
+                raise empty_stack(DIV_INT, pc)
+            return pc
+
+        def lt_int(arg, pc):
+            try:
+                push(pop() < pop())
+            except IndexError:
+                raise empty_stack(LT_INT, pc)
+            return pc
+
+        def gt_int(arg, pc):
+            try:
+                push(pop() > pop())
+            except IndexError:
+                raise empty_stack(GT_INT, pc)
+            return pc
+
+        def eq_int(arg, pc):
+            try:
+                push(pop() == pop())
+            except IndexError:
+                raise empty_stack(EQ_INT, pc)
+            return pc
+
+        def jump_if_lt(arg, pc):
+            if pop() < pop():
+                return arg
+            return pc
+
+        def jump_if_gt(arg, pc):
+            if pop() > pop():
+                return arg
+            return pc
+
+        def jump_if_eq(arg, pc):
+            if pop() == pop():
+                return arg
+            return pc
+
+        def jump_if_not_lt(arg, pc):
+            if pop() < pop():
+                return pc
+            return arg
+
+        def jump_if_not_gt(arg, pc):
+            if pop() > pop():
+                return pc
+            return arg
+
+        def jump_if_not_eq(arg, pc):
+            if pop() == pop():
+                return pc
+            return arg
+
+        def cjump(arg, pc):
+            """
+            CJUMP
+            <index>
+            Springt zum Index, falls der aktuelle Wert auf dem Stack
+            ´False´ ist.
+            """
+            if not pop():
+                return arg # sprung
+            return pc
+
+        def jump(arg, pc):
+            """
+            JUMP
+            <index>
+            Bedingungsloser Sprung zum Index.
+            """
+            return arg
+
+        def push_frame(arg, pc):
+            frames.append([None] * arg)
+            return pc
+
+        def pop_frame(arg, pc):
+            frames.pop()
+            return pc
+
+        def push_address(arg, pc):
+            addresses.append(arg)
+            return pc
+
+        def ret(arg, pc):
+            assert addresses # Return without address doesn't make sense ;)
+            return addresses.pop()
+
+        def print_(arg, pc):
+            append(pop())
+            if len(pending) >= batch:
+                output.collect()
+            return pc
+
+        def eof(arg, pc):
+            raise _Halt()
+
+        def memo_lookup(arg, pc):
+            """
+            MEMO_LOOKUP
+            <memo-id>
+            <anzahl argumente>
+            <key-slot>
+            Bei einem Treffer ersetzt das gespeicherte Ergebnis die
+            Argumente auf dem Stack und die Funktion kehrt sofort
+            zurueck.
+            """
+            memo_id, nargs, slot = arg
+            key = tuple(stack[-nargs:]) if nargs else ()
+            if not memo_id in memos:
+                memos[memo_id] = Memo(self.memo_size)
+            value = memos[memo_id].get(key)
+            if value is None:
+                frames[-1][slot] = key
+                return pc
+            if nargs:
+                del stack[-nargs:]
+            push(value)
+            frames.pop()
+            return addresses.pop()
+
+        def memo_store(arg, pc):
+            memos[arg[0]].store(frames[-1][arg[1]], stack[-1])
+            return pc
+
+        def enter(arg, pc):
+            """
+            ENTER
+            Ist die Funktion bereits nach Python uebersetzt, ersetzt
+            deren Ergebnis die Argumente auf dem Stack und die
+            Funktion kehrt sofort zurueck. Scheitert die
+            Python-Funktion, laeuft der Aufruf wie bisher weiter.
+            """
+            native = compiled.get(pc - 1)
+            if native is None:
+                if jit is not None:
+                    jit.hit(pc - 1)
+                return pc
+            function, nargs = native
+            args = stack[len(stack) - nargs:]
+            args.reverse() # das erste argument liegt oben
+            try:
+                value = function(frames[1], *args)
+            except Exception:
+                jit.disable(pc - 1)
+                return pc
+            del stack[len(stack) - nargs:]
+            push(value)
+            frames.pop()
+            return addresses.pop()
+
+        def invalid(arg, pc):
+            raise _invalid_opcode(code[pc - 1][0], pc)
+
+        # die zweite Haelfte faengt negative Opcodes ab, handlers[-1] ist
+        # ihr letzter Eintrag
+        handlers = [invalid] * (2 * (max(opname) + 1))
+        for op in binary_operations:
+            handlers[op] = binary(op)
+        handlers[ADD_INT] = add_int
+        handlers[SUB_INT] = sub_int
+        handlers[MUL_INT] = mul_int
+        handlers[DIV_INT] = div_int
+        handlers[LT_INT] = lt_int
+        handlers[GT_INT] = gt_int
+        handlers[EQ_INT] = eq_int
+        handlers[JUMP_IF_LT] = jump_if_lt
+        handlers[JUMP_IF_GT] = jump_if_gt
+        handlers[JUMP_IF_EQ] = jump_if_eq
+        handlers[JUMP_IF_NOT_LT] = jump_if_not_lt
+        handlers[JUMP_IF_NOT_GT] = jump_if_not_gt
+        handlers[JUMP_IF_NOT_EQ] = jump_if_not_eq
+        handlers[LOAD_CONST] = load_const
+        handlers[LOAD_FAST] = load_fast
+        handlers[STORE_FAST] = store_fast
+        handlers[DUP_STORE_FAST] = dup_store_fast
+        handlers[LOAD_LOAD] = load_load
+        handlers[INC_LOCAL] = inc_local
+        handlers[LOAD_GLOBAL] = load_global
+        handlers[CJUMP] = cjump
+        handlers[JUMP] = jump
+        handlers[PUSH_FRAME] = push_frame
+        handlers[POP_FRAME] = pop_frame
+        handlers[PUSH_ADDRESS] = push_address
+        handlers[RET] = ret
+        handlers[PRINT] = print_
+        handlers[EOF] = eof
+        handlers[MEMO_LOOKUP] = memo_lookup
+        handlers[MEMO_STORE] = memo_store
+        handlers[ENTER] = enter
+        return handlers
+
+def _unassigned():
+    """
+    Ein Slot ist None, bis ihm etwas zugewiesen wird; None selbst ist
+    kein Wert der Sprache. Die Meldung ist dieselbe wie bei der
+    Register-Maschine.
+    """
+    return errors.VarAccException("Reference before assignment")
+
+def _invalid_opcode(op, pc):
+    msg = "Index: %s - Invalid Opcode: %s" % (str(pc - 1), op)
+    return errors.InvalidOpcodeException(msg)
+
+class _Halt(Exception):
+
+    """
+    Beendet die Dispatch-Schleife beim EOF.
+    """
@@ -0,0 +1,236 @@
+# coding: utf-8
+
+"""
+Gestufte Ausfuehrung: heisse Funktionen laufen als Python-Funktionen.
+
+Mit Compiler(tiered=True) beginnt jede Funktion mit ENTER. Der
+Interpreter meldet jeden Aufruf an JIT.hit(); nach ``threshold`` Aufrufen
+wird die FunctionDecl der Funktion samt allen Funktionen, die sie
+aufruft, in Python-Quelltext uebersetzt und mit compile() zu
+Python-Bytecode. Ab dann ersetzt ENTER den Aufruf durch einen direkten
+Aufruf der Python-Funktion.
+
+    def fak(n):                     def f_fak(g, v_n):
+        if n < 2:                       if (v_n < 2):
+            return 1                        return 1
+        end                             return (v_n * f_fak(g, (v_n - 1)))
+        return n * fak(n - 1)
+    end
+
+``g`` ist der Modul-Frame, globale Variablen sind g[slot]. Endaufrufe
+der Funktion selbst werden zu einer Schleife um den Rumpf.
+
+Uebersetzt werden nur Funktionen ohne print, die nur solche Funktionen
+aufrufen; sie haben keine Seiteneffekte (globale Variablen kann eine
+Funktion nicht veraendern). Wirft die Python-Funktion eine Ausnahme,
+z.B. bei zu tiefer Rekursion, fuehrt der Interpreter den Aufruf deshalb
+einfach selbst aus und bleibt fuer diese Funktion dabei; Fehler im
+Payne-Programm zeigen sich so genau wie ohne JIT.
+"""
+
+from nodes import FunctionCall, IfStatement, ReturnStatement, WhileStatement
+from visitor import Visitor
+
+DEFAULT_THRESHOLD = 50 # aufrufe bis zur uebersetzung
+
+class Unsupported(Exception):
+    pass
+
+def _local(name):
+    return "v_" + str(name)
+
+def _function(name):
+    return "f_" + str(name)
+
+def _unassigned():
+    raise Unsupported("reference before assignment")
+
+class _Translator(Visitor):
+
+    """
+    Erzeugt den Python-Quelltext einer aufgeloesten FunctionDecl.
+    """
+
+    def __init__(self, decl, globals):
+        self.decl = decl
+        self.globals = globals # name -> slot im modul-frame
+        self.callees = set() # namen der aufgerufenen funktionen
+        self.lines = []
+        self.depth = 1
+        self.loop = False # endaufrufe als schleife?
+
+    def translate(self):
+        decl = self.decl
+        args = ["g"] + [_local(arg) for arg in decl.args]
+        self.lines.append("def %s(%s):" % (_function(decl.ident),
+                                           ", ".join(args)))
+        # ein "continue" innerhalb eines while gehoerte zur falschen
+        # schleife, dann bleibt der endaufruf ein aufruf
+        calls = self._tail_calls(decl.body)
+        self.loop = bool(calls) and not any(calls)
+        if self.loop:
+            self._line("while True:")
+            self.depth += 1
+        self._body(decl.body)
+        return "\n".join(self.lines) + "\n"
+
+    def _tail_calls(self, body, in_while=False):
+        """
+        Liefert fuer jeden Endaufruf in ``body``, ob er in einem while
+        steht.
+        """
+        found = []
+        for node in body:
+            if isinstance(node, WhileStatement):
+                found.extend(self._tail_calls(node.body, True))
+            elif isinstance(node, IfStatement):
+                found.extend(self._tail_calls(node.body, in_while))
+            elif self._is_tail_call(node):
+                found.append(in_while)
+        return found
+
+    def _is_tail_call(self, node):
+        return (isinstance(node, ReturnStatement) and
+                isinstance(node.expr, FunctionCall) and
+                str(node.expr.ident) == str(self.decl.ident))
+
+    def _line(self, text):
+        self.lines.append("    " * self.depth + text)
+
+    def _body(self, nodes):
+        if not nodes:
+            self._line("pass")
+        for node in nodes:
+            self.visit(node)
+
+    def default(self, node, *args):
+        raise Unsupported(node.__class__.__name__)
+
+    def visit_VarDecl(self, node):
+        self._line("%s = %s" % (_local(node.left), self.visit(node.right)))
+
+    def visit_IfStatement(self, node):
+        self._line("if %s:" % (self.visit(node.expr)))
+        self.depth += 1
+        self._body(node.body)
+        self.depth -= 1
+
+    def visit_WhileStatement(self, node):
+        self._line("while %s:" % (self.visit(node.expr)))
+        self.depth += 1
+        self._body(node.body)
+        self.depth -= 1
+
+    def visit_ReturnStatement(self, node):
+        if self.loop and self._is_tail_call(node):
+            names = [_local(arg) for arg in self.decl.args]
+            values = [self.visit(arg) for arg in node.expr.args]
+            if names:
+                self._line("%s = %s" % (", ".join(names), ", ".join(values)))
+            self._line("continue")
+        else:
+            self._line("return %s" % (self.visit(node.expr)))
+
+    def visit_FunctionCall(self, node):
+        self.callees.add(str(node.ident))
+        args = ["g"] + [self.visit(arg) for arg in node.args]
+        return "%s(%s)" % (_function(node.ident), ", ".join(args))
+
+    def visit_BinaryOp(self, node):
+        return "(%s %s %s)" % (self.visit(node.left), node.op,
+                               self.visit(node.right))
+
+    def visit_Identifier(self, node):
+        """
+        Eine lokale Variable ohne Zuweisung ist ein UnboundLocalError,
+        eine globale ein Fehler ueber _unassigned(); der Interpreter
+        wiederholt den Aufruf dann und meldet ihn.
+        """
+        if node.local:
+            return _local(node.name)
+        slot = self.globals[node.name]
+        return "(g[%d] if g[%d] is not None else _unassigned())" % (slot, slot)
+
+    def visit_Integer(self, node):
+        return "(%r)" % (node.val)
+
+    def visit_Boolean(self, node):
+        return str(node.val == "True") # der Parser liefert Strings
+
+class JIT(object):
+
+    def __init__(self, module, code, threshold=DEFAULT_THRESHOLD):
+        """
+        ``module`` ist das aufgeloeste und uebersetzte Modul, ``code`` das
+        daraus erzeugte CodeObject.
+        """
+        self.decls = module.functions # name -> FunctionDecl
+        self.globals = code.globals
+        self.threshold = threshold
+        self.entries = {} # instruktions-index des ENTER -> name
+        self.nargs = {}
+        for name, (entry, frame_size, nargs) in code.functions.items():
+            self.entries[entry] = name
+            self.nargs[name] = nargs
+        self.counts = {} # instruktions-index -> aufrufe
+        self.compiled = {} # instruktions-index -> (funktion, anzahl args)
+        self.native = {} # name -> python-funktion
+        self.unsupported = set() # namen
+        self.fallbacks = [] # namen, deren python-funktion scheiterte
+        self.namespace = {"_unassigned": _unassigned}
+
+    def hit(self, entry):
+        """
+        Zaehlt einen Aufruf der Funktion ab ``entry``; beim Erreichen der
+        Schwelle wird sie uebersetzt.
+        """
+        count = self.counts.get(entry, 0) + 1
+        self.counts[entry] = count
+        if count == self.threshold:
+            name = self.entries[entry]
+            function = self.compile(name)
+            if function is not None:
+                self.compiled[entry] = (function, self.nargs[name])
+
+    def disable(self, entry):
+        """
+        Die Python-Funktion ab ``entry`` ist gescheitert, die Funktion
+        bleibt ab jetzt im Interpreter.
+        """
+        del self.compiled[entry]
+        self.fallbacks.append(self.entries[entry])
+
+    def compile(self, name):
+        """
+        Liefert die Python-Funktion zu ``name`` oder None, falls sie oder
+        eine der von ihr aufgerufenen Funktionen nicht uebersetzbar ist.
+        """
+        if name in self.native:
+            return self.native[name]
+        sources = {}
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            if current in sources or current in self.native:
+                continue
+            if current in self.unsupported:
+                self.unsupported.add(name)
+                return None
+            decl = self.decls.get(current)
+            if decl is None or not decl.body:
+                # importiert, von der funktion ist nur die signatur bekannt
+                self.unsupported.update((current, name))
+                return None
+            translator = _Translator(decl, self.globals)
+            try:
+                sources[current] = translator.translate()
+            except Unsupported:
+                self.unsupported.update((current, name))
+                return None
+            pending.extend(translator.callees)
+
+        source = "".join(sources[n] for n in sorted(sources))
+        exec compile(source, "<jit %s>" % (name), "exec") in self.namespace
+        for n in sources:
+            self.native[n] = self.namespace[_function(n)]
+        return self.native[name]
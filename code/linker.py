@@ -0,0 +1,309 @@
+# coding: utf-8
+
+"""
+Getrennte Uebersetzung und Binden von Modulen.
+
+"import name" macht die Funktionen aus name.pay im Programm verfuegbar.
+Eine solche Bibliothek darf nur Funktionen und weitere Imports
+enthalten. Sie wird fuer sich uebersetzt, in ein verschiebbares Objekt
+(Library) mit dem Code ihrer Funktionen als Block im selben Format wie
+bei der inkrementellen Uebersetzung (siehe block()):
+
+    code        Instruktionen (opcode, operand) ab Index 0
+    jumps       Positionen der Sprungziele innerhalb des Blocks
+    external    (position, name) fuer Aufrufe ausserhalb des Blocks,
+                bei Funktionen anderer Bibliotheken mit qualifiziertem
+                Namen ("modul.funktion")
+    lines       (index, zeile), bei Bibliotheken leer: die Zeilen
+                gehoeren zu einer anderen Datei
+    exports     (name, index) fuer die Einstiege der Funktionen
+
+Die Memo-Ids einer Bibliothek zaehlen ab 0. append() haengt die
+Bibliotheken eines Programms hinter dessen Code, verschiebt Sprungziele
+und Memo-Ids und traegt die Funktionen unter ihrem qualifizierten Namen
+in die Symboltabelle ein, resolve() setzt danach die Einstiege in die
+offenen Aufrufe ein. In der Zeilentabelle des Programms beginnt an der
+Stelle jeder Bibliothek ein Eintrag NO_LINE, ihr Code wird also keiner
+Zeile des Skripts zugeordnet.
+
+Der Loader legt uebersetzte Bibliotheken als .payo neben die Quelle.
+Die Datei gilt, solange Quelle und Compiler-Optionen dieselben sind und
+die importierten Bibliotheken noch ihren Digest haben; jedes Skript,
+das die Bibliothek importiert, bindet dann nur noch ihren Code.
+"""
+
+import marshal
+import os
+import re
+
+import bytecode
+import compiler # compiler importiert dieses modul
+import errors
+import symbol
+from nodes import FunctionDecl, ImportStatement
+from opcodes import hasjump, MEMO_LOOKUP, MEMO_STORE
+
+MAGIC = "PAYO"
+VERSION = 1
+EXTENSION = ".payo"
+SOURCE_EXTENSION = ".pay"
+PATH_ENV = "PAYNE_PATH"
+NO_LINE = 0 # zeilen zaehlen ab 1
+
+_IMPORT = re.compile(r"\bimport\s+([a-zA-Z_][a-zA-Z0-9_]*)")
+
+def object_path(fname):
+    return os.path.splitext(fname)[0] + EXTENSION
+
+def imports(source):
+    """
+    Die Namen aller Module, die ``source`` moeglicherweise importiert;
+    auch Treffer in Kommentaren, es koennen also zu viele sein.
+    """
+    return sorted(set(_IMPORT.findall(source)))
+
+def block(buf, names):
+    """
+    Assembliert den Writer ``buf`` zu einem verschiebbaren Block; Marker
+    auf Labels ausserhalb des Buffers werden ueber ``names`` (label ->
+    name) zu externen Referenzen. Liefert None, falls der Block weder
+    Code noch Zeilen enthaelt.
+    """
+    external = {}
+    code = buf.assemble(0, None, external)
+    if not code and not buf.lines:
+        return None
+    jumps = tuple(pos for pos, (op, arg) in enumerate(code)
+                  if op in hasjump and not pos in external)
+    return (tuple(code), jumps,
+            tuple((pos, names[label])
+                  for pos, label in sorted(external.items())),
+            tuple(sorted(buf.lines.items())),
+            tuple((names[label], offset)
+                  for label, offset in buf.offsets.items()
+                  if label in names))
+
+class Library(object):
+
+    """
+    Eine uebersetzte Bibliothek.
+    """
+
+    def __init__(self, name, key, digest, functions, block, imports):
+        self.name = name
+        self.key = key # digest ueber quelle und optionen
+        self.digest = digest # dazu die digests der importierten
+        # ((name, argumente, frame-groesse, rein?, memo-id), ...)
+        self.functions = functions
+        self.block = block
+        self.imports = imports # ((name, digest), ...), direkt importiert
+        self.dependencies = [] # die Library-Objekte zu imports
+
+    def qualify(self, function):
+        return "%s.%s" % (self.name, function)
+
+    @classmethod
+    def read(cls, filename):
+        """
+        Liefert die Bibliothek aus ``filename`` oder None, falls die Datei
+        fehlt oder nicht zu dieser Version passt.
+        """
+        try:
+            with open(filename, "rb") as f:
+                magic, version, fields = marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+        if (magic, version) != (MAGIC, (VERSION, bytecode.VERSION)):
+            return None
+        return cls(*fields)
+
+    def write(self, filename):
+        """
+        Schreibt die Bibliothek wie bytecode.dump ueber eine temporaere
+        Datei.
+        """
+        fields = (self.name, self.key, self.digest, self.functions,
+                  self.block, self.imports)
+        tmp = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmp, "wb") as f:
+            marshal.dump((MAGIC, (VERSION, bytecode.VERSION), fields), f, 2)
+        os.rename(tmp, filename)
+
+class Loader(object):
+
+    def __init__(self, path=(), parser=None, **options):
+        """
+        Module werden in den Verzeichnissen ``path`` gesucht, danach in
+        denen aus $PAYNE_PATH. ``options`` werden an den Compiler
+        weitergereicht.
+        """
+        self.path = list(path)
+        self.path.extend(p for p in os.environ.get(PATH_ENV, "").split(
+                                                                os.pathsep)
+                         if p)
+        self.parser = parser
+        self.options = options
+        self.libraries = {} # name -> Library
+        self.loading = [] # die gerade geladenen, fuer zyklische imports
+        self.reused = 0 # aus .payo-dateien
+        self.compiled = 0 # neu uebersetzt
+
+    def find(self, name):
+        for directory in self.path:
+            fname = os.path.join(directory, name + SOURCE_EXTENSION)
+            if os.path.isfile(fname):
+                return fname
+        raise errors.ImportException("IMPORT: No module named %s" % (name))
+
+    def load(self, name):
+        """
+        Liefert die Bibliothek ``name``, jede wird nur einmal geladen.
+        """
+        library = self.libraries.get(name)
+        if library is not None:
+            return library
+        if name in self.loading:
+            msg = "IMPORT: Circular import %s" % (
+                " -> ".join(self.loading + [name]))
+            raise errors.ImportException(msg)
+        self.loading.append(name)
+        try:
+            library = self._load(name)
+        finally:
+            self.loading.pop()
+        self.libraries[name] = library
+        return library
+
+    def digests(self, source):
+        """
+        (name, digest) der Bibliotheken, die ``source`` importiert, fuer
+        den Digest der .payc-Datei. Module, die sich nicht laden lassen,
+        fehlen; den Fehler meldet erst die Uebersetzung.
+        """
+        result = []
+        for name in imports(source):
+            try:
+                result.append((name, self.load(name).digest))
+            except errors.ImportException:
+                pass
+        return result
+
+    def _load(self, name):
+        fname = self.find(name)
+        with open(fname, "rb") as f:
+            source = f.read()
+        key = bytecode.source_digest(source, *sorted(self.options.items()))
+        cache = object_path(fname)
+        library = Library.read(cache)
+        if library is not None and library.key == key:
+            dependencies = [self.load(dep) for dep, _ in library.imports]
+            if [(dep.name, dep.digest) for dep in dependencies] == \
+               list(library.imports):
+                library.dependencies = dependencies
+                self.reused += 1
+                return library
+        library = self.compile(name, source, key)
+        try:
+            library.write(cache)
+        except (IOError, OSError):
+            pass # wie beim .payc-cache
+        return library
+
+    def compile(self, name, source, key):
+        """
+        Uebersetzt die Bibliothek ``name`` aus ``source``.
+        """
+        module = symbol.parse(source, self.parser)
+        module.loader = self
+        for node in module.ast:
+            if not isinstance(node, (FunctionDecl, ImportStatement)):
+                msg = "IMPORT: %s may only contain functions and imports" % (
+                    name)
+                raise errors.ImportException(msg)
+        c = compiler.Compiler(module, **self.options)
+        c.resolve()
+        function_buf, _ = c.generate_chunk(module.ast, eof=False)
+        names = dict(c.imported)
+        functions = []
+        for node in module.ast:
+            if isinstance(node, FunctionDecl):
+                function = str(node.ident)
+                names[c.jump_table[function]] = function
+                functions.append((function,
+                                  tuple(str(arg) for arg in node.args),
+                                  c.frame_sizes[function], node.pure,
+                                  c.memoized.get(function)))
+        code, jumps, external, _, exports = block(function_buf, names)
+        imported = tuple((library.name, library.digest)
+                         for library in c.libraries)
+        library = Library(name, key, bytecode.source_digest(key, *imported),
+                          tuple(functions), (code, jumps, external, (),
+                                             exports),
+                          imported)
+        library.dependencies = list(c.libraries)
+        self.compiled += 1
+        return library
+
+def closure(libraries):
+    """
+    ``libraries`` und alle, die sie mittelbar importieren, jede einmal,
+    in der Reihenfolge, in der sie hinter den Code gelegt werden.
+    """
+    result = []
+    seen = set()
+    todo = list(reversed(libraries))
+    while todo:
+        library = todo.pop()
+        if library.name in seen:
+            continue
+        seen.add(library.name)
+        result.append(library)
+        todo.extend(reversed(library.dependencies))
+    return result
+
+def append(code, libraries, functions, memoized, lines=None):
+    """
+    Haengt den Code der Bibliotheken ``libraries`` an ``code`` an und
+    traegt ihre Funktionen unter dem qualifizierten Namen in
+    ``functions`` (name -> (einstieg, frame-groesse, anzahl argumente))
+    und ``memoized`` ein; die Memo-Ids folgen auf die vorhandenen. In
+    ``lines`` (index -> zeile) beginnt jede Bibliothek mit NO_LINE.
+    Liefert die Aufrufe (position, name), die resolve() noch einsetzen
+    muss.
+    """
+    calls = []
+    for library in libraries:
+        instructions, jumps, external, _, exports = library.block
+        base = len(code)
+        if lines is not None:
+            lines[base] = NO_LINE
+        code.extend(instructions)
+        for pos in jumps:
+            op, target = code[base + pos]
+            code[base + pos] = (op, base + target)
+        for pos, name in external:
+            calls.append((base + pos, name))
+        entries = dict(exports)
+        memo_base = len(memoized)
+        relocate = False
+        for name, args, frame_size, _, memo_id in library.functions:
+            qualified = library.qualify(name)
+            functions[qualified] = (base + entries[name], frame_size,
+                                    len(args))
+            if memo_id is not None:
+                memoized[qualified] = memo_base + memo_id
+                relocate = memo_base > 0
+        if relocate:
+            for pos in xrange(base, len(code)):
+                op, arg = code[pos]
+                if op == MEMO_LOOKUP or op == MEMO_STORE:
+                    code[pos] = (op, (memo_base + arg[0],) + arg[1:])
+    return calls
+
+def resolve(code, calls, functions):
+    """
+    Setzt die Einstiege der Funktionen aus ``functions`` in die Aufrufe
+    ``calls`` ((position, name), ...) ein.
+    """
+    for pos, name in calls:
+        code[pos] = (code[pos][0], functions[name][0])
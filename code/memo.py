@@ -0,0 +1,58 @@
+# coding: utf-8
+
+"""
+Memoisierung reiner Funktionen (siehe FunctionDecl.pure).
+
+Mit Compiler(memoize=True) beginnt jede reine Funktion mit
+
+    MEMO_LOOKUP <memo-id> <anzahl argumente> <key-slot>
+
+Die Argumente liegen zu diesem Zeitpunkt noch auf dem Stack. Ist ihr
+Tupel in der Tabelle, ersetzt der Interpreter sie durch das gespeicherte
+Ergebnis und kehrt sofort zurueck; sonst merkt er sich das Tupel im
+zusaetzlichen Slot <key-slot> des Frames. Vor jedem POP_FRAME/RET der
+Funktion steht
+
+    MEMO_STORE <memo-id> <key-slot>
+
+das den Wert oben auf dem Stack unter diesem Tupel ablegt.
+"""
+
+from collections import OrderedDict
+
+DEFAULT_MEMO_SIZE = 10000 # eintraege je funktion
+
+class Memo(object):
+
+    """
+    LRU-Tabelle Argument-Tupel -> Rueckgabewert einer Funktion.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.table = OrderedDict() # zuletzt benutzt am ende
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, key):
+        """
+        Liefert den gespeicherten Wert oder None; Rueckgabewerte sind
+        immer ints oder bools.
+        """
+        table = self.table
+        value = table.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        table[key] = value
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        table = self.table
+        table[key] = value
+        if len(table) > self.maxsize:
+            table.popitem(last=False)
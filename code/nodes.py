@@ -1,27 +1,56 @@
 #coding: utf-8
 
+"""
+Die Knoten des AST.
+
+Grosse, generierte Skripte ergeben Hunderttausende Knoten, deshalb haben
+alle Knotenklassen __slots__ statt eines __dict__. Statt des Parser-Tokens
+merkt sich ein Knoten nur seine Position in der Quelle als Location
+(Zeile, Spalte), Namen von Identifiern werden interniert. Der Quelltext
+selbst haengt am Modul (symbol.Module.source).
+"""
+
+from collections import namedtuple
+
 import errors
 from mytypes import BoolType, IntType, VoidType
 from opcodes import comparison_symbols, math_symbols
 
+Location = namedtuple("Location", "line col") # zeile ab 1, spalte ab 0
+
 class Statement(object):
 
+    __slots__ = ()
+
     def resolve(self, module):
         pass
 
+    def is_pure(self):
+        """
+        True, falls der (aufgeloeste) Knoten innerhalb einer Funktion
+        nichts ausgibt, keine globalen Variablen liest und nur reine
+        Funktionen aufruft; das Ergebnis haengt dann nur von den
+        Argumenten ab.
+        """
+        return True
+
 class FunctionDecl(Statement):
 
-    def __init__(self, ident, args, body, token):
+    __slots__ = ("ident", "args", "body", "loc", "table", "pure")
+
+    def __init__(self, ident, args, body, loc):
         self.ident = ident
         self.args = args
         self.body = body
-        self.token = token
+        self.loc = loc
         self.table = {} #ident-mapping
+        self.pure = None # nach resolve(): ohne seiteneffekte? (is_pure)
 
 
     def resolve(self, module):
         module.table.push(self.table) # introduce new local scope
-        if str(self.ident) in module.table or str(self.ident) in module.functions:
+        if (str(self.ident) in module.table or
+            str(self.ident) in module.functions):
             msg = "FUNCDECL: Redefinition of %s" % (str(self.ident))
             raise errors.FunctionDeclException(msg)
 
@@ -32,9 +61,9 @@ class FunctionDecl(Statement):
             ohne explizite Typ-Notationen. Deshalb werden der 
             Einfachheit halber nur Integers als Argumente zugelassen.
             Ohne diese Einschraenkung muesste anhand der an den Call
-            uebergebenen Argumente der Typ bestimmt oder explizite Type-Notationen
-            eingefuehrt werden. Ebenso koennen auch nur Integer zurueckgegeben
-            werden.
+            uebergebenen Argumente der Typ bestimmt oder explizite
+            Type-Notationen eingefuehrt werden. Ebenso koennen auch nur
+            Integer zurueckgegeben werden.
             """
             dummy = Expression()
             dummy.type_ = IntType
@@ -48,16 +77,57 @@ class FunctionDecl(Statement):
 
         if not got_return:
             # Adding a default return
-            ret = ReturnStatement(Integer(0)) # 'None' might help as default
+            # 'None' might help as default
+            ret = ReturnStatement(Integer(0, None), None)
             ret.resolve(module)
             self.body.append(ret)
+        self.pure = all(node.is_pure() for node in self.body)
         module.table.pop() # back to next-higher scope
 
+class ImportStatement(Statement):
+
+    __slots__ = ("ident", "loc", "library")
+
+    def __init__(self, ident, loc):
+        self.ident = ident
+        self.loc = loc
+        self.library = None # nach resolve(): die linker.Library
+
+    def __repr__(self):
+        return "IMPORT: %s" % (str(self.ident))
+
+    def resolve(self, module):
+        """
+        Laedt das Modul ueber module.loader und meldet seine Funktionen
+        an; ein zweiter Import desselben Moduls aendert nichts.
+        """
+        name = str(self.ident)
+        if name in module.imports:
+            self.library = module.imports[name]
+            return
+        if module.loader is None:
+            msg = "IMPORT: No module loader for %s" % (name)
+            raise errors.ImportException(msg)
+        self.library = module.loader.load(name)
+        for function, args, _, pure, _ in self.library.functions:
+            if function in module:
+                msg = "FUNCDECL: Redefinition of %s" % (function)
+                raise errors.FunctionDeclException(msg)
+            # fuer die aufloesung der aufrufe genuegt die signatur
+            decl = FunctionDecl(Identifier(function, None),
+                                [Identifier(arg, None) for arg in args], [],
+                                None)
+            decl.pure = pure
+            module.functions[function] = decl
+        module.imports[name] = self.library
+
 class PrintStatement(Statement):
 
-    def __init__(self, expr, token):
+    __slots__ = ("expr", "loc")
+
+    def __init__(self, expr, loc):
         self.expr = expr
-        self.token = token
+        self.loc = loc
 
     def __repr__(self):
         return "PRINT: %s" % (str(expr))
@@ -65,12 +135,17 @@ class PrintStatement(Statement):
     def resolve(self, module):
         self.expr.resolve(module)
 
+    def is_pure(self):
+        return False
+
 class IfStatement(Statement):
 
-    def __init__(self, expr, body, token):
+    __slots__ = ("expr", "body", "loc")
+
+    def __init__(self, expr, body, loc):
         self.expr = expr
         self.body = body
-        self.token = token
+        self.loc = loc
 
     def __repr__(self):
         return "IF: %s" % (str(expr))
@@ -80,12 +155,17 @@ class IfStatement(Statement):
         for node in self.body:
             node.resolve(module)
 
+    def is_pure(self):
+        return self.expr.is_pure() and all(n.is_pure() for n in self.body)
+
 class WhileStatement(Statement):
 
-    def __init__(self, expr, body, token):
+    __slots__ = ("expr", "body", "loc")
+
+    def __init__(self, expr, body, loc):
         self.expr = expr
         self.body = body
-        self.token = token
+        self.loc = loc
     
     def __repr__(self):
         return "WHILE: %s" % (str(self.expr))
@@ -95,10 +175,16 @@ class WhileStatement(Statement):
         for node in self.body:
             node.resolve(module)
 
+    def is_pure(self):
+        return self.expr.is_pure() and all(n.is_pure() for n in self.body)
+
 class ReturnStatement(Statement):
 
-    def __init__(self, expr, token):
+    __slots__ = ("expr", "loc")
+
+    def __init__(self, expr, loc):
         self.expr = expr
+        self.loc = loc
 
     def __repr__(self):
         return "RETURN: %s" % (str(self.expr))
@@ -106,20 +192,29 @@ class ReturnStatement(Statement):
     def resolve(self, module):
         self.expr.resolve(module)
 
+    def is_pure(self):
+        return self.expr.is_pure()
+
 class Expression(Statement):
 
-    type_ = VoidType # Each expression has got a type
-    token = None
+    __slots__ = ("type_",) # Each expression has got a type
+
+    def __init__(self):
+        self.type_ = VoidType
+
     def resolve(self, module):
         pass
     
 class FunctionCall(Expression):
 
-    def __init__(self, ident, args, token):
+    __slots__ = ("ident", "args", "loc", "function")
+
+    def __init__(self, ident, args, loc):
         self.ident = ident
         self.args = args
         self.type_ = IntType
-        self.token = token
+        self.loc = loc
+        self.function = None # die aufgerufene FunctionDecl
 
     def resolve(self, module):
         if not str(self.ident) in module.functions:
@@ -131,12 +226,26 @@ class FunctionCall(Expression):
                                                          str(len(self.args)),
                                                          str(expected_args))
             raise errors.ArgumentException(msg)
+        self.function = module.functions[str(self.ident)]
+        for arg in self.args:
+            arg.resolve(module)
+
+    def is_pure(self):
+        # waehrend der Aufloesung von f ist f.pure noch None: ein
+        # rekursiver Aufruf aendert nichts an der Reinheit
+        return (self.function.pure is not False and
+                all(arg.is_pure() for arg in self.args))
 
 class Identifier(Expression):
-    
-    def __init__(self, name, token):
-        self.name = name
-        self.decl = None
+
+    # die Position wird nicht gebraucht, Identifier sind die haeufigsten
+    # Knoten
+    __slots__ = ("name", "local")
+
+    def __init__(self, name, loc):
+        self.name = intern(name) # gleiche Namen teilen sich einen String
+        self.type_ = VoidType
+        self.local = False # lokale Variable einer Funktion?
 
     def __repr__(self):
         return self.name
@@ -146,38 +255,53 @@ class Identifier(Expression):
             msg = "Reference before declaration: %s" % str(self)
             raise errors.VarAccException(msg)
 
-        self.decl = module.table[self.name]
-        self.type_ = self.decl.type_
+        # nur der Typ wird gebraucht; eine Referenz auf die Deklaration
+        # wuerde bei jeder Neuzuweisung alle frueheren am Leben halten
+        self.type_ = module.table[self.name].type_
+        # statisch: vor der ersten Zuweisung in einer Funktion ist ein
+        # Name global, auch wenn eine Schleife spaeter wieder hier liest
+        self.local = module.table.is_local(self.name)
+
+    def is_pure(self):
+        return self.local # globale koennen sich zwischen aufrufen aendern
 
 class Integer(Expression):
 
-    def __init__(self, val, token):
+    __slots__ = ("val", "loc")
+
+    def __init__(self, val, loc):
         self.val = val
         self.type_ = IntType
-        self.token = token
+        self.loc = loc
 
     def __repr__(self):
         return str(self.val)
 
 class Boolean(Expression):
 
-    def __init__(self, val, token):
-        self.val = val
+    __slots__ = ("val", "loc")
+
+    def __init__(self, val, loc):
+        self.val = intern(val) # "True" oder "False"
         self.type_ = BoolType
-        self.token = token
+        self.loc = loc
 
     def __repr__(self):
         return str(self.val)
 
 class Declaration(Expression):
-    pass
+
+    __slots__ = ()
 
 class VarDecl(Declaration):
 
-    def __init__(self, left, right, token):
+    __slots__ = ("left", "right", "loc")
+
+    def __init__(self, left, right, loc):
         self.left = left
         self.right = right
-        self.token = token
+        self.type_ = VoidType
+        self.loc = loc
 
     def __repr__(self):
         return "VARDECL: %s = %s" % (str(self.left), str(self.right))
@@ -187,21 +311,28 @@ class VarDecl(Declaration):
         module.table[str(self.left)] = self.right 
         self.type_ = self.right.type_
 
+    def is_pure(self):
+        # in einer Funktion landet jede Zuweisung im lokalen Scope
+        return self.right.is_pure()
+
 class BinaryOp(Expression):
 
-    def __init__(self, left, op, right, token):
+    __slots__ = ("left", "op", "right", "loc")
+
+    def __init__(self, left, op, right, loc):
         self.left = left
         self.op = op
         self.right = right 
-        self.token = token
+        self.type_ = VoidType
+        self.loc = loc
 
     def __repr__(self):
         return "BINOP: %s %s %s" % (str(self.left), 
                                     str(self.op), 
                                     str(self.right))
 
-    def _create_error_message(self):
-        return "%s=> Invalid types: (%s & %s) " % (self.token.buf,
+    def _create_error_message(self, module):
+        return "%s=> Invalid types: (%s & %s) " % (module.source,
                                     str(self.left.type_),
                                     str(self.right.type_))
     def resolve(self, module):
@@ -210,11 +341,16 @@ class BinaryOp(Expression):
         l_type = self.left.type_
         r_type = self.right.type_
         if not l_type == r_type:
-            raise errors.InvalidTypesException(self._create_error_message())
+            msg = self._create_error_message(module)
+            raise errors.InvalidTypesException(msg)
         if self.op in comparison_symbols:
             self.type_ = BoolType
         elif self.op in math_symbols:
             if not l_type == IntType: # no sense in adding two booleans
-                raise errors.InvalidTypesException(self._create_error_message())
+                msg = self._create_error_message(module)
+                raise errors.InvalidTypesException(msg)
             self.type_ = IntType
         
+
+    def is_pure(self):
+        return self.left.is_pure() and self.right.is_pure()
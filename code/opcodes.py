@@ -20,3 +20,87 @@ operations = {"ADD" : op.add,
               "LT"  : op.lt,
               "GT"  : op.gt,
               "EQ"  : op.eq}
+
+# Integer-Opcodes fuer den dekodierten Instruktionsstrom (siehe decoder.py).
+opmap = {}
+opname = {}
+hasarg = set()  # Opcodes mit Operanden
+hasjump = set() # Opcodes, deren Operand ein absoluter Offset ist
+argcount = {}   # Anzahl der Operanden; bei mehr als einem ist es ein Tupel
+
+def def_op(name, code, arg=False, jump=False, nargs=1):
+    opmap[name] = code
+    opname[code] = name
+    argcount[code] = 0
+    if arg or jump:
+        hasarg.add(code)
+        argcount[code] = nargs
+    if jump:
+        hasjump.add(code)
+
+def_op("LOAD_CONST", 0, arg=True)
+def_op("LOAD_FAST", 1, arg=True)
+def_op("STORE_FAST", 2, arg=True)
+def_op("ADD", 3)
+def_op("SUB", 4)
+def_op("MUL", 5)
+def_op("DIV", 6)
+def_op("LT", 7)
+def_op("GT", 8)
+def_op("EQ", 9)
+def_op("CJUMP", 10, jump=True)
+def_op("JUMP", 11, jump=True)
+def_op("PUSH_FRAME", 12, arg=True)
+def_op("POP_FRAME", 13)
+def_op("PUSH_ADDRESS", 14, jump=True)
+def_op("RET", 15)
+def_op("PRINT", 16)
+def_op("EOF", 17)
+def_op("LOAD_GLOBAL", 18, arg=True)
+def_op("DUP_STORE_FAST", 19, arg=True) # STORE_FAST ohne pop
+
+# Superinstruktionen
+def_op("LOAD_LOAD", 20, arg=True, nargs=2)  # zwei LOAD_FAST
+def_op("INC_LOCAL", 21, arg=True, nargs=2)  # slot += konstante
+def_op("JUMP_IF_NOT_LT", 22, jump=True)     # vergleichen und springen
+def_op("JUMP_IF_NOT_GT", 23, jump=True)
+def_op("JUMP_IF_NOT_EQ", 24, jump=True)
+def_op("JUMP_IF_LT", 25, jump=True)
+def_op("JUMP_IF_GT", 26, jump=True)
+def_op("JUMP_IF_EQ", 27, jump=True)
+
+# Memoisierung reiner Funktionen (siehe memo.py)
+def_op("MEMO_LOOKUP", 28, arg=True, nargs=3) # memo-id, argumente, key-slot
+def_op("MEMO_STORE", 29, arg=True, nargs=2)  # memo-id, key-slot
+
+# Aufrufzaehler fuer die gestufte Ausfuehrung (siehe jit.py)
+def_op("ENTER", 30)
+
+# Arithmetik und Vergleiche auf zwei ints, die Typen hat der Resolver
+# bereits geprueft; ohne Umwandlung per int()
+def_op("ADD_INT", 31)
+def_op("SUB_INT", 32)
+def_op("MUL_INT", 33)
+def_op("DIV_INT", 34)
+def_op("LT_INT", 35)
+def_op("GT_INT", 36)
+def_op("EQ_INT", 37)
+
+globals().update(opmap) # LOAD_CONST, LOAD, ... als Modulkonstanten
+
+binary_operations = dict((opmap[name], func) 
+                         for name, func in operations.items())
+
+# generischer opcode -> variante fuer ints
+int_operations = dict((name, name + "_INT") for name in operations)
+
+# vergleich -> (springe falls wahr, springe falls falsch)
+compare_jumps = {"LT" : ("JUMP_IF_LT", "JUMP_IF_NOT_LT"),
+                 "GT" : ("JUMP_IF_GT", "JUMP_IF_NOT_GT"),
+                 "EQ" : ("JUMP_IF_EQ", "JUMP_IF_NOT_EQ")}
+
+# opcode -> (vergleich, ergebnis bei dem gesprungen wird)
+compare_jump_operations = {}
+for _name, (_if, _if_not) in compare_jumps.items():
+    compare_jump_operations[opmap[_if]] = (operations[_name], True)
+    compare_jump_operations[opmap[_if_not]] = (operations[_name], False)
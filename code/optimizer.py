@@ -0,0 +1,135 @@
+# coding: utf-8
+
+"""
+Optimierungen auf dem AST. Sie laufen nach resolve() und vor der
+Codeerzeugung, die Typen der Knoten sind also bereits bekannt.
+"""
+
+from nodes import Integer, Boolean, IfStatement, VarDecl, WhileStatement
+from opcodes import math_symbols, comparison_symbols, operations
+from visitor import Visitor
+
+class ConstantFolder(Visitor):
+
+    """
+    Faltet BinaryOps, deren Operanden Literale sind, und entfernt Zweige
+    mit konstanter Bedingung:
+
+        if False: ... end     -> entfaellt
+        if True: ... end      -> der Rumpf wird direkt eingefuegt
+        while False: ... end  -> entfaellt
+
+    Fuer Anweisungen liefert visit() einen Knoten, eine Liste von Knoten
+    (eingefuegter Rumpf) oder None (entfernt).
+
+    Die Variablen aus entfernten Zweigen sind aufgeloest und muessen
+    weiter einen Slot bekommen (ohne Zuweisung gelesen sind sie None wie
+    bei -O0); ihre Namen sammelt ``dropped``, der Compiler leert die
+    Liste nach jeder Anweisung der obersten Ebene.
+    """
+
+    def __init__(self):
+        self.dropped = []
+
+    def fold_body(self, body):
+        result = []
+        for node in body:
+            new = self.visit(node)
+            if new is None:
+                continue
+            elif isinstance(new, list):
+                result.extend(new)
+            else:
+                result.append(new)
+        return result
+
+    def visit_FunctionDecl(self, node):
+        node.body = self.fold_body(node.body)
+        return node
+
+    def visit_ImportStatement(self, node):
+        return node
+
+    def visit_PrintStatement(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_ReturnStatement(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_IfStatement(self, node):
+        node.expr = self.visit(node.expr)
+        node.body = self.fold_body(node.body)
+        if isinstance(node.expr, Boolean):
+            if _value(node.expr):
+                return node.body
+            self.dropped.extend(_declarations(node.body))
+            return None
+        return node
+
+    def visit_WhileStatement(self, node):
+        node.expr = self.visit(node.expr)
+        node.body = self.fold_body(node.body)
+        if isinstance(node.expr, Boolean) and not _value(node.expr):
+            self.dropped.extend(_declarations(node.body))
+            return None
+        return node
+
+    def visit_FunctionCall(self, node):
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_VarDecl(self, node):
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_BinaryOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if not (_is_literal(node.left) and _is_literal(node.right)):
+            return node
+        if node.op in math_symbols:
+            operator = math_symbols[node.op]
+        else:
+            operator = comparison_symbols[node.op]
+        left = _value(node.left)
+        right = _value(node.right)
+        if operator == "DIV" and right == 0:
+            return node # der Fehler soll zur Laufzeit auftreten
+        result = operations[operator](left, right)
+        if isinstance(result, bool):
+            return Boolean(str(result), node.loc)
+        return Integer(result, node.loc)
+
+    def visit_Identifier(self, node):
+        return node
+
+    def visit_Integer(self, node):
+        return node
+
+    def visit_Boolean(self, node):
+        return node
+
+def _declarations(body):
+    """
+    Die Namen aller Variablen, die in ``body`` zugewiesen werden.
+    """
+    names = []
+    for node in body:
+        if isinstance(node, VarDecl):
+            names.append(str(node.left))
+        elif isinstance(node, (IfStatement, WhileStatement)):
+            names.extend(_declarations(node.body))
+    return names
+
+def _is_literal(node):
+    return isinstance(node, (Integer, Boolean))
+
+def _value(node):
+    """
+    Der Parser legt Booleans als "True"/"False" ab.
+    """
+    if isinstance(node, Boolean):
+        return node.val == "True"
+    return node.val
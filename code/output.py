@@ -0,0 +1,128 @@
+# coding: utf-8
+
+"""
+Die Ausgabe von PRINT.
+
+Interpreter und Register-Maschine schreiben nicht per print, sondern in
+eine OutputSink. Sie sammelt die Werte, formatiert sie blockweise und
+schreibt sie gebuendelt mit einem write(); wann, bestimmt die
+Flush-Policy:
+
+    full    sobald der Puffer buffer_size Bytes erreicht (geprueft
+            jeweils nach BATCH Werten)
+    line    nach jeder Zeile
+    exit    erst am Ende der Ausfuehrung
+    auto    line, falls das Ziel ein Terminal ist, sonst full
+
+Am Ende jeder Ausfuehrung (run(), call(), ein Teil im Streaming-Modus)
+wird der Puffer in jedem Fall geleert, auch nach einem Fehler; die
+Ausgabe steht also vor der Fehlermeldung. Gegenueber print entfallen je
+Zeile die softspace-Behandlung und zwei write()-Aufrufe, bei
+ungepuffertem stdout (python -u, PYTHONUNBUFFERED) also zwei
+Systemaufrufe.
+
+MemorySink sammelt die Ausgabe im Speicher, zum Einbetten (siehe
+runtime.Runtime) und fuer Tests.
+"""
+
+import sys
+from cStringIO import StringIO
+
+DEFAULT_BUFFER_SIZE = 64 * 1024 # bytes
+BATCH = 512 # werte, die auf einmal formatiert werden
+POLICIES = ("auto", "full", "line", "exit")
+
+class OutputSink(object):
+
+    """
+    PRINT haengt den Wert an pending an, erst collect() formatiert alle
+    auf einmal. Der Interpreter tut das direkt und ruft collect() auf,
+    sobald pending batch Werte enthaelt; alle anderen benutzen write().
+    """
+
+    def __init__(self, target=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                 policy="auto"):
+        """
+        ``target`` ist ein Objekt mit write(); ohne wird beim Schreiben
+        das jeweils aktuelle sys.stdout benutzt, eine Umleitung von
+        sys.stdout wirkt also wie bei print.
+        """
+        if not policy in POLICIES:
+            raise ValueError("unknown flush policy: %s" % (policy))
+        if policy == "auto":
+            isatty = getattr(target or sys.stdout, "isatty", None)
+            if isatty is not None and isatty():
+                policy = "line"
+            else:
+                policy = "full"
+        self.target = target
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.batch = BATCH
+        if policy == "line":
+            self.batch = 1
+            self.limit = 0
+        elif policy == "exit":
+            self.limit = sys.maxint
+        else:
+            self.limit = buffer_size
+        self.pending = [] # noch nicht formatierte werte
+        self.chunks = [] # formatierter text
+        self.size = 0 # bytes in chunks
+
+    def write(self, value):
+        """
+        Gibt ``value`` wie print als eigene Zeile aus.
+        """
+        pending = self.pending
+        pending.append(value)
+        if len(pending) >= self.batch:
+            self.collect()
+
+    def collect(self):
+        """
+        Formatiert die Werte aus pending; ist der Puffer danach voll,
+        wird er geschrieben.
+        """
+        pending = self.pending
+        if pending:
+            pending.append("") # der zeilenumbruch des letzten werts
+            text = "\n".join(map(str, pending))
+            del pending[:] # der interpreter haelt die liste fest
+            self.chunks.append(text)
+            self.size += len(text)
+        if self.size >= self.limit and self.chunks:
+            self._write()
+
+    def flush(self):
+        """
+        Schreibt alles bisher Ausgegebene auf das Ziel.
+        """
+        self.collect()
+        if self.chunks:
+            self._write()
+
+    def _write(self):
+        target = self.target or sys.stdout
+        target.write("".join(self.chunks))
+        self.chunks = []
+        self.size = 0
+        flush = getattr(target, "flush", None)
+        if flush is not None:
+            flush()
+
+class MemorySink(OutputSink):
+
+    """
+    Sammelt die Ausgabe in einem StringIO.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, policy="full"):
+        OutputSink.__init__(self, StringIO(), buffer_size, policy)
+
+    def getvalue(self):
+        """
+        Die gesamte bisherige Ausgabe.
+        """
+        self.flush()
+        return self.target.getvalue()
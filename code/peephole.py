@@ -0,0 +1,166 @@
+# coding: utf-8
+
+"""
+Peephole-Optimierung auf dem Writer-Buffer, also vor assemble().
+Labels und Marker sind zu diesem Zeitpunkt noch symbolisch, Sprungziele
+lassen sich daher umbiegen, ohne Offsets neu zu berechnen.
+
+Durchgefuehrt werden, bis sich nichts mehr aendert:
+    - Jump-Threading: ein (C)JUMP auf einen JUMP springt direkt zu dessen
+      Ziel
+    - Entfernen von unerreichbarem Code nach JUMP, RET und EOF bis zum
+      naechsten referenzierten Label; unreferenzierte Labels fallen weg
+    - Entfernen von JUMPs auf die direkt folgende Instruktion
+    - STORE_FAST x, LOAD_FAST x wird zu DUP_STORE_FAST x
+
+SourceLine-Eintraege (Zeileninformation fuer den Profiler) sind fuer die
+Optimierungen unsichtbar.
+"""
+
+import compiler
+from opcodes import opmap, opname, argcount, hasjump, PUSH_ADDRESS
+
+_BRANCHES = [opname[op] for op in hasjump if op != PUSH_ADDRESS]
+_TERMINATORS = ("JUMP", "RET", "EOF")
+
+def optimize(buf, keep=()):
+    """
+    Optimiert ``buf`` und liefert den neuen Buffer sowie die Anzahl der
+    entfernten Instruktionen. Labels in ``keep`` (z.B. Funktionseinstiege)
+    bleiben auch ohne Referenz erhalten.
+    """
+    items = _group(buf)
+    before = _count(items)
+    changed = True
+    while changed:
+        changed = _thread_jumps(items)
+        items, removed = _remove_unreachable(items, keep)
+        changed = changed or removed
+        items, removed = _remove_redundant_jumps(items)
+        changed = changed or removed
+        items, merged = _merge_store_load(items)
+        changed = changed or merged
+    return _flatten(items), before - _count(items)
+
+def _group(buf):
+    """
+    Fasst Opcode und Operanden zu einer Instruktion [name, operand, ...]
+    zusammen, ohne Operand ist es [name, None]. Labels bleiben eigene
+    Eintraege.
+    """
+    items = []
+    i = 0
+    while i < len(buf):
+        elem = buf[i]
+        if isinstance(elem, (compiler.Label, compiler.SourceLine)):
+            items.append(elem)
+        else:
+            name = elem
+            nargs = argcount[opmap[name]]
+            items.append([name] + (buf[i + 1:i + 1 + nargs] or [None]))
+            i += nargs
+        i += 1
+    return items
+
+def _flatten(items):
+    buf = []
+    for item in items:
+        if not _is_instruction(item):
+            buf.append(item)
+        else:
+            buf.append(item[0])
+            for operand in item[1:]:
+                if operand is not None:
+                    buf.append(operand)
+    return buf
+
+def _count(items):
+    return len([item for item in items if _is_instruction(item)])
+
+def _is_instruction(item):
+    return isinstance(item, list)
+
+def _is_jump(item):
+    return (_is_instruction(item) and item[0] in _BRANCHES
+            and isinstance(item[1], compiler.Marker))
+
+def _thread_jumps(items):
+    targets = {} # label -> erste Instruktion nach dem Label
+    pending = []
+    for item in items:
+        if isinstance(item, compiler.Label):
+            pending.append(item.label)
+        elif _is_instruction(item):
+            for label in pending:
+                targets[label] = item
+            pending = []
+
+    changed = False
+    for item in items:
+        if not _is_jump(item):
+            continue
+        label = item[1].label
+        seen = set([label])
+        target = targets.get(label)
+        while (target is not None and target[0] == "JUMP" and
+               isinstance(target[1], compiler.Marker) and
+               not target[1].label in seen):
+            label = target[1].label
+            seen.add(label)
+            target = targets.get(label)
+        if label != item[1].label:
+            item[1] = compiler.Marker(label)
+            changed = True
+    return changed
+
+def _remove_unreachable(items, keep):
+    refs = set(keep)
+    for item in items:
+        if _is_instruction(item) and isinstance(item[1], compiler.Marker):
+            refs.add(item[1].label)
+
+    result = []
+    reachable = True
+    for item in items:
+        if isinstance(item, compiler.Label):
+            if not item.label in refs:
+                continue
+            reachable = True
+            result.append(item)
+        elif reachable:
+            result.append(item)
+            if _is_instruction(item) and item[0] in _TERMINATORS:
+                reachable = False
+    return result, len(result) != len(items)
+
+def _remove_redundant_jumps(items):
+    result = []
+    for pos, item in enumerate(items):
+        if _is_jump(item) and item[0] == "JUMP":
+            following = pos + 1
+            labels = set()
+            while (following < len(items) and
+                   not _is_instruction(items[following])):
+                if isinstance(items[following], compiler.Label):
+                    labels.add(items[following].label)
+                following += 1
+            if item[1].label in labels:
+                continue
+        result.append(item)
+    return result, len(result) != len(items)
+
+def _merge_store_load(items):
+    result = []
+    previous = None # letzte Instruktion ohne Label dazwischen
+    for item in items:
+        if isinstance(item, compiler.Label):
+            previous = None
+        elif _is_instruction(item):
+            if (item[0] == "LOAD_FAST" and previous is not None and
+                previous[0] == "STORE_FAST" and previous[1] == item[1]):
+                previous[0] = "DUP_STORE_FAST"
+                previous = None
+                continue
+            previous = item
+        result.append(item)
+    return result, len(result) != len(items)
@@ -0,0 +1,160 @@
+# coding: utf-8
+
+"""
+Profiler fuer den Interpreter.
+
+Statt die Dispatch-Schleife zu veraendern, bekommt der Interpreter im
+Profiling-Modus eine Huelle um den Instruktionsstrom, die jeden Zugriff
+``code[pc]`` mitschreibt. Die Zeit zwischen zwei Zugriffen gehoert der
+zuletzt geholten Instruktion. Ohne Profiling laeuft der Interpreter auf
+der normalen Liste und bezahlt nichts.
+
+Die Rueckgabeadressen des Interpreters liefern den Call-Stack, aus dem
+sich ein Collapsed-Stack-File fuer Flamegraphs erzeugen laesst.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+import sys
+import time
+
+from opcodes import opname
+
+MODULE = "<module>"
+
+class Profile(object):
+
+    def __init__(self, lines=None, functions=None):
+        """
+        ``lines`` bildet Instruktions-Indizes auf Quellzeilen ab (jeweils
+        ab diesem Index), ``functions`` Funktionsnamen auf den Index ihres
+        Einstiegs.
+        """
+        lines = lines or {}
+        self.line_starts = sorted(lines)
+        self.lines = lines
+        entries = sorted((index, name) for name, index in
+                         (functions or {}).items())
+        self.entry_indices = [index for index, name in entries]
+        self.entry_names = [name for index, name in entries]
+        self.counts = defaultdict(int) # index -> ausfuehrungen
+        self.times = defaultdict(float) # index -> sekunden
+        self.stacks = defaultdict(float) # "a;b;c" -> sekunden
+        self.code = None
+
+    @classmethod
+    def from_code(cls, code):
+        """
+        Erstellt ein Profil mit Zeilen- und Funktionstabelle aus einem
+        CodeObject.
+        """
+        functions = dict((name, entry[0]) for name, entry in
+                         code.functions.items())
+        return cls(code.lines, functions)
+
+    def instrument(self, code, addresses):
+        self.code = code
+        return _ProfiledCode(self, code, addresses)
+
+    def line_of(self, index):
+        """
+        Die Quellzeile der Instruktion ``index`` oder None, auch fuer den
+        Code gebundener Bibliotheken (linker.NO_LINE).
+        """
+        pos = bisect_right(self.line_starts, index)
+        if pos == 0:
+            return None
+        return self.lines[self.line_starts[pos - 1]] or None
+
+    def function_of(self, index):
+        pos = bisect_right(self.entry_indices, index)
+        if pos == 0:
+            return MODULE
+        return self.entry_names[pos - 1]
+
+    def stack_of(self, addresses, pc):
+        # eine Rueckgabeadresse zeigt hinter den Aufruf, der Aufrufer ist
+        # also die Funktion der Instruktion davor
+        if addresses and addresses[-1] - 1 == pc:
+            addresses = addresses[:-1] # der JUMP des Aufrufs selbst
+        names = [self.function_of(address - 1) for address in addresses]
+        names.append(self.function_of(pc))
+        return ";".join(names)
+
+    def report(self, out=sys.stderr, limit=20):
+        total = sum(self.times.values()) or 1.0
+        by_op = defaultdict(lambda: [0, 0.0])
+        for index, count in self.counts.items():
+            entry = by_op[opname[self.code[index][0]]]
+            entry[0] += count
+            entry[1] += self.times[index]
+
+        out.write("%-16s %10s %10s %7s %9s\n" % ("opcode", "count",
+                                                  "time (s)", "%", "ns/op"))
+        for name, (count, elapsed) in sorted(by_op.items(),
+                                             key=lambda i: -i[1][1]):
+            out.write("%-16s %10d %10.4f %6.1f%% %9.0f\n" % (name, count,
+                      elapsed, 100 * elapsed / total, 1e9 * elapsed / count))
+
+        out.write("\n%-7s %-16s %-14s %5s %10s %10s %7s\n" % ("index",
+                  "opcode", "function", "line", "count", "time (s)", "%"))
+        hottest = sorted(self.times.items(), key=lambda i: -i[1])[:limit]
+        for index, elapsed in hottest:
+            line = self.line_of(index)
+            out.write("%-7d %-16s %-14s %5s %10d %10.4f %6.1f%%\n" % (index,
+                      opname[self.code[index][0]], self.function_of(index),
+                      "-" if line is None else line, self.counts[index],
+                      elapsed, 100 * elapsed / total))
+
+    def write_collapsed(self, filename):
+        """
+        Schreibt die Stacks im Collapsed-Format ("a;b;c <mikrosekunden>"),
+        wie es z.B. flamegraph.pl erwartet.
+        """
+        with open(filename, "w") as f:
+            for stack, elapsed in sorted(self.stacks.items()):
+                f.write("%s %d\n" % (stack, int(elapsed * 1e6)))
+
+class _ProfiledCode(object):
+
+    """
+    Huelle um den Instruktionsstrom, die jeden Zugriff zeitlich erfasst.
+    """
+
+    def __init__(self, profile, code, addresses):
+        self.profile = profile
+        self.code = code
+        self.addresses = addresses
+        self.current = None
+        self.started = None
+        self.depth = -1
+        self.function = None
+        self.stack = None
+
+    def __len__(self):
+        return len(self.code)
+
+    def __getitem__(self, pc):
+        now = time.time()
+        self.stop(now)
+        profile = self.profile
+        profile.counts[pc] += 1
+        addresses = self.addresses
+        function = profile.function_of(pc)
+        if len(addresses) != self.depth or function != self.function:
+            self.depth = len(addresses)
+            self.function = function
+            self.stack = profile.stack_of(addresses, pc)
+        self.current = pc
+        self.started = now
+        return self.code[pc]
+
+    def stop(self, now=None):
+        if self.current is None:
+            return
+        if now is None:
+            now = time.time()
+        elapsed = now - self.started
+        self.profile.times[self.current] += elapsed
+        self.profile.stacks[self.stack] += elapsed
+        self.current = None
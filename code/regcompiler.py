@@ -0,0 +1,367 @@
+# coding: utf-8
+
+"""
+Codeerzeugung fuer die Register-Maschine (siehe regvm.py).
+
+Statt Werte ueber einen Stack zu schieben, nennt jede Instruktion ihre
+Operanden und ihr Ziel als Register, d.h. als Slots des aktuellen Frames.
+"a = b + c" mit lokalen Variablen ist damit eine einzige Instruktion
+statt LOAD_LOAD, ADD, STORE_FAST.
+
+Ein Frame besteht aus drei Bereichen:
+
+    LOCAL   Argumente und lokale Variablen, auf Modulebene die globalen,
+            in derselben Reihenfolge wie beim Stack-Code
+    CONST   die Konstanten der Funktion, stehen schon in der Frame-Vorlage
+    TEMP    Zwischenergebnisse geschachtelter Ausdruecke; sie werden wie
+            ein Stack vergeben und nach jedem Ausdruck wieder frei
+
+Eine Variable, die noch nicht zugewiesen ist, ist im Frame None. Wo sie
+beim Lesen nicht sicher zugewiesen ist (siehe ``assigned``), steht
+davor ein CHECK; bis auf den ersten Durchlauf einer Schleife ist das
+selten der Fall, die Maschine prueft daher nicht bei jedem Zugriff.
+
+Waehrend der Codeerzeugung sind Register Register-Objekte (Bereich,
+Index), Sprungziele Marker; die Positionen im Frame und im Code stehen
+erst in assemble() fest.
+"""
+
+from compiler import Marker, DEFAULT_OPT_LEVEL
+from nodes import BinaryOp, FunctionCall, FunctionDecl
+from opcodes import math_symbols, comparison_symbols, compare_jumps
+from optimizer import ConstantFolder
+from regvm import RegisterCode, opmap
+from visitor import Visitor
+
+LOCAL, CONST, TEMP = range(3)
+
+class Register(object):
+
+    def __init__(self, area, index):
+        self.area = area
+        self.index = index
+
+class Unit(object):
+
+    """
+    Code, Labels und Register einer Funktion bzw. des Moduls.
+    """
+
+    def __init__(self, nargs=0):
+        self.code = [] # [opname, a, b, c] mit symbolischen operanden
+        self.labels = {} # label -> position in self.code
+        self.locals = {} # name -> index im bereich LOCAL
+        self.consts = {} # (typ, wert) -> index im bereich CONST
+        self.values = [] # die konstanten selbst
+        self.top = 0 # naechstes freies TEMP-Register
+        self.ntemps = 0
+        self.nargs = nargs
+        self.entry = None # label des einstiegs
+
+    def template(self):
+        return ([None] * len(self.locals) + self.values +
+                [None] * self.ntemps)
+
+    def index(self, reg):
+        if reg.area == LOCAL:
+            return reg.index
+        elif reg.area == CONST:
+            return len(self.locals) + reg.index
+        return len(self.locals) + len(self.values) + reg.index
+
+class RegisterCompiler(Visitor):
+
+    """
+    Uebersetzt ein aufgeloestes Modul fuer die Register-Maschine. Die
+    Schnittstelle entspricht der von Compiler: compile() oder resolve(),
+    generate() und assemble() einzeln.
+    """
+
+    def __init__(self, module, opt_level=DEFAULT_OPT_LEVEL):
+        self.module = module
+        self.opt_level = opt_level
+        self.label_count = 0
+        self.main = Unit() # modul-ebene, die locals sind die globalen
+        self.unit = self.main
+        self.units = [] # (name, Unit) der funktionen in ihrer reihenfolge
+        self.functions = {} # name -> funktionsnummer
+        self.function = None # die gerade uebersetzte FunctionDecl
+        # variablen aus weggefalteten zweigen, siehe Compiler
+        self.dropped = []
+        # die variablen der aktuellen unit, die an dieser stelle sicher
+        # zugewiesen sind
+        self.assigned = set()
+
+    def compile(self, filename=None):
+        """
+        Liefert ein RegisterCode; mit ``filename`` wird zusaetzlich die
+        lesbare Form geschrieben.
+        """
+        self.resolve()
+        self.generate()
+        code = self.assemble()
+        if filename is not None:
+            code.write(filename)
+        return code
+
+    def resolve(self):
+        for node in self.module.ast:
+            node.resolve(self.module)
+
+    def generate(self):
+        folder = ConstantFolder()
+        for node in self.module.ast:
+            self.unit.top = 0
+            if self.opt_level >= 1:
+                subnodes = folder.fold_body([node])
+                self.dropped, folder.dropped = folder.dropped, []
+                if not isinstance(node, FunctionDecl):
+                    self._reserve_dropped()
+                for subnode in subnodes:
+                    self.visit(subnode)
+                self.dropped = []
+            else:
+                self.visit(node)
+        self._emit("HALT")
+
+    def _reserve_dropped(self):
+        for name in self.dropped:
+            self._local(name)
+
+    def assemble(self):
+        """
+        Haengt die Funktionen hinter den Modul-Code und setzt Register,
+        Sprungziele und Funktionseinstiege als Indizes ein.
+        """
+        units = [self.main] + [unit for name, unit in self.units]
+        bases = []
+        base = 0
+        for unit in units:
+            bases.append(base)
+            base += len(unit.code)
+
+        instructions = []
+        for unit, base in zip(units, bases):
+            labels = dict((label, base + pos)
+                          for label, pos in unit.labels.items())
+            for elem in unit.code:
+                operands = [self._operand(unit, labels, x) for x in elem[1:]]
+                operands += [None] * (3 - len(operands))
+                instructions.append(tuple([opmap[elem[0]]] + operands))
+
+        functions = [(base, unit.template()) for unit, base in
+                     zip(units[1:], bases[1:])]
+        return RegisterCode(instructions, self.main.template(), functions,
+                            dict(self.functions))
+
+    def _operand(self, unit, labels, x):
+        if isinstance(x, Register):
+            return unit.index(x)
+        elif isinstance(x, Marker):
+            return labels[x.label]
+        elif isinstance(x, tuple):
+            return tuple(self._operand(unit, labels, y) for y in x)
+        return x
+
+    def _gen_label(self):
+        self.label_count += 1
+        return "".join(("L", str(self.label_count)))
+
+    def _emit(self, *elem):
+        self.unit.code.append(elem)
+
+    def _mark(self, label):
+        self.unit.labels[label] = len(self.unit.code)
+
+    def _temp(self):
+        unit = self.unit
+        reg = Register(TEMP, unit.top)
+        unit.top += 1
+        unit.ntemps = max(unit.ntemps, unit.top)
+        return reg
+
+    def _const(self, value):
+        unit = self.unit
+        key = (type(value), value) # True und 1 sind verschieden
+        if not key in unit.consts:
+            unit.consts[key] = len(unit.values)
+            unit.values.append(value)
+        return Register(CONST, unit.consts[key])
+
+    def _local(self, name):
+        """
+        Liefert das Register von ``name``; unbekannte Namen bekommen den
+        naechsten freien Slot.
+        """
+        table = self.unit.locals
+        if not name in table:
+            table[name] = len(table)
+        return Register(LOCAL, table[name])
+
+    def _value(self, node, target=None):
+        """
+        Erzeugt den Code fuer den Ausdruck ``node`` und liefert das
+        Register mit seinem Wert. Mit ``target`` landet der Wert dort.
+        Lokale Variablen und Konstanten kosten ohne ``target`` keine
+        Instruktion.
+        """
+        return self.dispatch(node, target)
+
+    def _move(self, reg, target):
+        if target is None:
+            return reg
+        self._emit("MOVE", target, reg)
+        return target
+
+    def _visit_body(self, nodes):
+        for node in nodes:
+            self.unit.top = 0 # temporaere register sind wieder frei
+            self.visit(node)
+        self.unit.top = 0
+
+    def visit_FunctionDecl(self, node, target=None):
+        name = str(node.ident)
+        self.functions[name] = len(self.units)
+        unit = Unit(len(node.args))
+        self.units.append((name, unit))
+        backup = self.unit
+        self.unit = unit
+        self.function = node
+        for arg in node.args: # die argumente belegen die ersten slots
+            self._local(str(arg))
+        self._reserve_dropped()
+        assigned = self.assigned
+        self.assigned = set(str(arg) for arg in node.args)
+        unit.entry = self._gen_label()
+        self._mark(unit.entry)
+        self._visit_body(node.body)
+        self.assigned = assigned
+        self.function = None
+        self.unit = backup
+
+    def visit_FunctionCall(self, node, target=None):
+        """
+        Die Argumente werden wie beim Stack-Code von rechts nach links
+        ausgewertet.
+        """
+        top = self.unit.top
+        args = [None] * len(node.args)
+        for i in reversed(range(len(node.args))):
+            args[i] = self._value(node.args[i])
+        self.unit.top = top
+        if target is None:
+            target = self._temp()
+        self._emit("CALL", target, self.functions[str(node.ident)],
+                   tuple(args))
+        return target
+
+    def visit_ReturnStatement(self, node, target=None):
+        """
+        "return f(...)" innerhalb von f wird ab Optimierungsstufe 2 zu
+        einem TAILCALL, der den Frame wiederverwendet.
+        """
+        expr = node.expr
+        if (self.opt_level >= 2 and isinstance(expr, FunctionCall) and
+            self.function is not None and
+            str(expr.ident) == str(self.function.ident)):
+            args = [None] * len(expr.args)
+            for i in reversed(range(len(expr.args))):
+                args[i] = self._value(expr.args[i])
+            self._emit("TAILCALL", Marker(self.unit.entry), tuple(args))
+            return
+        self._emit("RETURN", self._value(expr))
+
+    def visit_BinaryOp(self, node, target=None):
+        """
+        Erst der rechte, dann der linke Operand, wie beim Stack-Code. Das
+        Ziel darf eines der Operanden-Register sein, die Maschine liest
+        die Operanden vor dem Schreiben.
+        """
+        top = self.unit.top
+        right = self._value(node.right)
+        left = self._value(node.left)
+        self.unit.top = top
+        if target is None:
+            target = self._temp()
+        if node.op in math_symbols:
+            operator = math_symbols[node.op]
+        else:
+            operator = comparison_symbols[node.op]
+        self._emit(operator, target, left, right)
+        return target
+
+    def _jump_if(self, expr, label, jump_if_true=False):
+        """
+        Springt zu ``label``, falls ``expr`` zu ``jump_if_true``
+        ausgewertet wird. Vergleiche werden direkt mit dem Sprung
+        verschmolzen.
+        """
+        if isinstance(expr, BinaryOp) and expr.op in comparison_symbols:
+            right = self._value(expr.right)
+            left = self._value(expr.left)
+            if_true, if_false = compare_jumps[comparison_symbols[expr.op]]
+            self._emit(if_true if jump_if_true else if_false, left, right,
+                       Marker(label))
+        else:
+            op = "JUMP_IF_TRUE" if jump_if_true else "JUMP_IF_FALSE"
+            self._emit(op, self._value(expr), Marker(label))
+        self.unit.top = 0
+
+    def visit_Integer(self, node, target=None):
+        return self._move(self._const(node.val), target)
+
+    def visit_Boolean(self, node, target=None):
+        # der Parser liefert Strings
+        return self._move(self._const(node.val == "True"), target)
+
+    def visit_Identifier(self, node, target=None):
+        """
+        Auf Modulebene und fuer lokale Variablen ist der Wert bereits in
+        einem Register; globale Variablen werden in einer Funktion per
+        GETGLOBAL aus dem Modul-Frame geholt.
+        """
+        if self.function is None or node.local:
+            reg = Register(LOCAL, self.unit.locals[node.name])
+            if not node.name in self.assigned:
+                self._emit("CHECK", reg)
+            return self._move(reg, target)
+        if target is None:
+            target = self._temp()
+        self._emit("GETGLOBAL", target, self.main.locals[node.name])
+        return target
+
+    def visit_VarDecl(self, node, target=None):
+        self._value(node.right, self._local(str(node.left)))
+        self.assigned.add(str(node.left))
+
+    def visit_PrintStatement(self, node, target=None):
+        self._emit("PRINT", self._value(node.expr))
+
+    def visit_IfStatement(self, node, target=None):
+        label = self._gen_label()
+        self._jump_if(node.expr, label)
+        assigned = set(self.assigned) # der rumpf laeuft vielleicht nicht
+        self._visit_body(node.body)
+        self.assigned = assigned
+        self._mark(label)
+
+    def visit_WhileStatement(self, node, target=None):
+        """
+        Der Test steht am Ende der Schleife, wie beim Stack-Code mit
+        Superinstruktionen:
+
+            JUMP test
+        body:
+            ...
+        test:
+            JUMP_IF_LT ... body
+        """
+        body_label = self._gen_label()
+        test_label = self._gen_label()
+        self._emit("JUMP", Marker(test_label))
+        self._mark(body_label)
+        assigned = set(self.assigned) # der test kommt auch vor dem rumpf
+        self._visit_body(node.body)
+        self.assigned = assigned
+        self._mark(test_label)
+        self._jump_if(node.expr, body_label, jump_if_true=True)
@@ -0,0 +1,191 @@
+# coding: utf-8
+
+"""
+Register-Maschine als Alternative zum Stack-Interpreter.
+
+Jede Instruktion ist ein Tupel (opcode, a, b, c); die Operanden sind
+Register, also Indizes in den aktuellen Frame, Sprungziele (Index in die
+Instruktionsliste) oder Funktionsnummern. Unbenutzte Operanden sind None.
+
+    MOVE a b              frame[a] = frame[b]
+    GETGLOBAL a b         frame[a] = modul-frame[b]
+    ADD a b c             frame[a] = frame[b] + frame[c], ebenso SUB, MUL,
+                          DIV, LT, GT und EQ
+    JUMP a                Sprung nach a
+    JUMP_IF_FALSE a b     Sprung nach b, falls frame[a] falsch ist
+    JUMP_IF_TRUE a b      Sprung nach b, falls frame[a] wahr ist
+    JUMP_IF_LT a b c      Sprung nach c, falls frame[a] < frame[b], ebenso
+                          fuer GT, EQ und die Varianten JUMP_IF_NOT_*
+    CALL a b c            ruft Funktion b mit den Registern im Tupel c als
+                          Argumenten auf, das Ergebnis landet in frame[a]
+    TAILCALL a b          Endaufruf: die Register im Tupel b werden zu den
+                          Argumenten des aktuellen Frames, Sprung nach a
+    RETURN a              gibt frame[a] an den Aufrufer zurueck
+    PRINT a               gibt frame[a] aus
+    CHECK a               Fehler, falls frame[a] noch nicht zugewiesen ist
+    HALT                  Ende des Modul-Codes
+
+Ein Frame entsteht als Kopie der Vorlage seiner Funktion, in der die
+Konstanten bereits an ihren Registern stehen (siehe regcompiler.py).
+Der Modul-Frame haelt in den ersten Slots die globalen Variablen, wie
+beim Stack-Interpreter. Variablen sind None, bis ihnen etwas zugewiesen
+wird; CHECK steht vor jedem Lesen, bei dem der Compiler das nicht
+ausschliessen kann, GETGLOBAL prueft selbst.
+"""
+
+import errors
+from output import OutputSink
+
+OPNAMES = ("MOVE", "GETGLOBAL", "ADD", "SUB", "MUL", "DIV", "LT", "GT",
+           "EQ", "JUMP", "JUMP_IF_FALSE", "JUMP_IF_TRUE", "JUMP_IF_LT",
+           "JUMP_IF_GT", "JUMP_IF_EQ", "JUMP_IF_NOT_LT", "JUMP_IF_NOT_GT",
+           "JUMP_IF_NOT_EQ", "CALL", "TAILCALL", "RETURN", "PRINT", "CHECK",
+           "HALT")
+
+opmap = dict((name, code) for code, name in enumerate(OPNAMES))
+opname = dict(enumerate(OPNAMES))
+globals().update(opmap) # MOVE, ADD, ... als Modulkonstanten
+
+class RegisterCode(object):
+
+    """
+    Das Ergebnis von RegisterCompiler: die Instruktionen, die Vorlage des
+    Modul-Frames und je Funktion (Einstieg, Frame-Vorlage).
+    """
+
+    def __init__(self, instructions, module_template, functions, names):
+        self.instructions = instructions
+        self.module_template = module_template
+        self.functions = functions # funktionsnummer -> (einstieg, vorlage)
+        self.names = names # name -> funktionsnummer
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def disassemble(self):
+        """
+        Lesbare Form, je Zeile eine Instruktion samt Index.
+        """
+        entries = dict((self.functions[number][0], name) for name, number
+                       in self.names.items())
+        lines = []
+        for index, (op, a, b, c) in enumerate(self.instructions):
+            if index in entries:
+                lines.append("%s:\n" % (entries[index]))
+            operands = " ".join(str(x) for x in (a, b, c) if x is not None)
+            lines.append("%5d %-16s %s\n" % (index, opname[op], operands))
+        return "".join(lines)
+
+    def write(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.disassemble())
+
+class RegisterVM(object):
+
+    def __init__(self, code, output=None):
+        """
+        PRINT schreibt nach ``output`` (eine output.OutputSink), ohne
+        gepuffert nach sys.stdout.
+        """
+        self.code = code
+        self.instructions = code.instructions
+        self.globals = None # modul-frame des letzten run()
+        self.output = output or OutputSink()
+
+    def run(self):
+        frame = list(self.code.module_template)
+        try:
+            self._execute(self.instructions, frame)
+        finally:
+            self.output.flush()
+        self.globals = frame
+
+    def _execute(self, code, frame, pc=0):
+        module = frame
+        functions = self.code.functions
+        calls = [] # (frame, ruecksprung, zielregister) der aufrufer
+        output = self.output
+        pending = output.pending # siehe output.OutputSink
+        batch = output.batch
+
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if op == MOVE:
+                frame[a] = frame[b]
+            elif op == ADD:
+                frame[a] = frame[b] + frame[c]
+            elif op == SUB:
+                frame[a] = frame[b] - frame[c]
+            elif op == JUMP_IF_NOT_LT:
+                if not frame[a] < frame[b]:
+                    pc = c
+            elif op == JUMP_IF_LT:
+                if frame[a] < frame[b]:
+                    pc = c
+            elif op == JUMP_IF_NOT_EQ:
+                if frame[a] != frame[b]:
+                    pc = c
+            elif op == CALL:
+                entry, template = functions[b]
+                callee = template[:]
+                callee[:len(c)] = [frame[r] for r in c]
+                calls.append((frame, pc, a))
+                frame = callee
+                pc = entry
+            elif op == RETURN:
+                value = frame[a]
+                assert calls # Return without caller doesn't make sense ;)
+                frame, pc, target = calls.pop()
+                frame[target] = value
+            elif op == TAILCALL:
+                frame[:len(b)] = [frame[r] for r in b]
+                pc = a
+            elif op == GETGLOBAL:
+                value = module[b]
+                if value is None:
+                    raise _unassigned()
+                frame[a] = value
+            elif op == MUL:
+                frame[a] = frame[b] * frame[c]
+            elif op == DIV:
+                frame[a] = frame[b] / frame[c]
+            elif op == LT:
+                frame[a] = frame[b] < frame[c]
+            elif op == GT:
+                frame[a] = frame[b] > frame[c]
+            elif op == EQ:
+                frame[a] = frame[b] == frame[c]
+            elif op == JUMP:
+                pc = a
+            elif op == JUMP_IF_FALSE:
+                if not frame[a]:
+                    pc = b
+            elif op == JUMP_IF_TRUE:
+                if frame[a]:
+                    pc = b
+            elif op == JUMP_IF_GT:
+                if frame[a] > frame[b]:
+                    pc = c
+            elif op == JUMP_IF_EQ:
+                if frame[a] == frame[b]:
+                    pc = c
+            elif op == JUMP_IF_NOT_GT:
+                if not frame[a] > frame[b]:
+                    pc = c
+            elif op == PRINT:
+                pending.append(frame[a])
+                if len(pending) >= batch:
+                    output.collect()
+            elif op == CHECK:
+                if frame[a] is None:
+                    raise _unassigned()
+            elif op == HALT:
+                return
+            else:
+                msg = "Index: %s - Invalid Opcode: %s" % (str(pc - 1), op)
+                raise errors.InvalidOpcodeException(msg)
+
+def _unassigned():
+    # dieselbe Meldung wie beim Stack-Interpreter
+    return errors.VarAccException("Reference before assignment")
@@ -0,0 +1,135 @@
+# coding: utf-8
+
+"""
+Einbettbare Laufzeitumgebung fuer langlebige Prozesse.
+
+Eine Runtime haelt einen Parser, einen LRU-Cache uebersetzter Programme
+und je Programm einen wiederverwendbaren Interpreter. Es werden keine
+Dateien geschrieben.
+
+    runtime = Runtime()
+    runtime.run(source)                  # fuehrt den Modul-Code aus
+    runtime.call(source, "fak", 5)       # ruft eine Funktion direkt auf
+
+Mit Runtime(memoize=True) behalten reine Funktionen ihre Ergebnisse
+ueber alle Aufrufe desselben Programms, memo_stats() zeigt, ob sich das
+lohnt. Die Ausgabe von print geht an eine output.OutputSink, mit einer
+output.MemorySink in den Speicher:
+
+    runtime = Runtime(output=MemorySink())
+    runtime.run("print 6 * 7")
+    runtime.output.getvalue()            # "42\n"
+"""
+
+from collections import OrderedDict
+
+from bytecode import source_digest
+from compiler import Compiler
+from interpreter import Interpreter
+from output import OutputSink
+import errors
+import symbol
+
+DEFAULT_CACHE_SIZE = 100000 # instruktionen aller programme im cache
+
+class Program(object):
+
+    """
+    Ein uebersetztes Programm (CodeObject) mit einem Interpreter dafuer.
+    """
+
+    def __init__(self, code, output=None):
+        self.code = code
+        # name -> (instruktions-index, frame-groesse, anzahl argumente)
+        self.functions = code.functions
+        self.interpreter = Interpreter(code, output=output)
+
+    @classmethod
+    def from_source(cls, source, parser=None, output=None, **options):
+        c = Compiler(symbol.parse(source, parser), **options)
+        code = c.compile()
+        return cls(code, output)
+
+    def get_size(self):
+        return len(self.code)
+
+    size = property(get_size)
+
+class Runtime(object):
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, output=None,
+                 **options):
+        """
+        ``max_size`` begrenzt die Groesse des Caches in Instruktionen, die
+        am laengsten nicht benutzten Programme werden zuerst verdraengt.
+        Alle Programme schreiben nach ``output`` (ohne gepuffert nach
+        sys.stdout). ``options`` werden an den Compiler weitergereicht.
+        """
+        self.max_size = max_size
+        self.output = output or OutputSink()
+        self.options = options
+        self.parser = symbol.get_parser()
+        self.programs = OrderedDict() # digest -> Program, aeltestes zuerst
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, source):
+        """
+        Liefert das uebersetzte Programm zu ``source``, aus dem Cache oder
+        neu uebersetzt.
+        """
+        digest = source_digest(source, *sorted(self.options.items()))
+        program = self.programs.pop(digest, None)
+        if program is not None:
+            self.hits += 1
+            self.programs[digest] = program
+            return program
+        self.misses += 1
+        program = Program.from_source(source, self.parser, self.output,
+                                      **self.options)
+        self.programs[digest] = program
+        self.size += program.size
+        # das neueste Programm bleibt auch dann, wenn es allein zu gross ist
+        while self.size > self.max_size and len(self.programs) > 1:
+            self.size -= self.programs.popitem(last=False)[1].size
+        return program
+
+    def run(self, source):
+        """
+        Fuehrt den Modul-Code von ``source`` aus. Die globalen Variablen
+        bleiben fuer spaetere call()-Aufrufe erhalten.
+        """
+        self.compile(source).interpreter.run()
+
+    def call(self, source, name, *args):
+        """
+        Ruft die Funktion ``name`` aus ``source`` mit ``args`` auf und
+        liefert ihren Rueckgabewert. Wie bei einem Import wird der
+        Modul-Code vor dem ersten Aufruf einmal ausgefuehrt, damit die
+        globalen Variablen belegt sind.
+        """
+        program = self.compile(source)
+        if not name in program.functions:
+            msg = "Call to an undefined function: %s" % (name)
+            raise errors.FunctionCallException(msg)
+        entry, frame_size, nargs = program.functions[name]
+        if len(args) != nargs:
+            msg = "%s: Expected %s arguments, got %s" % (name, str(nargs),
+                                                         str(len(args)))
+            raise errors.ArgumentException(msg)
+        interpreter = program.interpreter
+        if interpreter.globals is None:
+            interpreter.run()
+        return interpreter.call(entry, frame_size, args)
+
+    def memo_stats(self, source):
+        """
+        Treffer, Fehlschlaege und Eintraege der Memo-Tabellen von
+        ``source`` je Funktionsname, siehe Interpreter.memo_stats.
+        """
+        return self.compile(source).interpreter.memo_stats()
+
+    def clear(self):
+        self.programs.clear()
+        self.size = 0
@@ -22,6 +22,13 @@ class Scope(object):
         # "top-level" table, also der lokalste Scope
         self.table[-1][ident] = node
 
+    def is_local(self, ident):
+        """
+        True, falls ``ident`` im innersten Scope liegt und dieser nicht
+        der globale ist.
+        """
+        return len(self.table) > 1 and ident in self.table[-1]
+
     def __contains__(self, ident):
         for table in self.table:
             if ident in table:
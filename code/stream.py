@@ -0,0 +1,190 @@
+# coding: utf-8
+
+"""
+Streaming-Ausfuehrung fuer sehr grosse Programme.
+
+Die Quelle wird zeilenweise gelesen und an den Grenzen der Anweisungen
+der obersten Ebene in Teile zerlegt. Jeder Teil wird fuer sich geparst,
+aufgeloest, uebersetzt und sofort ausgefuehrt; Namenstabellen, globale
+Slots und Funktionen bleiben dabei ueber alle Teile erhalten.
+
+Im Instruktionsstrom liegen nur der Code aller bisher deklarierten
+Funktionen und der Modul-Code des aktuellen Teils, der nach seiner
+Ausfuehrung wieder entfernt wird. Der Speicherbedarf haengt damit von
+der Groesse der Funktionen und der Teile ab, nicht von der Laenge der
+Quelle.
+
+Fehler in der Quelle werden erst erkannt, wenn ihr Teil an der Reihe
+ist; die Teile davor sind dann bereits ausgefuehrt.
+"""
+
+import re
+
+from compiler import Compiler
+from interpreter import Interpreter
+import linker
+from nodes import FunctionDecl
+from symbol import Module, parse
+
+CHUNK_LINES = 8 # mindestgroesse eines teils in zeilen
+
+# wie fastparser._TOKEN, aber zeilenweise: ein kommentar kann offen bleiben
+_TOKEN = re.compile(r"""
+      [ \t\n\r\f\v]+|//[^\n]*|/\*.*?\*/   # leerraum und kommentare
+    | (/\*)                               # 1: offener kommentar
+    | ([a-zA-Z_][a-zA-Z0-9_]*|[0-9]+)     # 2: name oder zahl
+    | (:\n|==|[-+*/<>=(),]|.)             # 3
+""", re.S | re.X)
+_COMMENT_END = re.compile(r".*?\*/", re.S)
+
+_WORD = "word"
+# nach diesen tokens geht der ausdruck in der naechsten zeile weiter;
+# print und return koennen auch ohne ausdruck stehen, "print\nx" ist
+# aber eine anweisung
+_OPEN = frozenset(("+", "-", "*", "/", "<", ">", "==", "=", "(", ",",
+                   "def", "if", "while", "print", "return", "import"))
+
+def _tokens(line, comment):
+    """
+    Liefert die Tokens (Art, Text) von ``line`` und ob die Zeile in einem
+    Kommentar endet; ``comment`` gibt an, ob sie in einem beginnt.
+    """
+    pos = 0
+    if comment:
+        match = _COMMENT_END.match(line)
+        if match is None:
+            return [], True
+        pos = match.end()
+    tokens = []
+    for match in _TOKEN.finditer(line, pos):
+        if match.lastindex == 1:
+            return tokens, True # ohne "*/" in dieser zeile
+        elif match.lastindex == 2:
+            tokens.append((_WORD, match.group(2)))
+        elif match.lastindex == 3:
+            tokens.append((match.group(3), match.group(3)))
+    return tokens, False
+
+def chunks(lines, size=CHUNK_LINES):
+    """
+    Zerlegt die Zeilen eines Programms in Teile aus ganzen Anweisungen der
+    obersten Ebene mit jeweils mindestens ``size`` Zeilen (der letzte Teil
+    kann kuerzer sein).
+
+    Zeilenumbrueche sind fuer den Parser Leerraum, eine Anweisung kann
+    also ueber mehrere Zeilen gehen. Geschnitten wird deshalb nur vor
+    einer Zeile, die mit einem Namen oder einer Zahl beginnt, wenn davor
+    alle Bloecke (":\\n" bis "end"), Klammern und Kommentare geschlossen
+    sind und die letzte Zeile nicht mit einem Operator oder
+    Schluesselwort endet, nach dem der Ausdruck weitergeht.
+    """
+    depth = 0 # offene bloecke
+    parens = 0
+    comment = False
+    complete = False # part endet mit einer ganzen anweisung
+    part = []
+    for line in lines:
+        in_comment = comment
+        tokens, comment = _tokens(line, comment)
+        if not tokens:
+            part.append(line)
+            continue
+        if (complete and not in_comment and tokens[0][0] == _WORD and
+            len(part) >= size):
+            yield "".join(part)
+            part = []
+        part.append(line)
+        for i, (kind, text) in enumerate(tokens):
+            if kind == ":\n":
+                depth += 1
+            elif kind == "(":
+                parens += 1
+            elif kind == ")":
+                parens -= 1
+            elif (text == "end" and depth > 0 and
+                  tokens[i + 1:i + 2] != [("=", "=")]):
+                depth -= 1
+        complete = (depth == 0 and parens == 0 and not comment and
+                    not tokens[-1][1] in _OPEN)
+    if part:
+        yield "".join(part)
+
+class StreamExecutor(object):
+
+    def __init__(self, parser=None, chunk_lines=CHUNK_LINES, loader=None,
+                 output=None, **options):
+        """
+        ``loader`` (linker.Loader) laedt importierte Module, PRINT
+        schreibt nach ``output`` (siehe Interpreter), ``options`` werden
+        an den Compiler weitergereicht.
+        """
+        self.parser = parser
+        self.chunk_lines = chunk_lines
+        self.state = Module([]) # namen und funktionen aller teile
+        self.state.loader = loader
+        self.compiler = Compiler(self.state, **options)
+        self.code = [] # funktionen, dahinter der aktuelle modul-code
+        self.labels = {} # label -> index, nur fuer funktionscode
+        # die gebundenen bibliotheken und ihre funktionen (siehe linker)
+        self.placed = set()
+        self.functions = {}
+        self.module_frame = []
+        self.interpreter = Interpreter(self.code, decoded=True, output=output)
+
+    def run(self, lines):
+        """
+        Fuehrt das Programm aus ``lines`` (z.B. einer geoeffneten Datei)
+        Teil fuer Teil aus.
+        """
+        for source in chunks(lines, self.chunk_lines):
+            self.feed(source)
+
+    def feed(self, source):
+        """
+        Uebersetzt und fuehrt ``source`` aus, das nur aus ganzen
+        Anweisungen der obersten Ebene bestehen darf.
+        """
+        if not source.strip():
+            return
+        nodes = parse(source, self.parser).ast
+        self.state.source = source # fuer fehlermeldungen
+        for node in nodes:
+            node.resolve(self.state)
+        function_buf, module_buf = self.compiler.generate_chunk(nodes)
+
+        code = self.code
+        self._link()
+        code.extend(function_buf.assemble(len(code), self.labels))
+        self.labels.update(function_buf.offsets)
+        start = len(code)
+        code.extend(module_buf.assemble(start, self.labels))
+
+        frame = self.module_frame
+        frame.extend([None] * (len(self.compiler.globals) - len(frame)))
+        try:
+            self.interpreter.run_chunk(start, frame)
+        finally:
+            del code[start:]
+
+        for node in nodes:
+            if isinstance(node, FunctionDecl):
+                # fuer spaetere Aufrufe reicht die Signatur, der Rumpf
+                # wuerde sonst bis zum Ende im Speicher bleiben
+                node.body = []
+
+    def _link(self):
+        """
+        Legt den Code neu importierter Bibliotheken hinter die bisherigen
+        Funktionen. Ihre Memo-Ids belegt der Compiler wie die eigener
+        Funktionen.
+        """
+        compiler = self.compiler
+        libraries = [library for library in linker.closure(compiler.libraries)
+                     if not library.name in self.placed]
+        if libraries:
+            self.placed.update(library.name for library in libraries)
+            calls = linker.append(self.code, libraries, self.functions,
+                                  compiler.memoized)
+            linker.resolve(self.code, calls, self.functions)
+        for label, name in compiler.imported.items():
+            self.labels[label] = self.functions[name][0]
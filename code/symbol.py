@@ -3,15 +3,23 @@
 import nodes as nod
 from collections import namedtuple
 from scope import Scope
-from dparser import Parser
+from fastparser import FastParser
+import atexit
 import errors
+import hashlib
+import os
+import sys
+import tempfile
 
 class Module(object):
 
-    def __init__(self, ast):
+    def __init__(self, ast, source=None):
         self.ast = ast
+        self.source = source # fuer fehlermeldungen
         self.table = Scope() 
         self.functions = {} # mapping of the functions
+        self.loader = None # fuer import, siehe linker.Loader
+        self.imports = {} # name -> linker.Library
 
     def __contains__(self, ident):
         for table in self.table.table:
@@ -21,10 +29,137 @@ class Module(object):
     
 KEYWORDS = ["def", "if", "while"]
 
-def parse(program):
-    parser = Parser(file_prefix='.d_parser_assign')
+TABLE_DIR_ENV = "PAYNE_PARSER_DIR"
+TABLE_PREFIX = ".d_parser_assign"
+
+PARSERS = ("dparser", "fast") # siehe use_parser()
+
+_parser = None # wird von get_parser() beim ersten Aufruf angelegt
+_parser_name = PARSERS[0]
+_table_dir = None
+
+def grammar_hash():
+    """
+    SHA-1 ueber die Grammatik, also die Docstrings aller d_-Funktionen in
+    der Reihenfolge, in der dparser sie einliest. Der Hash steckt im Namen
+    der Tabellen-Dateien, eine geaenderte Grammatik bekommt also eigene
+    Tabellen.
+    """
+    functions = sorted((f for name, f in globals().items()
+                        if name.startswith("d_") and callable(f)),
+                       key=lambda f: f.__code__.co_firstlineno)
+    digest = hashlib.sha1()
+    for f in functions:
+        digest.update(f.__doc__)
+    return digest.hexdigest()
+
+def table_dir():
+    """
+    Verzeichnis fuer die Parser-Tabellen: set_table_dir(), sonst
+    $PAYNE_PARSER_DIR, sonst $XDG_CACHE_HOME/payne (~/.cache/payne).
+    Laesst es sich nicht anlegen, wird das temporaere Verzeichnis benutzt.
+    """
+    path = _table_dir or os.environ.get(TABLE_DIR_ENV)
+    if not path:
+        cache = os.environ.get("XDG_CACHE_HOME",
+                               os.path.join(os.path.expanduser("~"),
+                                            ".cache"))
+        path = os.path.join(cache, "payne")
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    except OSError:
+        return tempfile.gettempdir()
+    return path
+
+def set_table_dir(path):
+    """
+    Legt das Verzeichnis fuer die Parser-Tabellen fest (None stellt den
+    Default wieder her). Der geteilte Parser wird danach neu erzeugt.
+    """
+    global _table_dir, _parser
+    _table_dir = path
+    _parser = None
+
+def make_parser():
+    """
+    Erzeugt einen neuen Parser. Die Tabellen werden nur erzeugt, wenn es
+    fuer den aktuellen Grammatik-Hash noch keine gibt.
+    """
+    # erst hier importiert, mit --parser=fast wird dparser nie geladen
+    from dparser import Parser
+    prefix = "%s_%s" % (TABLE_PREFIX, grammar_hash()[:16])
+    return Parser(modules=sys.modules[__name__], parser_folder=table_dir(),
+                  file_prefix=prefix)
+
+@atexit.register
+def _release_parser():
+    """
+    Gibt den geteilten Parser vor dem Abbau der Module frei; sonst findet
+    dparser beim Entladen seiner Tabellen die eigenen Funktionen nicht
+    mehr und meldet einen Fehler auf stderr.
+    """
+    global _parser
+    _parser = None
+
+def use_parser(name):
+    """
+    Waehlt den geteilten Parser: "dparser" (die Grammatik in diesem
+    Modul) oder "fast" (der handgeschriebene Parser aus fastparser.py, der
+    dieselben Knoten liefert, aber keine Tabellen braucht).
+    """
+    global _parser, _parser_name
+    if not name in PARSERS:
+        raise ValueError("unknown parser: %s" % (name))
+    if name != _parser_name:
+        _parser_name = name
+        _parser = None
+
+def get_parser():
+    """
+    Liefert den geteilten Parser des Moduls, der fuer beliebig viele
+    Programme wiederverwendet wird.
+    """
+    global _parser
+    if _parser is None:
+        if _parser_name == "fast":
+            _parser = FastParser(KEYWORDS)
+        else:
+            _parser = make_parser()
+    return _parser
+
+def warm_up(name=None):
+    """
+    Legt den geteilten Parser (und falls noetig die Tabellen) sofort an,
+    damit der erste parse()-Aufruf nicht dafuer bezahlt. Gedacht fuer
+    langlebige Prozesse; ``name`` waehlt vorher den Parser (use_parser).
+    """
+    if name is not None:
+        use_parser(name)
+    return get_parser()
+
+def parse(program, parser=None):
+    if parser is None:
+        parser = get_parser()
+    if isinstance(parser, FastParser):
+        return Module(parser.parse(program), program)
     # ohne die ambiguity function gibt es einen segfault
-    return Module(parser.parse(program, ambiguity_fn=lambda a: None).structure) 
+    return Module(parser.parse(program, ambiguity_fn=lambda a: None).structure,
+                  program)
+
+def location(this):
+    """
+    Die Position des dparser-Knotens ``this`` als nodes.Location. Die
+    Knoten behalten nur diese, nicht ``this`` selbst, das den ganzen
+    Parsebaum am Leben hielte.
+    """
+    loc = this.start_loc
+    try:
+        return nod.Location(loc.line, loc.col)
+    except AttributeError:
+        # manche dparser-Builds reichen Attribute nicht an das SWIG-Objekt
+        # weiter
+        return nod.Location(loc.this.line, loc.this.col)
 
 def d_program(t, nodes, this):
     ''' program: statement* '''
@@ -33,12 +168,17 @@ def d_program(t, nodes, this):
 def d_statement(t, nodes, this):
     ''' statement: simple_statement
                  | function_decl
+                 | import_stmt
     '''
     return t[0]
 
+def d_import_stmt(t, nodes, this):
+    ''' import_stmt: 'import' ident '''
+    return nod.ImportStatement(t[1], location(this))
+
 def d_function_decl(t, nodes, this):
     ''' function_decl: 'def' ident param_body ":\n" simple_statement* "end" '''
-    return nod.FunctionDecl(t[1], t[2], t[4], this)
+    return nod.FunctionDecl(t[1], t[2], t[4], location(this))
 
 def d_param_body(t, nodes, this):
     """ param_body: '(' parameters? ')' """
@@ -63,19 +203,19 @@ def d_simple_statement(t, nodes, this):
 
 def d_returnstmt(t, nodes, this):
     ''' returnstmt: 'return' expression '''
-    return nod.ReturnStatement(t[1], this)
+    return nod.ReturnStatement(t[1], location(this))
 
 def d_printstmt(t, nodes, this):
     ''' printstmt: 'print' expression '''
-    return nod.PrintStatement(t[1], this)
+    return nod.PrintStatement(t[1], location(this))
 
 def d_ifstmt(t, nodes, this):
     ''' ifstmt: "if" expression ":\n" simple_statement* "end" '''
-    return nod.IfStatement(t[1], t[3], this)
+    return nod.IfStatement(t[1], t[3], location(this))
 
 def d_whilestmt(t, nodes, this):
     ''' whilestmt: "while" expression ":\n" simple_statement* "end" '''
-    return nod.WhileStatement(t[1], t[3], this)
+    return nod.WhileStatement(t[1], t[3], location(this))
 
 def d_expression(t, nodes, this):
     ''' expression: 
@@ -89,13 +229,13 @@ def d_declaration(t, nodes, this):
 
 def d_vardecl(t, nodes, this):
     ''' vardecl: ident '=' expression '''
-    return nod.VarDecl(t[0], t[2], this)
+    return nod.VarDecl(t[0], t[2], location(this))
 
 def d_mathexpr(t, nodes, this):
     ''' mathexpr: term
                 | expression addop term '''
     if len(t) == 3:
-        return nod.BinaryOp(t[0], t[1], t[2], this)
+        return nod.BinaryOp(t[0], t[1], t[2], location(this))
     return t[0]
 
 def d_term(t, nodes, this):
@@ -104,7 +244,7 @@ def d_term(t, nodes, this):
             | term cmpop atom ''' # comparison
 
     if len(t) == 3:
-        return nod.BinaryOp(t[0], t[1], t[2], this)
+        return nod.BinaryOp(t[0], t[1], t[2], location(this))
     return t[0]
 
 def d_atom(t, nodes, this):
@@ -121,7 +261,7 @@ def d_atom(t, nodes, this):
 
 def d_function_call(t, nodes, this):
     ''' function_call: ident call_body '''
-    return nod.FunctionCall(t[0], t[1], this)
+    return nod.FunctionCall(t[0], t[1], location(this))
 
 def d_call_body(t, nodes, this):
     """ call_body: '(' arguments? ')' """
@@ -136,11 +276,11 @@ def d_arguments(t, nodes, this):
 
 def d_number(t, nodes, this):
     ''' number: "[0-9]+" '''
-    return nod.Integer(int(t[0]), this)
+    return nod.Integer(int(t[0]), location(this))
 
 def d_boolean(t, nodes, this):
     ''' boolean: "True" | "False" '''
-    return nod.Boolean(t[0], this)
+    return nod.Boolean(t[0], location(this))
 
 def d_addop(t, nodes, this):
     ''' addop: '+' | '-' '''
@@ -159,7 +299,7 @@ def d_ident(t, nodes, this):
     if t[0] in KEYWORDS:
         msg = "Invalid use of reserved keyword: %s" % (this.buf)
         raise errors.KeywordException(msg)
-    return nod.Identifier(t[0], this)
+    return nod.Identifier(t[0], None)
 
 
 
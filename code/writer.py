@@ -2,56 +2,119 @@
 
 import cStringIO
 from utils import newline
+from opcodes import opmap, argcount, hasjump
 import sys
+import errors
 #from compiler import Marker, Label
 import compiler
 class Writer(object):
 
+    """
+    Buffer des Compilers. Opcodes stehen als Namen darin, Operanden als
+    ihre Werte (int, bool) und Sprungziele als Marker; dazwischen liegen
+    Labels und SourceLine-Eintraege, die keinen Platz im Code belegen.
+    """
+
     def __init__(self):
         self.buf = []
+        self.offsets = {} # label -> instruktions-index, nach assemble()
+        self.lines = {} # instruktions-index -> quellzeile, nach assemble()
+        self.last_line = None
 
     def append(self, node):
-        if isinstance(node, Writer):
-            for line in node.buf:
-                self.buf.append(line)
-        elif isinstance(node, compiler.Marker):
-            self.buf.append(node) 
-        elif isinstance(node, compiler.Label):
-            self.buf.append(node)
+        kind = type(node)
+        if kind is Writer:
+            self.buf.extend(node.buf)
+        elif kind is compiler.SourceLine:
+            if node.line != self.last_line:
+                self.buf.append(node)
+                self.last_line = node.line
         else:
-            self.buf.append(newline(str(node)))
-  
-    def eval_offsets(self):
-        repeat = True
+            self.buf.append(node)
+
+    def assemble(self, base=0, labels=None, external=None):
+        """
+        Fasst Opcodes und Operanden zu Instruktionen (opcode, operand)
+        zusammen und merkt sich die Indizes der Labels; Sprungziele werden
+        erst am Ende eingesetzt, Vorwaertsreferenzen sind dadurch kein
+        Problem.
+
+        Der Code beginnt bei Index ``base``; Marker auf Labels, die nicht
+        im Buffer stehen, werden ueber ``labels`` (label -> index)
+        aufgeloest. Danach enthalten self.offsets die Indizes der Labels
+        und self.lines die Quellzeilen aus den SourceLine-Eintraegen.
+
+        Ist ``external`` ein dict, bleiben Sprungziele, die sich so nicht
+        aufloesen lassen, offen (Operand None) und werden dort als
+        position -> label eingetragen, statt einen Fehler auszuloesen.
+        """
+        labels = labels or {}
         offsets = {}
-        tmp_buf = self.buf
-        while repeat:
-            unresolved_markers = False
-            unresolved_addresses = False
-            for line_cnt, elem in enumerate(tmp_buf):
-                if isinstance(elem, compiler.Label):
-                    offsets[elem.label] = line_cnt
-                    self.buf.remove(elem)
-                    unresolved_labels = True
-                elif isinstance(elem, compiler.Marker):
-                    if not elem.label in offsets:
-                        # print "Found an unresolved marker"
-                        unresolved_markers = True
-                    else:
-                        offset = offsets[elem.label]
-                        self.buf[self.buf.index(elem)] = newline(offset)
-            
-            repeat = unresolved_markers or unresolved_addresses
-            tmp_buf = self.buf
-
-    def write(self, filename):
-        self.eval_offsets()
-        with open(filename, "wb") as f:
-            for line in self.buf:
-                f.write(str(line))
+        lines = {}
+        code = []
+        jumps = [] # (position in code, label)
+        Label = compiler.Label
+        SourceLine = compiler.SourceLine
+        buf = self.buf
+        end = len(buf)
+        i = 0
+        while i < end:
+            elem = buf[i]
+            kind = type(elem)
+            if kind is Label:
+                if elem.label in offsets:
+                    msg = "Redefinition of label %s" % (elem.label)
+                    raise errors.LabelException(msg)
+                offsets[elem.label] = base + len(code)
+            elif kind is SourceLine:
+                lines[base + len(code)] = elem.line
+            else:
+                op = opmap.get(elem)
+                if op is None:
+                    msg = "Index: %s - Invalid Opcode: %s" % (str(i), elem)
+                    raise errors.InvalidOpcodeException(msg)
+                nargs = argcount[op]
+                if nargs == 0:
+                    arg = None
+                elif op in hasjump:
+                    jumps.append((len(code), buf[i + 1].label))
+                    arg = None
+                elif nargs == 1:
+                    arg = buf[i + 1]
+                else:
+                    arg = tuple(buf[i + 1:i + 1 + nargs])
+                code.append((op, arg))
+                i += nargs
+            i += 1
+
+        for pos, label in jumps:
+            target = offsets.get(label)
+            if target is None:
+                target = labels.get(label)
+                if target is None and external is not None:
+                    external[pos] = label
+                    continue
+                elif target is None:
+                    msg = "Undefined label %s" % (label)
+                    raise errors.LabelException(msg)
+            code[pos] = (code[pos][0], target)
+        self.offsets = offsets
+        self.lines = lines
+        return code
 
     def __repr__(self):
-        return "".join(self.buf)
+        """
+        Lesbare Form des noch nicht assemblierten Buffers, zum Debuggen.
+        """
+        out = []
+        for elem in self.buf:
+            if isinstance(elem, compiler.Label):
+                out.append(newline("%s:" % (elem.label)))
+            elif isinstance(elem, compiler.Marker):
+                out.append(newline(elem.label))
+            elif not isinstance(elem, compiler.SourceLine):
+                out.append(newline(elem))
+        return "".join(out)
     
     def get_linecount(self):
         return len(self.buf)
@@ -1,34 +1,352 @@
-from code.symbol import parse
-from code.compiler import Compiler
+from code.symbol import parse, use_parser, warm_up, PARSERS
+from code.compiler import Compiler, DEFAULT_OPT_LEVEL, FILENAME
 from code.interpreter import Interpreter
+from code.jit import JIT, DEFAULT_THRESHOLD
+from code.nodes import ImportStatement
+from code.regcompiler import RegisterCompiler
+from code.regvm import RegisterVM
+from code.runtime import Runtime
+from code.stream import StreamExecutor
+from code import bytecode, incremental, linker, profiler
+from code.output import OutputSink, DEFAULT_BUFFER_SIZE, POLICIES
+from cStringIO import StringIO
+from itertools import izip
+import argparse
+import multiprocessing
+import os
 import sys
+import time
 
-def exec_file(fname):
+def exec_file(fname, verbose=False, disassemble=None, output=None,
+              **options):
+    """
+    Fuehrt ``fname`` aus. Das CodeObject wird neben dem Skript als .payc
+    abgelegt; solange sich die Quelle nicht aendert, entfallen bei
+    spaeteren Laeufen Parsen und Uebersetzen. Hat sie sich geaendert,
+    werden nur die geaenderten Funktionen neu uebersetzt, die uebrigen
+    kommen aus der .payb-Datei (siehe code.incremental). Importierte
+    Module liegen uebersetzt als .payo neben ihrer Quelle (siehe
+    code.linker), ihre Digests gehen in den der .payc-Datei ein. Mit
+    ``disassemble`` wird die textuelle Form in diese Datei geschrieben.
+    PRINT schreibt nach ``output`` (eine code.output.OutputSink).
+
+    ``options`` werden an den Compiler weitergereicht.
+    """
     with open(fname, "rb") as f:
         data = f.read()
-        evaluate(data)       
+    loader = _loader(fname, options)
+    digest = bytecode.source_digest(data, *(sorted(options.items()) +
+                                            loader.digests(data)))
+    cache = bytecode.cache_path(fname)
+    code = bytecode.load(cache, digest)
+    if code is None:
+        code = _compile(data, verbose, incremental.cache_path(fname),
+                        loader, **options)
+        try:
+            bytecode.dump(code, digest, cache)
+        except (IOError, OSError):
+            pass # kein Cache, z.B. in schreibgeschuetzten Verzeichnissen
+    if verbose and loader.libraries:
+        sys.stderr.write("linker: %d modules, %d compiled\n"
+                         % (len(loader.libraries), loader.compiled))
+    if disassemble:
+        code.write(disassemble)
+    interpreter = Interpreter(code, output=output)
+    try:
+        interpreter.run()
+    finally:
+        if verbose:
+            _report_memo(interpreter)
+
+def _loader(fname, options):
+    """
+    Laedt die Module, die ``fname`` importiert: zuerst aus dem
+    Verzeichnis des Skripts, dann aus $PAYNE_PATH.
+    """
+    return linker.Loader([os.path.dirname(os.path.abspath(fname))],
+                         **options)
+
+def _report_memo(interpreter):
+    for name, (hits, misses, size) in sorted(
+                                        interpreter.memo_stats().items()):
+        sys.stderr.write("memo %s: %d hits, %d misses, %d entries\n"
+                         % (name, hits, misses, size))
         
-def evaluate(s):
-    code = _compile(s)
-    interpreter = Interpreter(code)
-    interpreter.run()
-
-def _compile(s):
-    module = parse(s)
-    c = Compiler(module)
-    code = c.compile().splitlines()
+def register_file(fname, disassemble=None, opt_level=DEFAULT_OPT_LEVEL,
+                  output=None, **options):
+    """
+    Fuehrt ``fname`` mit der Register-Maschine aus (siehe code.regvm).
+    Der Code wird jedes Mal neu uebersetzt, es gibt keinen .payc-Cache;
+    ausser der Optimierungsstufe werden die Optionen ignoriert.
+
+    Importierte Module liegen nur als Stack-Code vor (siehe code.linker);
+    importiert ``fname`` etwas, laeuft es daher mit exec_file auf der
+    Stack-Maschine.
+    """
+    with open(fname, "rb") as f:
+        module = parse(f.read())
+    if any(isinstance(node, ImportStatement) for node in module.ast):
+        return exec_file(fname, disassemble=disassemble, output=output,
+                         opt_level=opt_level, **options)
+    code = RegisterCompiler(module, opt_level).compile(disassemble)
+    RegisterVM(code, output).run()
+
+def jit_file(fname, verbose=False, threshold=DEFAULT_THRESHOLD, output=None,
+             **options):
+    """
+    Fuehrt ``fname`` gestuft aus (siehe code.jit): heisse Funktionen
+    werden nach ``threshold`` Aufrufen nach Python uebersetzt. Dafuer wird
+    der AST gebraucht, der .payc-Cache wird also nicht benutzt.
+    """
+    with open(fname, "rb") as f:
+        module = parse(f.read())
+    module.loader = _loader(fname, options)
+    code = Compiler(module, tiered=True, **options).compile()
+    jit = JIT(module, code, threshold)
+    interpreter = Interpreter(code, jit=jit, output=output)
+    try:
+        interpreter.run()
+    finally:
+        if verbose:
+            _report_memo(interpreter)
+            for name in sorted(jit.native):
+                sys.stderr.write("jit: compiled %s\n" % (name))
+            for name in jit.fallbacks:
+                sys.stderr.write("jit: %s fell back to the interpreter\n"
+                                 % (name))
+
+def stream_file(fname, output=None, **options):
+    """
+    Fuehrt ``fname`` im Streaming-Modus aus (siehe code.stream): die Datei
+    wird stueckweise gelesen, uebersetzt und ausgefuehrt.
+    """
+    with open(fname, "rb") as f:
+        StreamExecutor(loader=_loader(fname, options), output=output,
+                       **options).run(f)
+
+def profile_file(fname, report=sys.stderr, collapsed=None, output=None,
+                 **options):
+    """
+    Fuehrt ``fname`` mit dem Profiler aus. Der Code wird dafuer immer neu
+    uebersetzt, da die .payc-Datei keine Zeilentabelle enthaelt. Der
+    Bericht geht nach ``report``, mit ``collapsed`` werden zusaetzlich
+    die Stacks fuer einen Flamegraph geschrieben.
+    """
+    with open(fname, "rb") as f:
+        module = parse(f.read())
+    module.loader = _loader(fname, options)
+    code = Compiler(module, **options).compile()
+    prof = profiler.Profile.from_code(code)
+    interpreter = Interpreter(code, profile=prof, output=output)
+    try:
+        interpreter.run()
+    finally:
+        prof.report(report)
+        if collapsed:
+            prof.write_collapsed(collapsed)
+
+def evaluate(s, **options):
+    Runtime(**options).run(s)
+
+def _compile(s, verbose=False, function_cache=None, loader=None, **options):
+    """
+    Uebersetzt ``s``. Mit ``function_cache`` (Pfad einer .payb-Datei)
+    werden unveraenderte Funktionen von dort uebernommen, ``loader``
+    laedt importierte Module.
+    """
+    if function_cache is None:
+        module = parse(s)
+        module.loader = loader
+        c = Compiler(module, **options)
+        code = c.compile()
+    else:
+        cache = incremental.BlockCache.load(function_cache)
+        c = incremental.IncrementalCompiler(cache, loader=loader, **options)
+        code = c.compile(s)
+        try:
+            c.cache.save(function_cache)
+        except (IOError, OSError):
+            pass
+        if verbose:
+            sys.stderr.write("incremental: reused %d segments, compiled "
+                             "%d\n" % (c.reused, c.compiled))
+    if verbose:
+        sys.stderr.write("peephole: removed %d instructions\n" 
+                         % (c.removed_instructions))
     return code
 
+def run_batch(files, jobs, verbose=False, stream=False, backend="stack",
+              parser=PARSERS[0], sink=(), **options):
+    """
+    Fuehrt ``files`` in einem Pool aus ``jobs`` Prozessen aus. Jeder
+    Worker legt den Parser ``parser`` beim Start an (symbol.warm_up);
+    die Ausgaben der Skripte werden gesammelt und in der Reihenfolge von
+    ``files`` ausgegeben, gefolgt von einer Zusammenfassung. ``sink``
+    sind die Argumente (buffer_size, policy) fuer die OutputSink der
+    Skripte. Liefert die Anzahl fehlgeschlagener Skripte.
+    """
+    start = time.time()
+    summary = []
+    pool = multiprocessing.Pool(jobs, warm_up, (parser,))
+    try:
+        results = pool.imap(_run_captured,
+                            [(f, verbose, stream, backend, sink, options)
+                             for f in files])
+        for fname, (output, ok, elapsed) in izip(files, results):
+            print "-- EXEC %s --" %(fname)
+            sys.stdout.write(output)
+            print ""
+            summary.append((fname, ok, elapsed))
+    finally:
+        pool.close()
+        pool.join()
+
+    failed = len([ok for _, ok, _ in summary if not ok])
+    print "-- SUMMARY --"
+    for fname, ok, elapsed in summary:
+        print "%-6s %8.3fs  %s" % ("ok" if ok else "FAILED", elapsed, fname)
+    print "%d scripts, %d passed, %d failed in %.3fs (%d jobs)" % (
+        len(summary), len(summary) - failed, failed, time.time() - start,
+        jobs)
+    return failed
+
+def _run_captured(job):
+    """
+    Laeuft im Worker: fuehrt ein Skript aus und liefert seine Ausgabe, ob
+    es ohne Ausnahme durchlief, und die Laufzeit. Ausnahmen werden wie im
+    seriellen Modus in die Ausgabe geschrieben.
+    """
+    fname, verbose, stream, backend, sink, options = job
+    out = StringIO()
+    output = OutputSink(out, *sink)
+    stdout = sys.stdout
+    sys.stdout = out
+    start = time.time()
+    ok = True
+    try:
+        try:
+            if stream:
+                stream_file(fname, output, **options)
+            elif backend == "register":
+                register_file(fname, output=output, **options)
+            else:
+                exec_file(fname, verbose, output=output, **options)
+        except Exception, e:
+            print type(e)
+            print e
+            ok = False
+    finally:
+        sys.stdout = stdout
+    return out.getvalue(), ok, time.time() - start
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run Payne scripts.")
+    parser.add_argument("files", nargs="*", metavar="FILE")
+    parser.add_argument("-O", dest="opt_level", type=int, 
+                        default=DEFAULT_OPT_LEVEL, metavar="LEVEL",
+                        help="optimization level (0 disables all "
+                             "optimizations, default: %(default)s)")
+    parser.add_argument("--no-superinstructions", dest="superinstructions",
+                        action="store_false",
+                        help="don't emit fused opcodes (for debugging)")
+    parser.add_argument("--backend", choices=("stack", "register"),
+                        default="stack",
+                        help="virtual machine to run the scripts on "
+                             "(default: %(default)s)")
+    parser.add_argument("--parser", choices=PARSERS, default=PARSERS[0],
+                        help="parser for the scripts; 'fast' is a "
+                             "hand-written parser that builds the same "
+                             "AST without dparser (default: %(default)s)")
+    parser.add_argument("--jit", action="store_true",
+                        help="compile hot functions to Python functions")
+    parser.add_argument("--jit-threshold", type=int,
+                        default=DEFAULT_THRESHOLD, metavar="N",
+                        help="with --jit, calls before a function is "
+                             "compiled (default: %(default)s)")
+    parser.add_argument("--memoize", action="store_true",
+                        help="cache the results of pure functions (no "
+                             "print, no global variables)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="report compiler and memoization statistics "
+                             "on stderr")
+    parser.add_argument("--profile", action="store_true",
+                        help="print per-opcode execution counts and times "
+                             "on stderr")
+    parser.add_argument("--profile-collapsed", metavar="FILE",
+                        help="with --profile, write collapsed stacks for "
+                             "flamegraph.pl to FILE")
+    parser.add_argument("-d", "--disassemble", nargs="?", const=FILENAME,
+                        metavar="FILE",
+                        help="write the compiled code in text form to FILE "
+                             "(default: %(const)s)")
+    parser.add_argument("--stream", action="store_true",
+                        help="compile and run the scripts statement by "
+                             "statement with bounded memory (no .payc "
+                             "cache)")
+    parser.add_argument("--output-buffer", type=int,
+                        default=DEFAULT_BUFFER_SIZE, metavar="BYTES",
+                        help="buffer the output of print up to BYTES "
+                             "(default: %(default)s)")
+    parser.add_argument("--flush", choices=POLICIES, default=POLICIES[0],
+                        help="when to write buffered output: when the "
+                             "buffer is 'full', after each 'line', at "
+                             "'exit', or 'auto' (line for terminals, "
+                             "otherwise full; default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="run the scripts in N worker processes and "
+                             "print a summary")
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.output_buffer < 1:
+        parser.error("--output-buffer must be at least 1")
+    if args.jobs and args.profile:
+        parser.error("--profile can't be combined with --jobs")
+    if args.stream and args.profile:
+        parser.error("--profile can't be combined with --stream")
+    if args.disassemble and (args.jobs or args.stream or args.profile):
+        parser.error("--disassemble only works for plain runs")
+    if args.backend == "register" and (args.stream or args.profile or
+                                       args.memoize):
+        parser.error("--stream, --profile and --memoize need the stack "
+                     "backend")
+    if args.jit and (args.jobs or args.stream or args.profile or
+                     args.disassemble or args.backend != "stack"):
+        parser.error("--jit only works for plain runs on the stack backend")
+    return args
+
 def main():
-    for f in sys.argv[1:]:
+    args = _parse_args(sys.argv[1:])
+    options = dict(opt_level=args.opt_level,
+                   superinstructions=args.superinstructions,
+                   memoize=args.memoize)
+    use_parser(args.parser)
+    if args.jobs:
+        failed = run_batch(args.files, args.jobs, args.verbose, args.stream,
+                           args.backend, args.parser,
+                           (args.output_buffer, args.flush), **options)
+        return 1 if failed else 0
+    output = OutputSink(None, args.output_buffer, args.flush)
+    for f in args.files:
         print "-- EXEC %s --" %(f)
         try:
-            exec_file(f)
+            if args.profile:
+                profile_file(f, collapsed=args.profile_collapsed,
+                             output=output, **options)
+            elif args.stream:
+                stream_file(f, output, **options)
+            elif args.jit:
+                jit_file(f, args.verbose, args.jit_threshold, output,
+                         **options)
+            elif args.backend == "register":
+                register_file(f, args.disassemble, output=output, **options)
+            else:
+                exec_file(f, args.verbose, args.disassemble, output,
+                          **options)
         except Exception, e:
             print type(e)
             print e
         print ""
         
 if __name__ == '__main__':
-    main()
-
+    sys.exit(main())